@@ -46,6 +46,13 @@ class local(object):
     def __repr__(self):
         return "<coroutine.local at 0x%X %r>" % (id(self), self.__dict__['__objs'])
 
+def _skip_frame(exc_info):
+    """Drop the first frame (the one that caught the exception) from the
+    traceback in `exc_info`. A frame that keeps the traceback in it's locals
+    (eg: in a attribute of `self`) would make a reference cycle."""
+    exc_type, exc_value, tb = exc_info
+    return exc_type, exc_value, tb.tb_next or tb
+
 class CoroutineException(Exception):
     """This is used intenally to carry exception state in the poller and
     scheduler."""
@@ -90,19 +97,24 @@ class CoroutineInstance(events.Operation):
         self.coro = coro
         self.caller = None
         self.prio = priority.FIRST
-        self.waiters = []
+        self.waiters = None
         self.exception = None
 
     def add_waiter(self, coro, op=None):
         assert self.state < self.STATE_COMPLETED
+        # the waiters list is allocated lazily, most coroutines are never
+        #joined
+        if self.waiters is None:
+            self.waiters = []
         assert coro not in self.waiters
         self.waiters.append((op or self, coro))
 
     def remove_waiter(self, coro, op=None):
-        try:
-            self.waiters.remove((op or self, coro))
-        except ValueError:
-            pass
+        if self.waiters:
+            try:
+                self.waiters.remove((op or self, coro))
+            except ValueError:
+                pass
 
     def _valid_gen(self, coro):
         if isinstance(coro, types.GeneratorType):
@@ -151,7 +163,7 @@ class CoroutineInstance(events.Operation):
                     else:
                         sched.active.extend(self.waiters)
 
-                    self.waiters = []
+                    self.waiters = None
 
                     return lucky_waiter
 
@@ -166,6 +178,11 @@ class CoroutineInstance(events.Operation):
           doesn't return a generator, set STATE_COMPLETED and set the result
           to whatever the function returned.
 
+          If there is a op (the coroutine was parked, see
+          :class:`cogen.core.sockets.Park`) it's result (or the
+          CoroutineException) is appended to the arguments and the first
+          step is run right away.
+
           * if StopIteration is raised, set STATE_COMPLETED and return self.
 
           * if any other exception is raised, set STATE_FAILED, handle error
@@ -211,17 +228,30 @@ class CoroutineInstance(events.Operation):
                 if self.debug:
                     traceback.print_stack(self.coro.gi_frame)
                 if isinstance(op, CoroutineException):
-                    rop = self.coro.throw(*op.args)
+                    args = op.args
+                    # the traceback's frames can reference the exception
+                    # (eg: in the locals of the scheduler's frames) - drop it
+                    # so the exception and the frames don't make a cycle
+                    op.args = args[:2]
+                    rop = self.coro.throw(*args)
                 else:
                     rop = self.coro.send(op and op.finalize(sched))
             elif self.state == self.STATE_NEED_INIT:
-                assert op is None
+                if op is not None:
+                    if isinstance(op, CoroutineException):
+                        # drop the traceback, like for the throw above
+                        op.args = op.args[:2]
+                        self.f_args += (op,)
+                    else:
+                        self.f_args += (op.finalize(sched),)
                 self.coro = self.coro(*self.f_args, **self.f_kws)
                 del self.f_args
                 del self.f_kws
                 if self._valid_gen(self.coro):
                     self.state = self.STATE_RUNNING
                     rop = None
+                    if op is not None:
+                        rop = self.coro.send(None)
                 else:
                     self.state = self.STATE_COMPLETED
                     self.result = self.coro
@@ -241,7 +271,7 @@ class CoroutineInstance(events.Operation):
         except:
             self.state = self.STATE_FAILED
             self.result = None
-            self.exception = sys.exc_info()
+            self.exception = _skip_frame(sys.exc_info())
             if hasattr(self.coro, 'close'):
                 self.coro.close()
             if not self.caller:
@@ -3,10 +3,12 @@ Base events (coroutine operations) and coroutine exceptions.
 """
 __all__ = [
     'OperationTimeout', 'WaitForSignal', 'Signal', 'AddCoro',
-    'Join', 'Sleep', 'Operation', 'TimedOperation'
+    'Join', 'Sleep', 'Operation', 'TimedOperation', 'WaitList', 'Timer'
 ]
+import collections
 import datetime
 import heapq
+import traceback
 
 from util import priority
 #~ from sockets import SocketError as ConnectionError
@@ -15,6 +17,8 @@ getnow = datetime.datetime.now
 
 RUNNING, FINALIZED, ERRORED = range(3)
 
+_EPOCH = datetime.datetime(1970, 1, 1)
+
 class OperationTimeout(Exception):
     """Raised when the timeout for a operation expires. The exception
     message will be the operation"""
@@ -90,16 +94,47 @@ def heapremove(heap,item):
     """
     Removes item from heap.
     (This function is missing from the standard heapq package.)
+    Does nothing if the item isn't in the heap (eg: it was already popped by
+    the timeout handling).
     """
-    i=heap.index(item)
+    try:
+        i=heap.index(item)
+    except ValueError:
+        return
+    if heap[i] is not item:
+        # index matched another item with the same timeout
+        for i in xrange(i+1, len(heap)):
+            if heap[i] is item:
+                break
+        else:
+            return
     lastelt=heap.pop()
-    if item==lastelt:
+    if item is lastelt:
         return
     heap[i]=lastelt
     heapq._siftup(heap,i)
     if i:
         heapq._siftdown(heap,0,i)
 
+def coalesce(timeout, slack):
+    """
+    Rounds up the `timeout` datetime to a multiple of `slack` (a number of
+    seconds or a timedelta). Timeouts rounded with the same slack that fall in
+    the same bucket are equal and the scheduler handles them in one go.
+    """
+    if isinstance(slack, datetime.timedelta):
+        slack = (slack.days*86400 + slack.seconds)*1000000 + slack.microseconds
+    else:
+        slack = int(slack*1000000)
+    if slack <= 0:
+        return timeout
+    delta = timeout - _EPOCH
+    remainder = ((delta.days*86400 + delta.seconds)*1000000 +
+                                            delta.microseconds) % slack
+    if remainder:
+        timeout += datetime.timedelta(microseconds=slack-remainder)
+    return timeout
+
 class TimedOperation(Operation):
     """Operations that have a timeout derive from this.
 
@@ -110,6 +145,7 @@ class TimedOperation(Operation):
         yield TimedOperation(
             timeout=None,
             weak_timeout=True,
+            slack=None,
             prio=priority.DEFAULT
         )
 
@@ -117,11 +153,15 @@ class TimedOperation(Operation):
       if it's a datetime the timeout will occur on that moment
     * weak_timeout - strong timeouts just happen when specified, weak_timeouts
       get delayed if some action happens (eg: new but not enough data recieved)
+    * slack - a float/int (number of seconds) or a timedelta, the timeout is
+      delayed till the next multiple of this value so it can be handled
+      together with other timeouts. If None the scheduler's timer_slack is used.
 
     See: :class:`Operation`.
     Note: you don't really use this, this is for subclassing for other operations.
     """
-    __slots__ = ('timeout', 'coro', 'weak_timeout', 'delta', 'last_checkpoint')
+    __slots__ = ('timeout', 'coro', 'weak_timeout', 'delta', 'last_checkpoint',
+                 'slack')
 
     def set_timeout(self, val):
         if val and val != -1 and not isinstance(val, datetime.datetime):
@@ -136,10 +176,11 @@ class TimedOperation(Operation):
 
 
 
-    def __init__(self, timeout=None, weak_timeout=True, **kws):
+    def __init__(self, timeout=None, weak_timeout=True, slack=None, **kws):
         super(TimedOperation, self).__init__(**kws)
         self.set_timeout(timeout)
         self.weak_timeout = weak_timeout
+        self.slack = slack
 
     def process(self, sched, coro):
         """Add the timeout in the scheduler, check for defaults."""
@@ -149,6 +190,10 @@ class TimedOperation(Operation):
             self.set_timeout(sched.default_timeout)
         if self.timeout and self.timeout != -1:
             self.coro = coro
+            if self.slack is None:
+                self.slack = sched.timer_slack
+            if self.slack:
+                self.timeout = coalesce(self.timeout, self.slack)
 
             if self.weak_timeout:
                 self.last_checkpoint = getnow()
@@ -169,10 +214,62 @@ class TimedOperation(Operation):
     def finalize(self, sched):
         if self.timeout and self.timeout != -1:
             heapremove(sched.timeouts, self)
+        # the coro might hold this op (eg: in a local) - don't keep a cycle
+        self.coro = None
         return super(TimedOperation, self).finalize(sched)
     
-        
-        
+
+
+class WaitList(object):
+    """
+    The (op, coro) pairs waiting on a signal name, in arrival order.
+
+    Removing a op (eg: on timeout) is O(1): the op is dropped from the index
+    and it's pair is left in the queue as a stale entry. Stale entries are
+    skipped and compacted away when they outnumber the live ones.
+
+    Signal resumes all the waiters by splicing the queue in the scheduler's
+    active queue - the signaled value is kept here (the waiting ops get it on
+    finalize).
+    """
+    __slots__ = ('queue', 'index', 'value')
+
+    def __init__(self):
+        self.queue = collections.deque()
+        self.index = {}
+        self.value = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.pairs())
+
+    def append(self, op, coro):
+        pair = op, coro
+        self.index[op] = pair
+        self.queue.append(pair)
+
+    def remove(self, op):
+        """Remove the op, return True if it was waiting."""
+        if self.index.pop(op, None) is None:
+            return False
+        if len(self.queue) > 2 * len(self.index) + 16:
+            self.compact()
+        return True
+
+    def compact(self):
+        index = self.index
+        self.queue = collections.deque(
+            pair for pair in self.queue if index.get(pair[0]) is pair
+        )
+
+    def pairs(self):
+        """Returns the live (op, coro) pairs."""
+        if len(self.queue) != len(self.index):
+            self.compact()
+        return self.queue
+
 class WaitForSignal(TimedOperation):
     """The coroutine will resume when the same object is Signaled.
 
@@ -197,17 +294,18 @@ class WaitForSignal(TimedOperation):
     See: :class:`TimedOperation`.
     """
 
-    __slots__ = ('name', 'result')
+    __slots__ = ('name', 'result', 'waitlist')
 
     def __init__(self, name, **kws):
         super(WaitForSignal, self).__init__(**kws)
         self.name = name
+        self.waitlist = None
 
     def process(self, sched, coro):
         """Add the calling coro in a waiting for signal queue."""
         super(WaitForSignal, self).process(sched, coro)
-        waitlist = sched.sigwait[self.name]
-        waitlist.append((self, coro))
+        waitlist = self.waitlist = sched.sigwait[self.name]
+        waitlist.append(self, coro)
         if self.name in sched.signals:
             sig = sched.signals[self.name]
             if sig.recipients <= len(waitlist):
@@ -217,15 +315,21 @@ class WaitForSignal(TimedOperation):
 
     def finalize(self, sched):
         super(WaitForSignal, self).finalize(sched)
+        if self.waitlist is not None:
+            self.result = self.waitlist.value
+            self.waitlist = None
         return self.result
 
     def cleanup(self, sched, coro):
-        """Remove this coro from the waiting for signal queue."""
-        try:
-            sched.sigwait[self.name].remove((self, coro))
-        except ValueError:
-            pass
-        return True
+        """Remove this coro from the waiting for signal queue. If the coro
+        isn't waiting anymore (the signal was already sent) the timeout isn't
+        raised."""
+        waitlist = self.waitlist
+        if waitlist is not None and waitlist.remove(self):
+            self.waitlist = None
+            if not waitlist and sched.sigwait.get(self.name) is waitlist:
+                del sched.sigwait[self.name]
+            return True
 
     def __repr__(self):
         return "<%s at 0x%X name:%s timeout:%s prio:%s>" % (
@@ -274,26 +378,27 @@ class Signal(Operation):
         recipicient param add the calling coro in another queue to be activated
         later, otherwise activate the waiting coroutines."""
         super(Signal, self).process(sched, coro)
-        self.result = len(sched.sigwait[self.name])
+        waitlist = sched.sigwait.get(self.name)
+        self.result = len(waitlist) if waitlist else 0
         if self.result < self.recipients:
             sched.signals[self.name] = self
             self.coro = coro
             return
 
-        for waitop, waitcoro in sched.sigwait[self.name]:
-            waitop.result = self.value
-        if self.prio & priority.OP:
-            sched.active.extendleft(sched.sigwait[self.name])
-        else:
-            sched.active.extend(sched.sigwait[self.name])
+        if waitlist is not None:
+            del sched.sigwait[self.name]
+            waitlist.value = self.value
+            if self.prio & priority.OP:
+                sched.active.extendleft(waitlist.pairs())
+            else:
+                sched.active.extend(waitlist.pairs())
+            waitlist.index.clear()
 
         if self.prio & priority.CORO:
             sched.active.appendleft((None, coro))
         else:
             sched.active.append((None, coro))
 
-        del sched.sigwait[self.name]
-
 
 class AddCoro(Operation):
     """
@@ -404,10 +509,16 @@ class Sleep(TimedOperation):
         yield events.Sleep(timestamp=ts)
 
     * ts - a timestamp
+
+    .. sourcecode:: python
+
+        yield events.Sleep(time_object, slack=0.1)
+
+    * slack - see :class:`TimedOperation`
     """
     __slots__ = ()
-    def __init__(self, val):
-        super(Sleep, self).__init__(timeout=val)
+    def __init__(self, val, slack=None):
+        super(Sleep, self).__init__(timeout=val, slack=slack)
 
     def process(self, sched, coro):
         super(Sleep, self).process(sched, coro)
@@ -420,3 +531,81 @@ class Sleep(TimedOperation):
 
     def finalize(self, sched):
         pass
+
+
+class Timer(object):
+    """
+    A callback scheduled with :meth:`Scheduler.call_later`,
+    :meth:`Scheduler.call_at` or :meth:`Scheduler.call_every`.
+
+    The timer sits in the scheduler's timeouts heap (with the timed
+    operations) and the callback is called right from the scheduler's
+    timeout handling - there's no coroutine involved. Exceptions raised by
+    the callback are printed and the timer carries on.
+
+    * timeout - the datetime when the callback is called next
+    * interval - a timedelta for periodic timers, None otherwise
+
+    Call :meth:`cancel` to stop it.
+    """
+    __slots__ = ('timeout', 'callback', 'args', 'interval', 'slack', 'heap',
+                 'cancelled')
+
+    def __init__(self, timeout, callback, args=(), interval=None, slack=None):
+        self.timeout = timeout
+        self.callback = callback
+        self.args = args
+        self.interval = interval
+        self.slack = slack
+        self.heap = None
+        self.cancelled = False
+
+    def __cmp__(self, other):
+        return cmp(self.timeout, other.timeout)
+
+    def schedule(self, sched):
+        """Puts the timer in the scheduler's timeouts heap."""
+        if self.slack is None:
+            self.slack = sched.timer_slack
+        if self.slack:
+            self.timeout = coalesce(self.timeout, self.slack)
+        self.heap = sched.timeouts
+        heapq.heappush(self.heap, self)
+        return self
+
+    def cancel(self):
+        """Stops the timer. Returns False if it was already cancelled or it
+        was a one-shot timer that already ran."""
+        if self.cancelled or self.heap is None:
+            return False
+        self.cancelled = True
+        heapremove(self.heap, self)
+        self.heap = None
+        return True
+
+    def run(self, sched):
+        """Called by the scheduler when the timer expires (after it was
+        popped from the heap). A periodic timer is scheduled again before the
+        callback is called (so the callback can cancel it)."""
+        self.heap = None
+        if self.interval:
+            now = getnow()
+            self.timeout += self.interval
+            if self.timeout <= now:
+                # we're late, don't try to catch up
+                self.timeout = now + self.interval
+            self.schedule(sched)
+        try:
+            self.callback(*self.args)
+        except:
+            traceback.print_exc()
+
+    def __repr__(self):
+        return "<%s at 0x%X callback:%s timeout:%s interval:%s%s>" % (
+            self.__class__.__name__,
+            id(self),
+            self.callback,
+            self.timeout,
+            self.interval,
+            self.cancelled and ' cancelled' or ''
+        )
@@ -0,0 +1,282 @@
+"""
+Memoization for coroutines.
+
+:func:`cached` keeps the results of a coroutine function, by it's arguments,
+in a :class:`Cache`: a LRU of at most `maxsize` entries where every entry can
+expire after `ttl` seconds. Concurrent calls that miss the same key make a
+single call (with :class:`cogen.core.singleflight.SingleFlight`).
+
+Expiry is done with the scheduler's timers, lookups don't check it: the
+entries of the same ttl expire in the order they were added so there's a
+queue and a single :class:`cogen.core.events.Timer` (for the oldest entry)
+for every ttl. Entries can outlive their ttl by the scheduler's
+`timer_slack`. The evicted and the replaced entries are dropped from the
+queues when they get twice as long as `maxsize` and the timers are stopped
+when the cache gets empty, but the scheduler's `run` doesn't return while
+there are entries waiting to expire - :meth:`Cache.clear` the cache if it
+needs to.
+
+Negative results - the exceptions of the `negative_errors` types and the
+None results - are kept for `negative_ttl` seconds (0 - not kept, the
+exceptions are just raised then).
+
+The `hits`, `misses`, `evictions` (LRU), `expirations` and the size of the
+kept results (`bytes`, as `sizeof` tells) are counted in the cache's `stats`
+and, summed for all the caches, in the scheduler's `stats` (with a
+``cache_`` prefix).
+
+Usage:
+
+.. sourcecode:: python
+
+    @cached(maxsize=1000, ttl=60, negative_ttl=5, negative_errors=(KeyError,))
+    @coroutine
+    def get_user(user_id):
+        ...
+        raise StopIteration(user)
+
+    user = yield get_user(123)
+    get_user.invalidate(123)
+"""
+__all__ = ['Cache', 'cached']
+
+import collections
+import datetime
+import functools
+import sys
+
+import events
+from coroutines import coroutine
+from singleflight import SingleFlight, default_key
+
+getnow = events.getnow
+
+class CurrentScheduler(events.Operation):
+    "Returns the scheduler that runs the coroutine (right away)."
+    __slots__ = ()
+
+    def process(self, sched, coro):
+        super(CurrentScheduler, self).process(sched, coro)
+        return self, coro
+
+    def finalize(self, sched):
+        super(CurrentScheduler, self).finalize(sched)
+        return sched
+
+class Entry(object):
+    __slots__ = ('key', 'success', 'value', 'size', 'expires')
+
+    def __init__(self, key, success, value, size, expires):
+        self.key = key
+        self.success = success
+        self.value = value
+        self.size = size
+        self.expires = expires
+
+    def __repr__(self):
+        return "<%s@%X key:%r success:%s size:%s expires:%s>" % (
+            self.__class__.__name__,
+            id(self),
+            self.key,
+            self.success,
+            self.size,
+            self.expires
+        )
+
+class Cache(object):
+    """
+    Options:
+
+    * maxsize - the maximum number of entries
+    * ttl - seconds a result is kept (None - till it's evicted)
+    * negative_ttl - seconds a negative result is kept (0 - not kept)
+    * negative_errors - the exceptions that are negative results
+    * sizeof - a function that returns the size of a result (for the
+      `bytes` stat)
+
+    The cache is bound to the scheduler that made the first call, a call from
+    another scheduler clears it.
+    """
+    def __init__(self, maxsize=128, ttl=None, negative_ttl=0,
+                 negative_errors=(Exception,), sizeof=sys.getsizeof):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.negative_errors = negative_errors
+        self.sizeof = sizeof
+        self.entries = collections.OrderedDict()
+        # ttl: deque of entries in expiry order
+        self.queues = {}
+        # ttl: the timer for the head of the queue
+        self.timers = {}
+        self.sched = None
+        self.sched_stats = None
+        self.group = SingleFlight()
+        # bumped by invalidate and clear: a load that started before isn't
+        # stored
+        self.generation = 0
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'bytes': 0,
+        }
+
+    def __repr__(self):
+        return "<%s@%X entries:%s/%s bytes:%s>" % (
+            self.__class__.__name__,
+            id(self),
+            len(self.entries),
+            self.maxsize,
+            self.stats['bytes']
+        )
+
+    def count(self, name, value=1):
+        self.stats[name] += value
+        if self.sched_stats is not None:
+            self.sched_stats['cache_' + name] += value
+
+    def bind(self, sched):
+        "Uses the timers and the stats of `sched` from now on."
+        self.clear()
+        self.sched = sched
+        self.sched_stats = sched.stats
+        for name in self.stats:
+            sched.stats.setdefault('cache_' + name, 0)
+
+    @coroutine
+    def call(self, key, func, args=(), kwargs={}):
+        """Returns the kept result for `key` or the result of
+        ``func(*args, **kwargs)`` (a coroutine). A negative result that is
+        a exception is raised."""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.entries[key] = entry
+            self.count('hits')
+            if entry.success:
+                raise StopIteration(entry.value)
+            raise entry.value[0], entry.value[1]
+        sched = yield CurrentScheduler()
+        if sched is not self.sched:
+            self.bind(sched)
+        self.count('misses')
+        result = yield self.group.do(key, self.load, key, func, args, kwargs)
+        raise StopIteration(result)
+
+    @coroutine
+    def load(self, key, func, args, kwargs):
+        generation = self.generation
+        try:
+            result = yield func(*args, **kwargs)
+        except self.negative_errors:
+            if self.negative_ttl and generation == self.generation:
+                self.store(key, False, sys.exc_info()[:2], self.negative_ttl)
+            raise
+        if generation == self.generation:
+            if result is None and self.negative_ttl:
+                self.store(key, True, result, self.negative_ttl)
+            else:
+                self.store(key, True, result, self.ttl)
+        raise StopIteration(result)
+
+    def store(self, key, success, value, ttl):
+        if ttl:
+            expires = getnow() + datetime.timedelta(seconds=ttl)
+        else:
+            expires = None
+        entry = Entry(key, success, value, self.sizeof(value), expires)
+        entries = self.entries
+        old = entries.pop(key, None)
+        if old is not None:
+            self.discard(old)
+        entries[key] = entry
+        self.count('bytes', entry.size)
+        if expires is not None:
+            queue = self.queues.get(ttl)
+            if queue is None:
+                queue = self.queues[ttl] = collections.deque()
+            queue.append(entry)
+            if ttl not in self.timers:
+                self.timers[ttl] = self.sched.call_at(expires, self.expire, ttl)
+        while len(entries) > self.maxsize:
+            key, old = entries.popitem(last=False)
+            self.discard(old)
+            self.count('evictions')
+        if not entries:
+            self.stop_timers()
+        elif expires is not None and len(queue) > 2 * self.maxsize:
+            # drop the entries that were evicted or replaced
+            self.queues[ttl] = collections.deque(
+                entry for entry in queue if entries.get(entry.key) is entry)
+
+    def discard(self, entry):
+        "Called for a entry that was removed."
+        self.count('bytes', -entry.size)
+        # it might still be in a expiry queue
+        entry.value = None
+
+    def expire(self, ttl):
+        "The timer callback: drops the expired entries of `ttl`."
+        queue = self.queues[ttl]
+        entries = self.entries
+        now = getnow()
+        while queue and queue[0].expires <= now:
+            entry = queue.popleft()
+            if entries.get(entry.key) is entry:
+                del entries[entry.key]
+                self.discard(entry)
+                self.count('expirations')
+        if not entries:
+            self.stop_timers()
+        elif queue:
+            self.timers[ttl] = self.sched.call_at(queue[0].expires,
+                                                  self.expire, ttl)
+        else:
+            del self.timers[ttl]
+            del self.queues[ttl]
+
+    def invalidate(self, key):
+        """Drops the entry for `key` (if there's one). A load in progress
+        for `key` isn't kept and the next call doesn't wait for it."""
+        self.generation += 1
+        self.group.flights.pop(key, None)
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.discard(entry)
+            if not self.entries:
+                self.stop_timers()
+
+    def stop_timers(self):
+        "Cancels the expiry timers and drops the queues."
+        for timer in self.timers.itervalues():
+            timer.cancel()
+        self.timers.clear()
+        self.queues.clear()
+
+    def clear(self):
+        "Drops all the entries (and stops the expiry timers)."
+        self.generation += 1
+        self.group.flights.clear()
+        self.stop_timers()
+        for entry in self.entries.itervalues():
+            self.discard(entry)
+        self.entries.clear()
+
+def cached(maxsize=128, ttl=None, negative_ttl=0, negative_errors=(Exception,),
+           key=default_key, sizeof=sys.getsizeof):
+    """A decorator for coroutines: keeps the results in a :class:`Cache` (in
+    the wrapper's `cache` attribute), by `key` (a function of the call's
+    arguments, all the arguments by default). ``wrapper.invalidate(*args,
+    **kwargs)`` drops the result for those arguments."""
+    def decorator(func):
+        cache = Cache(maxsize, ttl, negative_ttl, negative_errors, sizeof)
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return cache.call(key(*args, **kwargs), func, args, kwargs)
+        def invalidate(*args, **kwargs):
+            cache.invalidate(key(*args, **kwargs))
+        wrapper.cache = cache
+        wrapper.invalidate = invalidate
+        return wrapper
+    return decorator
@@ -0,0 +1,162 @@
+"""
+ctypes bindings for the linux ``recvmmsg`` and ``sendmmsg`` calls: a batch of
+datagrams is received or sent with one system call.
+
+`available` is False if the calls can't be used (the datagram operations in
+:mod:`cogen.core.sockets` loop over ``recvfrom``/``sendto`` then).
+"""
+__all__ = ['available', 'recvmmsg', 'sendmmsg']
+
+import ctypes
+import ctypes.util
+import os
+import socket
+import struct
+import threading
+
+class iovec(ctypes.Structure):
+    _fields_ = [
+        ('iov_base', ctypes.c_void_p),
+        ('iov_len', ctypes.c_size_t),
+    ]
+
+class msghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(iovec)),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_hdr', msghdr),
+        ('msg_len', ctypes.c_uint),
+    ]
+
+try:
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _recvmmsg = libc.recvmmsg
+    _recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(mmsghdr), ctypes.c_uint,
+                          ctypes.c_int, ctypes.c_void_p]
+    _sendmmsg = libc.sendmmsg
+    _sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(mmsghdr), ctypes.c_uint,
+                          ctypes.c_int]
+    available = True
+except (OSError, AttributeError, TypeError):
+    available = False
+
+# sizeof(struct sockaddr_storage)
+NAMELEN = 128
+
+def decode_address(name, length):
+    "Returns the python address for a sockaddr (None if there isn't one)."
+    if not length:
+        return
+    family, = struct.unpack('H', name[:2])
+    if family == socket.AF_INET:
+        port, = struct.unpack('!H', name[2:4])
+        return socket.inet_ntop(socket.AF_INET, name[4:8]), port
+    elif family == socket.AF_INET6:
+        port, flowinfo = struct.unpack('!HI', name[2:8])
+        scope_id, = struct.unpack('I', name[24:28])
+        return (socket.inet_ntop(socket.AF_INET6, name[8:24]), port,
+                flowinfo, scope_id)
+    raise socket.error("Unsupported address family: %s" % family)
+
+def encode_address(address):
+    "Returns the sockaddr for a (numeric) python address."
+    if len(address) == 2:
+        host, port = address
+        return struct.pack('H', socket.AF_INET) + struct.pack('!H', port) + \
+               socket.inet_pton(socket.AF_INET, host) + '\0' * 8
+    host, port, flowinfo, scope_id = address
+    return struct.pack('H', socket.AF_INET6) + \
+           struct.pack('!HI', port, flowinfo) + \
+           socket.inet_pton(socket.AF_INET6, host) + \
+           struct.pack('I', scope_id)
+
+class RecvBuffers(object):
+    "Preallocated buffers and headers for receiving `count` datagrams."
+    def __init__(self, count, size):
+        self.count = count
+        self.size = size
+        self.data = ctypes.create_string_buffer(count * size)
+        self.names = ctypes.create_string_buffer(count * NAMELEN)
+        self.iovecs = (iovec * count)()
+        self.msgs = (mmsghdr * count)()
+        data = ctypes.addressof(self.data)
+        names = ctypes.addressof(self.names)
+        for i in xrange(count):
+            self.iovecs[i].iov_base = data + i * size
+            self.iovecs[i].iov_len = size
+            hdr = self.msgs[i].msg_hdr
+            hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+            hdr.msg_iovlen = 1
+            hdr.msg_name = names + i * NAMELEN
+
+_local = threading.local()
+
+def get_buffers(count, size):
+    "Returns the RecvBuffers for this thread."
+    cache = getattr(_local, 'buffers', None)
+    if cache is None:
+        cache = _local.buffers = {}
+    buffers = cache.get((count, size))
+    if buffers is None:
+        buffers = cache[count, size] = RecvBuffers(count, size)
+    return buffers
+
+def raise_errno():
+    err = ctypes.get_errno()
+    raise socket.error(err, os.strerror(err))
+
+def recvmmsg(fd, count, size):
+    """Receives up to `count` datagrams (of at most `size` bytes) from the
+    non-blocking socket `fd`. Returns a list of (data, address) tuples.
+    Raises socket.error (eg: EAGAIN if there isn't any datagram)."""
+    buffers = get_buffers(count, size)
+    msgs = buffers.msgs
+    for i in xrange(count):
+        msgs[i].msg_hdr.msg_namelen = NAMELEN
+    received = _recvmmsg(fd, msgs, count, 0, None)
+    if received < 0:
+        raise_errno()
+    data = ctypes.addressof(buffers.data)
+    names = ctypes.addressof(buffers.names)
+    return [
+        (ctypes.string_at(data + i * size, msgs[i].msg_len),
+         decode_address(ctypes.string_at(names + i * NAMELEN, NAMELEN),
+                        msgs[i].msg_hdr.msg_namelen))
+        for i in xrange(received)
+    ]
+
+def sendmmsg(fd, datagrams):
+    """Sends the (data, address) tuples (address is None for a connected
+    socket) on the non-blocking socket `fd`. Returns the number of datagrams
+    sent (can be less than all of them)."""
+    count = len(datagrams)
+    iovecs = (iovec * count)()
+    msgs = (mmsghdr * count)()
+    # keep the strings alive till the call is made
+    keep = []
+    for i, (data, address) in enumerate(datagrams):
+        data = ctypes.c_char_p(data)
+        keep.append(data)
+        iovecs[i].iov_base = ctypes.cast(data, ctypes.c_void_p)
+        iovecs[i].iov_len = len(datagrams[i][0])
+        hdr = msgs[i].msg_hdr
+        hdr.msg_iov = ctypes.pointer(iovecs[i])
+        hdr.msg_iovlen = 1
+        if address is not None:
+            name = ctypes.create_string_buffer(encode_address(address))
+            keep.append(name)
+            hdr.msg_name = ctypes.addressof(name)
+            hdr.msg_namelen = len(name) - 1
+    sent = _sendmmsg(fd, msgs, count, 0)
+    if sent < 0:
+        raise_errno()
+    return sent
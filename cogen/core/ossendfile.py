@@ -0,0 +1,50 @@
+"""
+``sendfile`` for python 2 (there's no ``os.sendfile``): a ctypes binding for
+the linux ``sendfile64`` call (``os.sendfile`` is used if there is one). The
+file data goes from the page cache to the socket, it's never copied to
+userspace.
+
+`available` is False if it can't be used (:func:`cogen.core.proactors.base.
+wrapped_sendfile` falls back to py-sendfile, a memory map or plain reads then).
+"""
+__all__ = ['available', 'sendfile']
+
+import ctypes
+import ctypes.util
+import os
+import socket
+import sys
+
+def _bind():
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    func = libc.sendfile64
+    func.argtypes = [ctypes.c_int, ctypes.c_int,
+                     ctypes.POINTER(ctypes.c_int64), ctypes.c_size_t]
+    func.restype = ctypes.c_ssize_t
+    return func
+
+try:
+    if hasattr(os, 'sendfile'):
+        _sendfile = None
+    elif sys.platform.startswith('linux'):
+        _sendfile = _bind()
+    else:
+        # the bsd sendfile has a different signature
+        raise OSError("Not linux.")
+    available = True
+except (OSError, AttributeError, TypeError):
+    available = False
+
+def sendfile(out_fd, in_fd, offset, count):
+    """Sends `count` bytes from the `in_fd` file, starting at `offset`, to
+    the `out_fd` socket. Returns the number of bytes sent (0 at the end of the
+    file). Raises socket.error (eg: EAGAIN if a non-blocking socket isn't
+    writable)."""
+    if _sendfile is None:
+        return os.sendfile(out_fd, in_fd, offset, count)
+    sent = _sendfile(out_fd, in_fd, ctypes.byref(ctypes.c_int64(offset)),
+                     count)
+    if sent < 0:
+        err = ctypes.get_errno()
+        raise socket.error(err, os.strerror(err))
+    return sent
@@ -0,0 +1,198 @@
+"""
+Scheduling policies for the scheduler's run queue (`Scheduler.active`).
+
+The operations put (op, coro) pairs in the run queue with `append` or
+`appendleft` (depending on their priority flags) and the scheduler takes them
+out with `popleft`. A policy is a object with that deque-like interface that
+decides the order in which the pairs are run.
+
+Usage:
+
+.. sourcecode:: python
+
+    sched = Scheduler(policy=policies.WeightedFair)
+    sched.active.weights['admin'] = 10
+    coro = sched.add(admin_handler)
+    sched.active.classify(coro, 'admin')
+
+The settings of a coroutine (deadline, class) are inherited by the coroutines
+it calls. Use a lambda or a class with the arguments already set if you need
+to customize the policy's constructor arguments:
+
+.. sourcecode:: python
+
+    sched = Scheduler(policy=lambda sched: policies.EDF(sched, .05))
+
+"""
+__all__ = ['FIFO', 'EDF', 'WeightedFair']
+
+import collections
+import heapq
+import itertools
+import weakref
+from time import time
+
+
+def lookup(mapping, coro, default):
+    """Returns the value for the coroutine or for it's closest caller that
+    has one in the mapping."""
+    while coro is not None:
+        try:
+            return mapping[coro]
+        except (KeyError, TypeError):
+            coro = getattr(coro, 'caller', None)
+    return default
+
+class FIFO(collections.deque):
+    """The default policy: pairs are run in the order they are added
+    (`appendleft` puts them in front)."""
+    def __init__(self, sched=None):
+        super(FIFO, self).__init__()
+
+class RunQueue(object):
+    """Base class for the run queues that aren't a plain deque. Subclasses
+    need to implement `append`, `appendleft`, `popleft`, `__len__` and
+    `__iter__`."""
+    def extend(self, pairs):
+        for pair in pairs:
+            self.append(pair)
+
+    def extendleft(self, pairs):
+        for pair in pairs:
+            self.appendleft(pair)
+
+    def __repr__(self):
+        return "<%s@0x%X %s>" % (self.__class__.__name__, id(self), list(self))
+
+class EDF(RunQueue):
+    """
+    Earliest deadline first.
+
+    Every coroutine has a relative deadline (`default_deadline` seconds if
+    not set with :meth:`set_deadline`). A pair added to the queue must run
+    before the time it was added plus the coroutine's deadline and the queue
+    always runs the pair with the earliest deadline first. `appendleft`
+    only wins the ties.
+
+    Nothing starves: a pair that waits in the queue will eventually have the
+    earliest deadline.
+    """
+    def __init__(self, sched=None, default_deadline=1):
+        self.default_deadline = default_deadline
+        self.deadlines = weakref.WeakKeyDictionary()
+        self.heap = []
+        self.counter = itertools.count()
+
+    def set_deadline(self, coro, deadline):
+        "Sets the relative deadline (in seconds) for the coroutine."
+        self.deadlines[coro] = deadline
+
+    def append(self, pair):
+        heapq.heappush(self.heap, (
+            time() + lookup(self.deadlines, pair[1], self.default_deadline),
+            self.counter.next(),
+            pair
+        ))
+
+    def appendleft(self, pair):
+        heapq.heappush(self.heap, (
+            time() + lookup(self.deadlines, pair[1], self.default_deadline),
+            -self.counter.next(),
+            pair
+        ))
+
+    def popleft(self):
+        if not self.heap:
+            raise IndexError("pop from an empty queue")
+        return heapq.heappop(self.heap)[2]
+
+    def clear(self):
+        self.heap = []
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        return (entry[2] for entry in sorted(self.heap))
+
+class WeightedFair(RunQueue):
+    """
+    Weighted fair queuing across named classes of coroutines.
+
+    Coroutines are put in a class with :meth:`classify` (the unclassified
+    ones are in `default_class`). Each class has it's own queue and gets
+    a share of the runs proportional to it's weight (1 if not set in
+    `weights`), using virtual finish tags (like in packet schedulers).
+    `appendleft` puts the pair in front of it's class queue.
+
+    Entries are aged: a pair that waited more than `max_wait` seconds is run
+    before anything else regardless of the weights. None disables the aging.
+    """
+    def __init__(self, sched=None, weights=None, default_class='default',
+                 max_wait=1):
+        self.weights = dict(weights or {})
+        self.default_class = default_class
+        self.max_wait = max_wait
+        self.classes = weakref.WeakKeyDictionary()
+        self.queues = {}
+        self.tags = {}
+        self.vtime = 0
+        self.length = 0
+
+    def classify(self, coro, name):
+        "Puts the coroutine (and the coroutines it calls) in the named class."
+        self.classes[coro] = name
+
+    def _queue(self, pair):
+        name = lookup(self.classes, pair[1], self.default_class)
+        queue = self.queues.get(name)
+        if queue is None:
+            queue = self.queues[name] = collections.deque()
+            # a class that wasn't backlogged can't bank the time it was idle
+            self.tags[name] = max(self.tags.get(name, 0), self.vtime)
+        self.length += 1
+        return queue
+
+    def append(self, pair):
+        self._queue(pair).append((time(), pair))
+
+    def appendleft(self, pair):
+        queue = self._queue(pair)
+        # the pair in front takes over the age of the class' backlog
+        queue.appendleft((queue and queue[0][0] or time(), pair))
+
+    def popleft(self):
+        if not self.length:
+            raise IndexError("pop from an empty queue")
+        tags = self.tags
+        chosen = None
+        if self.max_wait is not None:
+            oldest = time() - self.max_wait
+            for name, queue in self.queues.iteritems():
+                if queue[0][0] <= oldest:
+                    oldest = queue[0][0]
+                    chosen = name
+        if chosen is None:
+            for name in self.queues:
+                if chosen is None or tags[name] < tags[chosen]:
+                    chosen = name
+        queue = self.queues[chosen]
+        self.vtime = tags[chosen]
+        tags[chosen] += 1.0 / self.weights.get(chosen, 1)
+        pair = queue.popleft()[1]
+        if not queue:
+            del self.queues[chosen]
+        self.length -= 1
+        return pair
+
+    def clear(self):
+        self.queues.clear()
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for queue in self.queues.values():
+            for entry in queue:
+                yield entry[1]
@@ -0,0 +1,195 @@
+"""
+A pool of outbound connections, reused between calls (keep-alive).
+
+The connections are kept per address. At most `max_size` connections are
+open for a address (idle or in use) - when all of them are in use
+:meth:`ConnectionPool.acquire` waits (on a :class:`cogen.core.queue.Queue`)
+till one is released, for at most `wait_timeout` seconds
+(:class:`cogen.core.events.OperationTimeout` is raised then).
+
+A idle connection is checked before it's handed out: if it's readable the
+peer has closed it (or sent something we weren't waiting for) so it's
+discarded. Connections idle for more than `idle_timeout` seconds are closed.
+
+Usage:
+
+.. sourcecode:: python
+
+    pool = ConnectionPool(max_size=10, idle_timeout=30)
+
+    @coroutine
+    def call_backend():
+        sock = yield pool.acquire(('backend', 8080))
+        try:
+            yield sock.sendall(request)
+            response = yield sock.recv(4096)
+        except:
+            # don't reuse a connection in a unknown state
+            yield pool.release(sock, reuse=False)
+            raise
+        yield pool.release(sock)
+
+Idle connections are only closed when the address is used again, add
+:meth:`ConnectionPool.prune` as a scheduler idle hook to close them in idle
+time:
+
+.. sourcecode:: python
+
+    sched.add_idle_hook(pool.prune)
+"""
+__all__ = ['ConnectionPool']
+
+import errno
+import socket
+import time
+
+import queue
+import sockets
+from coroutines import coroutine
+
+
+class ConnectionQueue(queue.Queue):
+    "The idle connections of a address, the last used is reused first."
+
+    def _get(self):
+        return self.queue.pop()
+
+class ConnectionPool(object):
+    """
+    Options:
+
+    * max_size - the maximum number of connections per address
+    * idle_timeout - seconds a connection can stay idle in the pool (None -
+      no limit)
+    * wait_timeout - seconds :meth:`acquire` waits for a free connection
+      (None - no limit)
+    * connect_timeout - the timeout for connecting (None - the socket's
+      default timeout)
+    * family - the address family of the sockets
+
+    The number of `connects`, `reuses`, `discards` (closed peers, idle
+    timeouts and connections released with ``reuse=False``) and `waits` (for
+    a free connection) are counted in `stats`.
+    """
+    def __init__(self, max_size=10, idle_timeout=60, wait_timeout=None,
+                 connect_timeout=None, family=sockets.AF_INET):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.connect_timeout = connect_timeout
+        self.family = family
+        self.idle = {}
+        self.sizes = {}
+        self.addresses = {}
+        self.closed = False
+        self.stats = {
+            'connects': 0,
+            'reuses': 0,
+            'discards': 0,
+            'waits': 0,
+        }
+
+    def __repr__(self):
+        return "<%s@%X sizes:%s>" % (
+            self.__class__.__name__,
+            id(self),
+            self.sizes
+        )
+
+    def healthy(self, sock, idle_since):
+        """Returns False if the idle connection shouldn't be reused: it was
+        idle for too long or it's readable (the peer closed it)."""
+        if self.idle_timeout is not None and \
+                time.time() - idle_since > self.idle_timeout:
+            return False
+        # peek (the socket is non-blocking), select can't take fds over
+        # FD_SETSIZE
+        try:
+            sock._fd.recv(1, socket.MSG_PEEK)
+        except sockets.soerror, exc:
+            return exc[0] in (errno.EAGAIN, errno.EWOULDBLOCK)
+        return False
+
+    def discard(self, sock, address):
+        sock.close()
+        self.sizes[address] -= 1
+        self.stats['discards'] += 1
+
+    @coroutine
+    def acquire(self, address, **kws):
+        """Returns a connected :class:`cogen.core.sockets.Socket` for
+        `address`, a idle one if there is one. Extra keyword arguments are
+        passed to the wait operation (eg: a different `timeout`)."""
+        idle = self.idle.get(address)
+        if idle is None:
+            idle = self.idle[address] = ConnectionQueue()
+            self.sizes[address] = 0
+        while True:
+            if not idle.empty():
+                item = yield idle.get_nowait()
+            elif self.sizes[address] < self.max_size:
+                item = None
+            else:
+                self.stats['waits'] += 1
+                kws.setdefault('timeout', self.wait_timeout)
+                item = yield idle.get(**kws)
+            if item is None:
+                # a free slot, make a new connection
+                break
+            sock, idle_since = item
+            if self.healthy(sock, idle_since):
+                self.stats['reuses'] += 1
+                self.addresses[sock] = address
+                raise StopIteration(sock)
+            self.discard(sock, address)
+        self.sizes[address] += 1
+        sock = sockets.Socket(self.family, _timeout=self.connect_timeout)
+        try:
+            yield sock.connect(address)
+        except:
+            sock.close()
+            self.sizes[address] -= 1
+            if idle.waiting_gets:
+                # let a waiter try to connect
+                yield idle.put(None)
+            raise
+        if self.connect_timeout:
+            sock.settimeout(sockets.getdefaulttimeout())
+        self.stats['connects'] += 1
+        self.addresses[sock] = address
+        raise StopIteration(sock)
+
+    def release(self, sock, reuse=True):
+        """Puts back a connection from :meth:`acquire` in the pool (or closes
+        it if `reuse` is False). Returns a operation (you need to yield it) -
+        a coroutine waiting for a connection may get it."""
+        address = self.addresses.pop(sock)
+        idle = self.idle[address]
+        if reuse and not self.closed:
+            self.prune(address)
+            return idle.put((sock, time.time()))
+        self.discard(sock, address)
+        if idle.waiting_gets:
+            return idle.put(None)
+
+    def prune(self, address=None):
+        """Closes the idle connections that timed out (for all the addresses
+        if `address` is None)."""
+        if self.idle_timeout is None:
+            return
+        deadline = time.time() - self.idle_timeout
+        for addr in address is None and self.idle.keys() or (address, ):
+            connections = self.idle[addr].queue
+            # the oldest are on the left
+            while connections and connections[0][1] < deadline:
+                self.discard(connections.popleft()[0], addr)
+
+    def close(self):
+        """Closes the idle connections. Connections in use are closed when
+        they are released."""
+        self.closed = True
+        for address, idle in self.idle.iteritems():
+            while idle.queue:
+                sock, idle_since = idle.queue.popleft()
+                sock.close()
+                self.sizes[address] -= 1
@@ -1,15 +1,23 @@
+import os
 import sys
+import mmap
 import errno
-from socket import error as soerror
+from socket import error as soerror, IPPROTO_TCP
 try:
     import sendfile
 except:
     sendfile = None
 
+from cogen.core import mmsg, splice, ossendfile
 from cogen.core.coroutines import CoroutineException
-from cogen.core.sockets import Socket, SocketError, ConnectionClosed
+from cogen.core.sockets import Socket, SocketError, ConnectionClosed, \
+                               TCP_CORK
 from cogen.core.util import priority
 
+# not in python 2's socket module
+MSG_MORE = sys.platform.startswith('linux') and 0x8000 or 0
+# the most a sendfile call sends on linux
+MAX_SENDFILE = 0x7ffff000
 
 def perform_recv(act):
     act.buff = act.sock._fd.recv(act.len)
@@ -26,6 +34,82 @@ def perform_sendall(act):
     act.sent += act.sock._fd.send(act.buff[act.sent:])
     return act.sent==len(act.buff) and act
 
+def perform_recvfrom(act):
+    act.buff, act.addr = act.sock._fd.recvfrom(act.len)
+    return act
+
+def perform_sendto(act):
+    act.sent = act.sock._fd.sendto(act.buff, act.addr)
+    return act
+
+def perform_recvmany(act):
+    if mmsg.available:
+        act.datagrams = mmsg.recvmmsg(act.sock.fileno(), act.count, act.len)
+        return act
+    datagrams = []
+    recvfrom = act.sock._fd.recvfrom
+    try:
+        while len(datagrams) < act.count:
+            datagrams.append(recvfrom(act.len))
+    except soerror, exc:
+        if not datagrams or exc[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+            raise
+    act.datagrams = datagrams
+    return act
+
+def perform_sendmany(act):
+    if mmsg.available:
+        act.sent += mmsg.sendmmsg(act.sock.fileno(), act.datagrams[act.sent:])
+    else:
+        sendto = act.sock._fd.sendto
+        for data, address in act.datagrams[act.sent:]:
+            try:
+                sendto(data, address)
+            except soerror, exc:
+                if exc[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+                # keep the progress, the rest is sent when writable again
+                return
+            act.sent += 1
+    return act.sent == len(act.datagrams) and act
+
+def perform_splice_in(act):
+    act.moved = splice.splice(act.sock.fileno(), act.pipe.write_fd,
+                              min(act.len, act.pipe.size - act.pipe.pending))
+    act.pipe.pending += act.moved
+    return act
+
+def perform_splice_out(act):
+    moved = splice.splice(act.pipe.read_fd, act.sock.fileno(),
+                          act.pipe.pending)
+    act.pipe.pending -= moved
+    act.moved += moved
+    return not act.pipe.pending and act
+
+def perform_recv_to_file(act):
+    # runs till the socket is drained (a EAGAIN) - the progress is kept in act
+    while act.received < act.length:
+        left = act.length - act.received
+        if act.pipe:
+            moved = splice.splice(act.sock.fileno(), act.pipe.write_fd,
+                                  min(left, act.pipe.size))
+            if not moved:
+                raise ConnectionClosed("Empty recv.")
+            act.pipe.pending += moved
+            while act.pipe.pending:
+                # a regular file doesn't block
+                act.pipe.pending -= splice.splice(act.pipe.read_fd, act.fd,
+                                                  act.pipe.pending)
+        else:
+            data = act.sock._fd.recv(min(left, act.bufsize))
+            if not data:
+                raise ConnectionClosed("Empty recv.")
+            moved = len(data)
+            while data:
+                data = data[os.write(act.fd, data):]
+        act.received += moved
+    return act
+
 def perform_accept(act):
     act.conn, act.addr = act.sock._fd.accept()
     act.conn.setblocking(0)
@@ -51,44 +135,78 @@ def perform_connect(act):
     else: # err==0 means successful connect
         return act
 
+def perform_readable(act):
+    "Just waits for the socket to be readable (eg: for a TLS handshake)."
+    return act
+
+def perform_writable(act):
+    "Just waits for the socket to be writable."
+    return act
+
+def map_file(act):
+    """Returns a read-only memory map of the file (False if it can't be
+    mapped - eg: it's empty or it's a pipe)."""
+    try:
+        return mmap.mmap(act.file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+    except (mmap.error, ValueError, EnvironmentError, AttributeError):
+        return False
+
 def wrapped_sendfile(act, offset, length):
     """
-    Calls the sendfile system call or simulate with file read and socket send if
-    unavailable.
+    Calls the sendfile system call (:mod:`cogen.core.ossendfile` or the
+    py-sendfile extension). If unavailable the data is sent from a memory map
+    of the file (or a read if the file can't be mapped).
     """
+    if ossendfile.available:
+        return ossendfile.sendfile(act.sock.fileno(),
+                                   act.file_handle.fileno(), offset, length)
     if sendfile:
         offset, sent = sendfile.sendfile(
             act.sock.fileno(),
             act.file_handle.fileno(),
             offset, length
         )
-    else:
-        act.file_handle.seek(offset)
-        sent = act.sock._fd.send(act.file_handle.read(length))
-    return sent
+        return sent
+    if act.mapping is None:
+        act.mapping = map_file(act)
+    if act.mapping:
+        return act.sock._fd.send(buffer(act.mapping, offset, length))
+    act.file_handle.seek(offset)
+    return act.sock._fd.send(act.file_handle.read(length))
+
+def cork(act, flag):
+    try:
+        act.sock._fd.setsockopt(IPPROTO_TCP, TCP_CORK, flag)
+    except soerror:
+        return False # not a tcp socket
+    return True
 
 def perform_sendfile(act):
-    if act.length:
-        if act.blocksize:
-            act.sent += wrapped_sendfile(
-                act,
-                act.offset + act.sent,
-                min(act.length-act.sent, act.blocksize)
-            )
+    if act.corked is None:
+        # hold the partial frames of the header, file and trailer
+        act.corked = bool(TCP_CORK and (act.header or act.trailer) and
+                          cork(act, 1))
+    while act.header:
+        act.header = act.header[act.sock._fd.send(act.header, MSG_MORE):]
+    if act.sending_file:
+        if act.length is None:
+            count = act.blocksize or MAX_SENDFILE
         else:
-            act.sent += wrapped_sendfile(act, act.offset+act.sent, act.length-act.sent)
-        if act.sent == act.length:
-            return act
-    else:
-        if act.blocksize:
-            sent = wrapped_sendfile(act, act.offset+act.sent, act.blocksize)
-        else:
-            sent = wrapped_sendfile(act, act.offset+act.sent, act.blocksize)
-            # we would use self.length but we don't have any,
-            #  and we don't know the file's length
+            count = act.length - act.sent
+            if act.blocksize:
+                count = min(count, act.blocksize)
+        sent = count and wrapped_sendfile(act, act.offset + act.sent, count)
         act.sent += sent
-        if not sent:
-            return act
+        # without a length the file is sent till the end
+        if act.length is None and not sent or act.sent == act.length:
+            act.sending_file = False
+        else:
+            return
+    while act.trailer:
+        act.trailer = act.trailer[act.sock._fd.send(act.trailer):]
+    if act.corked:
+        act.corked = not cork(act, 0)
+    return act
 
 class ProactorBase(object):
     """
@@ -105,6 +223,10 @@ class ProactorBase(object):
         self.resolution = resolution # seconds
         self.m_resolution = resolution*1000 # miliseconds
         self.n_resolution = resolution*1000000000 #nanoseconds
+        # counters for cogen.core.tuning
+        self.multiplex_tries = 0
+        self.multiplex_hits = 0
+        self.events = 0
         self.set_options(**options)
 
     def __str__(self):
@@ -130,6 +252,16 @@ class ProactorBase(object):
     def __len__(self):
         return len(self.tokens)
 
+    def fileno(self):
+        """
+        Returns a descriptor that becomes readable when the proactor has
+        events to handle (like the epoll or kqueue descriptor) or None if the
+        implementation doesn't have such a thing.
+
+        Overriden in a subclass.
+        """
+        return None
+
     def request_recv(self, act, coro):
         "Requests a recv for `coro` corutine with parameters and completion \
         passed via `act`"
@@ -145,6 +277,46 @@ class ProactorBase(object):
         passed via `act`"
         return self.request_generic(act, coro, perform_sendall)
 
+    def request_recvfrom(self, act, coro):
+        "Requests a recvfrom for `coro` corutine with parameters and \
+        completion passed via `act`"
+        return self.request_generic(act, coro, perform_recvfrom)
+
+    def request_sendto(self, act, coro):
+        "Requests a sendto for `coro` corutine with parameters and completion \
+        passed via `act`"
+        return self.request_generic(act, coro, perform_sendto)
+
+    def request_recvmany(self, act, coro):
+        "Requests a batch of recvfrom for `coro` corutine with parameters and \
+        completion passed via `act`"
+        return self.request_generic(act, coro, perform_recvmany)
+
+    def request_sendmany(self, act, coro):
+        "Requests a batch of sendto for `coro` corutine with parameters and \
+        completion passed via `act`"
+        return self.request_generic(act, coro, perform_sendmany)
+
+    def request_splice_in(self, act, coro):
+        "Requests a splice from a socket to a pipe for `coro` corutine with \
+        parameters and completion passed via `act`"
+        return self.request_generic(act, coro, perform_splice_in)
+
+    def request_splice_out(self, act, coro):
+        "Requests a splice from a pipe to a socket for `coro` corutine with \
+        parameters and completion passed via `act`"
+        return self.request_generic(act, coro, perform_splice_out)
+
+    def request_recv_to_file(self, act, coro):
+        "Requests a recv to a file for `coro` corutine with parameters and \
+        completion passed via `act`. The recv is always tried first - the data \
+        can be already there (or buffered in a TLS socket)."
+        result = self.try_run_act(act, perform_recv_to_file)
+        if result:
+            return result, coro
+        else:
+            self.add_token(act, coro, perform_recv_to_file)
+
     def request_accept(self, act, coro):
         "Requests a accept for `coro` corutine with parameters and completion \
         passed via `act`"
@@ -176,11 +348,13 @@ class ProactorBase(object):
         Note: `act` is usualy a SocketOperation instance and the request_foo
         calls are usually made from a Foo subclass.
         """
-        result = self.multiplex_first and self.try_run_act(act, perform)
-        if result:
-            return result, coro
-        else:
-            self.add_token(act, coro, perform)
+        if self.multiplex_first:
+            self.multiplex_tries += 1
+            result = self.try_run_act(act, perform)
+            if result:
+                self.multiplex_hits += 1
+                return result, coro
+        self.add_token(act, coro, perform)
 
 
     def add_token(self, act, coro, performer):
@@ -201,6 +375,7 @@ class ProactorBase(object):
         if act in self.tokens:
             self.unregister_fd(act)
             del self.tokens[act]
+            act.coro = None
             return True
         else:
             import warnings
@@ -257,16 +432,15 @@ class ProactorBase(object):
         Calls the scheduler to run or schedule the associated coroutine.
         """
         scheduler = self.scheduler
+        self.events += 1
         if act in self.tokens:
             coro = act.coro
             op = self.try_run_act(act, self.tokens[act])
             if op:
                 del self.tokens[act]
+                act.coro = None
                 if scheduler.ops_greedy:
-                    while True:
-                        op, coro = scheduler.process_op(coro.run_op(op, scheduler), coro)
-                        if not op and not coro:
-                            break
+                    scheduler.run_coro(op, coro)
                 else:
                     if op.prio & priority.OP:
                         op, coro = scheduler.process_op(coro.run_op(op, scheduler), coro)
@@ -275,6 +449,10 @@ class ProactorBase(object):
                             scheduler.active.appendleft( (op, coro) )
                         else:
                             scheduler.active.append( (op, coro) )
+                    elif coro:
+                        # a coroutine call (eg: the first step of a parked
+                        # coroutine), the callee still has to be started
+                        scheduler.active.append( (None, coro) )
             else:
                 return
         else:
@@ -287,11 +465,13 @@ class ProactorBase(object):
         Hande completion for a request and return an (op, coro) to be
         passed to the scheduler on the last completion loop of a proactor.
         """
+        self.events += 1
         if act in self.tokens:
             coro = act.coro
             op = self.try_run_act(act, self.tokens[act])
             if op:
                 del self.tokens[act]
+                act.coro = None
                 return op, coro
 
     def handle_error_event(self, act, detail, exc=SocketError):
@@ -299,9 +479,11 @@ class ProactorBase(object):
         Handle an errored event. Calls the scheduler to schedule the associated
         coroutine.
         """
+        self.events += 1
         del self.tokens[act]
+        coro, act.coro = act.coro, None
         self.scheduler.active.append((
             CoroutineException(exc, exc(detail)),
-            act.coro
+            coro
         ))
 
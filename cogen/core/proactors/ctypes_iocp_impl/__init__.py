@@ -8,7 +8,8 @@ from api_wrappers import _get_osfhandle, CreateIoCompletionPort, CloseHandle,
                 LPOVERLAPPED, OVERLAPPED, LPDWORD, PULONG_PTR, cast, c_void_p, \
                 byref, c_char_p, create_string_buffer, c_ulong, DWORD, WSABUF, \
                 c_long, addrinfo_p, getaddrinfo, addrinfo, WSAPROTOCOL_INFO, \
-                c_int, sizeof, string_at, get_osfhandle, sockaddr_in
+                c_int, sizeof, string_at, get_osfhandle, sockaddr_in, \
+                TRANSMIT_FILE_BUFFERS
 
 from api_consts import SO_UPDATE_ACCEPT_CONTEXT, SO_UPDATE_CONNECT_CONTEXT, \
                 INVALID_HANDLE_VALUE, WSA_OPERATION_ABORTED, WSA_IO_PENDING, \
@@ -177,19 +178,30 @@ def complete_connect(act, rc, nbytes):
     return act
 
 def perform_sendfile(act, overlapped):
+    buffers = None
+    if act.header or act.trailer:
+        # the overlapped keeps the buffers alive till the completion
+        overlapped.buffers = buffers = TRANSMIT_FILE_BUFFERS(
+            cast(c_char_p(act.header), c_void_p), len(act.header),
+            cast(c_char_p(act.trailer), c_void_p), len(act.trailer)
+        )
+        overlapped.strings = act.header, act.trailer
+        buffers = byref(buffers)
     # BOOL
     return TransmitFile(
         act.sock._fd.fileno(), # SOCKET hSocket
         get_osfhandle(act.file_handle.fileno()), # HANDLE hFile
         act.length or 0, # DWORD nNumberOfBytesToWrite
-        act.blocksize, # DWORD nNumberOfBytesPerSend
+        act.blocksize or 0, # DWORD nNumberOfBytesPerSend
         overlapped, # LPOVERLAPPED lpOverlapped
-        None, # LPTRANSMIT_FILE_BUFFERS lpTransmitBuffers
+        buffers, # LPTRANSMIT_FILE_BUFFERS lpTransmitBuffers
         0 # DWORD dwFlags
     ), 0
 
 def complete_sendfile(act, rc, nbytes):
-    act.sent = nbytes
+    # nbytes includes the header and trailer
+    act.sent = nbytes - len(act.header) - len(act.trailer)
+    act.header = act.trailer = ''
     return act
 
 class CTYPES_IOCPProactor(ProactorBase):
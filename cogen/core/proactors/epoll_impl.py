@@ -7,7 +7,9 @@ from time import sleep
 
 from base import ProactorBase, perform_recv, perform_accept, perform_send, \
                                 perform_sendall, perform_sendfile, \
-                                perform_connect
+                                perform_connect, perform_readable, \
+                                perform_recvfrom, perform_recvmany, \
+                                perform_splice_in, perform_recv_to_file
 
 from cogen.core.sockets import ConnectionClosed
 
@@ -18,6 +20,9 @@ class EpollProactor(ProactorBase):
         self.epoll_fd = epoll_create(default_size)
         self.shadow = {}
 
+    def fileno(self):
+        return self.epoll_fd
+
     def unregister_fd(self, act, fd=None):
         act.sock._proactor_added = False
         fileno = fd or act.sock.fileno()
@@ -37,7 +42,12 @@ class EpollProactor(ProactorBase):
         fileno = act.sock.fileno()
         self.shadow[fileno] = act
         flag =  EPOLLIN if performer == perform_recv \
-                or performer == perform_accept else EPOLLOUT
+                or performer == perform_accept \
+                or performer == perform_readable \
+                or performer == perform_recvfrom \
+                or performer == perform_recvmany \
+                or performer == perform_splice_in \
+                or performer == perform_recv_to_file else EPOLLOUT
         epoll_ctl(
             self.epoll_fd,
             EPOLL_CTL_MOD if act.sock._proactor_added else EPOLL_CTL_ADD,
@@ -61,7 +71,8 @@ class EpollProactor(ProactorBase):
             len_events = len(events)-1
             for nr, (ev, fd) in enumerate(events):
                 act = self.shadow.pop(fd)
-                if ev & EPOLLHUP:
+                # data left in the socket is read first (till the empty read)
+                if ev & EPOLLHUP and not ev & EPOLLIN:
                     epoll_ctl(self.epoll_fd, EPOLL_CTL_DEL, fd, 0)
                     self.handle_error_event(act, 'Hang up.', ConnectionClosed)
                 elif ev & EPOLLERR:
@@ -80,11 +80,14 @@ def perform_sendfile(act, overlapped):
         act.sock,
         win32file._get_osfhandle(act.file_handle.fileno()),
         act.length or 0,
-        act.blocksize, overlapped, 0
+        act.blocksize or 0, overlapped, 0,
+        act.header or None, act.trailer or None
     ), 0
 
 def complete_sendfile(act, rc, nbytes):
-    act.sent = nbytes
+    # nbytes includes the header and trailer
+    act.sent = nbytes - len(act.header) - len(act.trailer)
+    act.header = act.trailer = ''
     return act
 
 class IOCPProactor(ProactorBase):
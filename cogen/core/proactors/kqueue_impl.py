@@ -7,7 +7,9 @@ from time import sleep
 
 from base import ProactorBase, perform_recv, perform_accept, perform_send, \
                                 perform_sendall, perform_sendfile, \
-                                perform_connect
+                                perform_connect, perform_readable, \
+                                perform_recvfrom, perform_recvmany, \
+                                perform_splice_in, perform_recv_to_file
 
 class KQueueProactor(ProactorBase):
     def __init__(self, scheduler, res, default_size=1024, **options):
@@ -15,6 +17,9 @@ class KQueueProactor(ProactorBase):
         self.kq = kqueue()
         self.default_size = default_size
 
+    def fileno(self):
+        return self.kq.fileno()
+
     def unregister_fd(self, act, fd=None):
         try:
             ev = EV_SET(fd or act.sock.fileno(), act.flags, EV_DELETE)
@@ -26,7 +31,12 @@ class KQueueProactor(ProactorBase):
     def register_fd(self, act, performer):
         fileno = act.sock.fileno()
         act.flags = flag = EVFILT_READ if performer == perform_recv \
-                or performer == perform_accept else EVFILT_WRITE
+                or performer == perform_accept \
+                or performer == perform_readable \
+                or performer == perform_recvfrom \
+                or performer == perform_recvmany \
+                or performer == perform_splice_in \
+                or performer == perform_recv_to_file else EVFILT_WRITE
         ev = EV_SET(
             fileno, flag,
             EV_ADD | EV_ENABLE | EV_ONESHOT
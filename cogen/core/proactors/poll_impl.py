@@ -4,7 +4,9 @@ from time import sleep
 
 from base import ProactorBase, perform_recv, perform_accept, perform_send, \
                                 perform_sendall, perform_sendfile, \
-                                perform_connect
+                                perform_connect, perform_readable, \
+                                perform_recvfrom, perform_recvmany, \
+                                perform_splice_in, perform_recv_to_file
 
 from cogen.core.sockets import ConnectionClosed
 
@@ -32,7 +34,12 @@ class PollProactor(ProactorBase):
         fileno = act.sock.fileno()
         self.shadow[fileno] = act
         flag =  self.POLL_IN if performer == perform_recv \
-                or performer == perform_accept else self.POLL_OUT
+                or performer == perform_accept \
+                or performer == perform_readable \
+                or performer == perform_recvfrom \
+                or performer == perform_recvmany \
+                or performer == perform_splice_in \
+                or performer == perform_recv_to_file else self.POLL_OUT
         self.poller.register(fileno, flag | self.POLL_ERR)
 
     def run(self, timeout = 0):
@@ -52,7 +59,8 @@ class PollProactor(ProactorBase):
             len_events = len(events)-1
             for nr, (fd, ev) in enumerate(events):
                 act = self.shadow.pop(fd)
-                if ev & POLLHUP:
+                # data left in the socket is read first (till the empty read)
+                if ev & POLLHUP and not ev & POLLIN:
                     self.poller.unregister(fd)
                     self.handle_error_event(act, 'Hang up.', ConnectionClosed)
                 elif ev & POLLNVAL:
@@ -4,7 +4,11 @@ from time import sleep
 
 from base import ProactorBase, perform_recv, perform_accept, perform_send, \
                                 perform_sendall, perform_sendfile, \
-                                perform_connect
+                                perform_connect, perform_readable, \
+                                perform_writable, perform_recvfrom, \
+                                perform_sendto, perform_recvmany, \
+                                perform_sendmany, perform_splice_in, \
+                                perform_splice_out, perform_recv_to_file
 
 
 class SelectProactor(ProactorBase):
@@ -31,12 +35,21 @@ class SelectProactor(ProactorBase):
             ready_to_read, ready_to_write, in_error = select.select(
                 [act for act in self.tokens
                     if self.tokens[act] == perform_recv
-                    or self.tokens[act] == perform_accept],
+                    or self.tokens[act] == perform_accept
+                    or self.tokens[act] == perform_readable
+                    or self.tokens[act] == perform_recvfrom
+                    or self.tokens[act] == perform_recvmany
+                    or self.tokens[act] == perform_splice_in
+                    or self.tokens[act] == perform_recv_to_file],
                 [act for act in self.tokens
                     if self.tokens[act] == perform_send
                     or self.tokens[act] == perform_sendall
                     or self.tokens[act] == perform_sendfile
-                    or self.tokens[act] == perform_connect],
+                    or self.tokens[act] == perform_connect
+                    or self.tokens[act] == perform_writable
+                    or self.tokens[act] == perform_sendto
+                    or self.tokens[act] == perform_sendmany
+                    or self.tokens[act] == perform_splice_out],
                 [act for act in self.tokens],
                 ptimeout
             )
@@ -7,7 +7,9 @@ from select import epoll, EPOLLIN, EPOLLOUT, EPOLLPRI, EPOLLERR, EPOLLHUP, \
 
 from base import ProactorBase, perform_recv, perform_accept, perform_send, \
                                 perform_sendall, perform_sendfile, \
-                                perform_connect
+                                perform_connect, perform_readable, \
+                                perform_recvfrom, perform_recvmany, \
+                                perform_splice_in, perform_recv_to_file
 
 from cogen.core.sockets import ConnectionClosed
 
@@ -19,6 +21,9 @@ class StdlibEpollProactor(ProactorBase):
         self.epoll_obj = epoll(default_size)
         self.shadow = {}
 
+    def fileno(self):
+        return self.epoll_obj.fileno()
+
     def unregister_fd(self, act, fd=None):
         act.sock._proactor_added = False
         fileno = fd or act.sock.fileno()
@@ -38,7 +43,12 @@ class StdlibEpollProactor(ProactorBase):
         fileno = act.sock.fileno()
         self.shadow[fileno] = act
         flag =  EPOLLIN if performer == perform_recv \
-                or performer == perform_accept else EPOLLOUT
+                or performer == perform_accept \
+                or performer == perform_readable \
+                or performer == perform_recvfrom \
+                or performer == perform_recvmany \
+                or performer == perform_splice_in \
+                or performer == perform_recv_to_file else EPOLLOUT
 
         if act.sock._proactor_added:
             self.epoll_obj.modify(fileno, flag | EPOLLONESHOT)
@@ -62,7 +72,8 @@ class StdlibEpollProactor(ProactorBase):
             len_events = len(events)-1
             for nr, (fd, ev) in enumerate(events):
                 act = self.shadow.pop(fd)
-                if ev & EPOLLHUP:
+                # data left in the socket is read first (till the empty read)
+                if ev & EPOLLHUP and not ev & EPOLLIN:
                     self.epoll_obj.unregister(fd)
                     self.handle_error_event(act, 'Hang up.', ConnectionClosed)
                 elif ev & EPOLLERR:
@@ -11,7 +11,9 @@ from time import sleep
 
 from base import ProactorBase, perform_recv, perform_accept, perform_send, \
                                 perform_sendall, perform_sendfile, \
-                                perform_connect
+                                perform_connect, perform_readable, \
+                                perform_recvfrom, perform_recvmany, \
+                                perform_splice_in, perform_recv_to_file
 
 
 class StdlibKQueueProactor(ProactorBase):
@@ -23,6 +25,9 @@ class StdlibKQueueProactor(ProactorBase):
         self.default_size = default_size
         self.shadow = {}
 
+    def fileno(self):
+        return self.kq.fileno()
+
     def unregister_fd(self, act, fd=None):
         fileno = fd or act.sock.fileno()
         try:
@@ -41,7 +46,12 @@ class StdlibKQueueProactor(ProactorBase):
         fileno = act.sock.fileno()
         self.shadow[fileno] = act
         act.flags = flag = KQ_FILTER_READ if performer == perform_recv \
-                or performer == perform_accept else KQ_FILTER_WRITE
+                or performer == perform_accept \
+                or performer == perform_readable \
+                or performer == perform_recvfrom \
+                or performer == perform_recvmany \
+                or performer == perform_splice_in \
+                or performer == perform_recv_to_file else KQ_FILTER_WRITE
         ev = kevent(fileno, flag, KQ_EV_ADD | KQ_EV_ONESHOT)
         self.kcontrol((ev,), 0)
 
@@ -139,3 +139,10 @@ class PublishSubscribeQueue:
             level = len(self.messages)
             del self.messages[:]
             return level
+
+    def compact_every(self, sched, interval):
+        """Compacts the queue every `interval` (a timedelta or number of
+        seconds) with a timer in the `sched` scheduler. Returns the
+        :class:`cogen.core.events.Timer` - cancel it when the queue isn't used
+        anymore."""
+        return sched.call_every(interval, self.compact)
@@ -25,11 +25,13 @@ class QGet(events.TimedOperation):
 
     def finalize(self, sched):
         super(QGet, self).finalize(sched)
+        self.caller = None
         return self.result
 
     def cleanup(self, sched, coro):
         if self.waiting:
             self.queue.waiting_gets.remove(self)
+            self.caller = None
             return True
 
     def process(self, sched, coro):
@@ -81,9 +83,15 @@ class QPut(events.TimedOperation):
         self.caller = None
         self.waiting = False
 
+    def finalize(self, sched):
+        super(QPut, self).finalize(sched)
+        self.caller = None
+        return self
+
     def cleanup(self, sched, coro):
         if self.waiting:
             self.queue.waiting_puts.remove(self)
+            self.caller = None
             return True
 
     def process(self, sched, coro):
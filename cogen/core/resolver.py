@@ -0,0 +1,343 @@
+"""
+Non-blocking name resolution.
+
+Hostnames are resolved with DNS queries over a non-blocking UDP socket (the
+nameservers are taken from /etc/resolv.conf), after looking in the hosts
+file. If the nameservers can't be reached (or they give a error) the system's
+`getaddrinfo` is called in a small thread pool.
+
+The results are kept in a LRU cache for the TTL from the DNS answer (clamped
+between `min_ttl` and `max_ttl`, `fallback_ttl` is used for the hosts file and
+`getaddrinfo` results).
+
+Usage:
+
+.. sourcecode:: python
+
+    addresses = yield resolver.Resolve('example.com', 80)
+    # eg: [('93.184.216.34', 80)]
+
+:meth:`cogen.core.sockets.Socket.connect` uses this for hostnames.
+"""
+from __future__ import absolute_import
+
+__all__ = ['Resolver', 'Resolve', 'ResolveError', 'getresolver',
+           'setresolver']
+
+import collections
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+import Queue
+
+from cogen.core import events, sockets
+from cogen.core.sockets import is_address
+from cogen.core.coroutines import coroutine
+
+QTYPES = {socket.AF_INET: 1, socket.AF_INET6: 28}
+
+class ResolveError(socket.gaierror):
+    "Raised when a host can't be resolved."
+
+def read_nameservers(path='/etc/resolv.conf'):
+    """Returns the nameserver addresses from a resolv.conf file."""
+    nameservers = []
+    try:
+        for line in open(path):
+            parts = line.split()
+            if len(parts) > 1 and parts[0] == 'nameserver':
+                nameservers.append(parts[1])
+    except IOError:
+        pass
+    return nameservers
+
+def read_hosts(path='/etc/hosts'):
+    """Returns a {(name, family): [address, ...]} dict from a hosts file."""
+    hosts = {}
+    try:
+        for line in open(path):
+            parts = line.split('#', 1)[0].split()
+            if len(parts) < 2:
+                continue
+            family = ':' in parts[0] and socket.AF_INET6 or socket.AF_INET
+            for name in parts[1:]:
+                addresses = hosts.setdefault((name.lower(), family), [])
+                if parts[0] not in addresses:
+                    addresses.append(parts[0])
+    except IOError:
+        pass
+    return hosts
+
+def sockaddr(address, port, family):
+    if family == socket.AF_INET6:
+        return address, port, 0, 0
+    return address, port
+
+def build_query(qid, host, qtype):
+    """Returns a DNS query packet (recursion desired) for `host`."""
+    if isinstance(host, unicode):
+        host = host.encode('idna')
+    return struct.pack('!6H', qid, 0x0100, 1, 0, 0, 0) + ''.join(
+        chr(len(label)) + label for label in host.rstrip('.').split('.')
+    ) + struct.pack('!BHH', 0, qtype, 1)
+
+def skip_name(data, offset):
+    while True:
+        length = ord(data[offset])
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += length + 1
+        if not length:
+            return offset
+
+def parse_response(data, qid, family):
+    """Returns the ([address, ...], ttl) from a DNS response or None if the
+    response isn't for the `qid` query. Raises ResolveError if the response
+    is a error."""
+    try:
+        rid, flags, qdcount, ancount, nscount, arcount = \
+                                        struct.unpack('!6H', data[:12])
+    except struct.error:
+        return
+    if rid != qid or not flags & 0x8000:
+        return
+    rcode = flags & 0xF
+    if rcode == 3:
+        raise ResolveError(socket.EAI_NONAME, "Name or service not known")
+    elif rcode:
+        raise ResolveError(socket.EAI_FAIL,
+                           "Nameserver error (rcode %s)" % rcode)
+    try:
+        offset = 12
+        for i in xrange(qdcount):
+            offset = skip_name(data, offset) + 4
+        addresses = []
+        ttl = None
+        for i in xrange(ancount):
+            offset = skip_name(data, offset)
+            rtype, rclass, rttl, rdlength = struct.unpack('!HHIH',
+                                                    data[offset:offset+10])
+            offset += 10
+            if rtype == QTYPES[family] and rclass == 1:
+                addresses.append(socket.inet_ntop(family,
+                                            data[offset:offset+rdlength]))
+                ttl = rttl if ttl is None else min(ttl, rttl)
+            offset += rdlength
+    except (struct.error, IndexError, ValueError, socket.error):
+        raise ResolveError(socket.EAI_FAIL, "Malformed DNS response")
+    if not addresses and flags & 0x0200:
+        raise ResolveError(socket.EAI_FAIL, "Truncated DNS response")
+    return addresses, ttl or 0
+
+class Resolver(object):
+    """
+    A caching resolver. Options:
+
+    * nameservers - a list of addresses (or (address, port) tuples) of DNS
+      servers, by default the ones in /etc/resolv.conf
+    * timeout - seconds to wait for a answer from a nameserver
+    * tries - how many times the nameservers are tried
+    * cache_size - the number of cached (host, family) results
+    * min_ttl, max_ttl - the cache ttl is clamped between these
+    * fallback - use `getaddrinfo` (in a thread) if the nameservers fail
+    * fallback_ttl - the cache ttl for hosts file and `getaddrinfo` results
+    * hosts - the path of the hosts file (None - don't use one)
+    * threads - the maximum number of threads for `getaddrinfo`
+
+    The cache `hits`, `misses`, the DNS `queries` and the `fallbacks` to
+    `getaddrinfo` are counted in `stats`.
+    """
+    def __init__(self, nameservers=None, timeout=2, tries=2, cache_size=512,
+                 min_ttl=0, max_ttl=3600, fallback=True, fallback_ttl=60,
+                 hosts='/etc/hosts', threads=4):
+        if nameservers is None:
+            nameservers = read_nameservers() or ['127.0.0.1']
+        self.nameservers = [
+            isinstance(server, tuple) and server or (server, 53)
+            for server in nameservers
+        ]
+        self.timeout = timeout
+        self.tries = tries
+        self.cache_size = cache_size
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.fallback = fallback
+        self.fallback_ttl = fallback_ttl
+        self.hosts = hosts and read_hosts(hosts) or {}
+        self.threads = threads
+        self.workers = []
+        self.jobs = Queue.Queue()
+        self.cache = collections.OrderedDict()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'queries': 0,
+            'fallbacks': 0,
+        }
+
+    def lookup(self, host, family):
+        """Returns the cached addresses for `host` or None."""
+        key = host, family
+        entry = self.cache.pop(key, None)
+        if entry is None:
+            return
+        expires, addresses = entry
+        if expires < time.time():
+            return
+        # move it to the most recently used end
+        self.cache[key] = entry
+        return addresses
+
+    def store(self, host, family, addresses, ttl):
+        """Caches the `addresses` for `ttl` seconds (clamped between
+        `min_ttl` and `max_ttl`)."""
+        ttl = min(max(ttl, self.min_ttl), self.max_ttl)
+        if ttl <= 0 or not self.cache_size:
+            return
+        self.cache.pop((host, family), None)
+        while len(self.cache) >= self.cache_size:
+            self.cache.popitem(last=False)
+        self.cache[host, family] = time.time() + ttl, addresses
+
+    @coroutine
+    def resolve(self, host, port=0, family=socket.AF_INET):
+        """Returns a list of socket addresses (eg: ``(ip, port)``) for `host`.
+        Raises ResolveError if the host can't be resolved."""
+        if is_address(host, family):
+            raise StopIteration([sockaddr(host, port, family)])
+        host = host.lower()
+        addresses = self.lookup(host, family)
+        if addresses is None:
+            self.stats['misses'] += 1
+            addresses = self.hosts.get((host, family))
+            if addresses:
+                ttl = self.fallback_ttl
+            else:
+                try:
+                    addresses, ttl = yield self.query(host, family)
+                except ResolveError, exc:
+                    if not self.fallback or exc.args[0] == socket.EAI_NONAME:
+                        raise
+                    self.stats['fallbacks'] += 1
+                    addresses = yield self.getaddrinfo(host, family)
+                    ttl = self.fallback_ttl
+                if not addresses:
+                    raise ResolveError(socket.EAI_NODATA,
+                        "No address associated with hostname")
+            self.store(host, family, addresses, ttl)
+        else:
+            self.stats['hits'] += 1
+        raise StopIteration([sockaddr(address, port, family)
+                                for address in addresses])
+
+    @coroutine
+    def query(self, host, family):
+        """Queries the nameservers and returns a ([address, ...], ttl)
+        tuple."""
+        error = ResolveError(socket.EAI_AGAIN,
+                             "Temporary failure in name resolution")
+        for attempt in xrange(self.tries):
+            for server in self.nameservers:
+                qid = random.randint(0, 0xFFFF)
+                packet = build_query(qid, host, QTYPES[family])
+                sock = sockets.Socket(
+                    is_address(server[0], socket.AF_INET6) and
+                        socket.AF_INET6 or socket.AF_INET,
+                    socket.SOCK_DGRAM
+                )
+                sock.settimeout(self.timeout)
+                self.stats['queries'] += 1
+                try:
+                    yield sock.connect(server)
+                    yield sock.send(packet)
+                    while True:
+                        data = yield sock.recv(512)
+                        result = parse_response(data, qid, family)
+                        if result is not None:
+                            raise StopIteration(result)
+                except (events.OperationTimeout, sockets.SocketError):
+                    continue
+                except ResolveError, exc:
+                    if exc.args[0] == socket.EAI_NONAME:
+                        raise
+                    error = exc
+                finally:
+                    sock.close()
+        raise error
+
+    def work(self):
+        while True:
+            job, wakeup = self.jobs.get()
+            try:
+                job.append(socket.getaddrinfo(*job.pop()))
+            except:
+                job.append(sys.exc_info()[1])
+            wakeup.send('.')
+
+    @coroutine
+    def getaddrinfo(self, host, family):
+        """Calls the system's getaddrinfo in a thread and returns a list of
+        addresses."""
+        reader, wakeup = socket.socketpair()
+        reader = sockets.Socket(_sock=reader)
+        # the thread always wakes us up, no timeout
+        reader.settimeout(-1)
+        job = [(host, None, family, socket.SOCK_STREAM)]
+        if len(self.workers) < self.threads:
+            worker = threading.Thread(target=self.work)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+        self.jobs.put((job, wakeup))
+        try:
+            yield reader.recv(1)
+        finally:
+            reader.close()
+            wakeup.close()
+        result = job.pop()
+        if isinstance(result, socket.gaierror):
+            raise ResolveError(*result.args)
+        elif isinstance(result, Exception):
+            raise ResolveError(socket.EAI_FAIL, str(result))
+        addresses = []
+        for info in result:
+            if info[4][0] not in addresses:
+                addresses.append(info[4][0])
+        raise StopIteration(addresses)
+
+_resolver = None
+
+def getresolver():
+    """Returns the resolver used by :func:`Resolve` (a :class:`Resolver`
+    with the default options is made on the first call)."""
+    global _resolver
+    if _resolver is None:
+        _resolver = Resolver()
+    return _resolver
+
+def setresolver(resolver):
+    """Sets the resolver used by :func:`Resolve` and
+    :meth:`cogen.core.sockets.Socket.connect`."""
+    global _resolver
+    _resolver = resolver
+
+def Resolve(host, port=0, family=socket.AF_INET):
+    """
+    A operation that resolves `host` (with :func:`getresolver`) and returns
+    a list of socket addresses. Example:
+
+    .. sourcecode:: python
+
+        addresses = yield resolver.Resolve('example.com', 80)
+    """
+    return getresolver().resolve(host, port, family)
+
+@coroutine
+def connect(sock, address, **kws):
+    """Resolves the host in `address` and connects `sock` to the first
+    address."""
+    addresses = yield Resolve(address[0], address[1], sock._fd.family)
+    raise StopIteration((yield sockets.Connect(sock, addresses[0], **kws)))
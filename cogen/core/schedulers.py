@@ -21,13 +21,17 @@ import datetime
 import heapq
 #~ import weakref
 import sys
+import os
+import gc
+import time
 import errno
 import select
+import traceback
 
 from cogen.core.proactors import DefaultProactor
 from cogen.core import events
 from cogen.core.util import priority
-from cogen.core.coroutines import CoroutineException
+from cogen.core.coroutines import CoroutineException, CoroutineInstance
 #~ getnow = debug(0)(datetime.datetime.now)
 getnow = datetime.datetime.now
 
@@ -50,17 +54,54 @@ class Scheduler(object):
     * default_timeout: a default timedelta or number of seconds to wait for
       the operation, -1 means no timeout.
 
+    * timer_slack: a timedelta or number of seconds, timeouts are rounded up
+      to a multiple of this so timeouts that expire close to each other are
+      handled in the same pass (and the proactor wakes up less often).
+      Operations can override this with their own `slack`. None or 0 means
+      no rounding.
+
+    * policy: a callable that takes the scheduler and returns the run queue
+      for the active coroutines (check :mod:`cogen.core.policies`). None
+      means a plain deque (FIFO).
+
+    * budget_steps, budget_usec: a per-iteration budget for the main loop, as
+      a number of steps (coroutine runs) or microseconds. When set, the loop
+      runs active coroutines till the budget is exhausted and then polls the
+      proactor (with a zero timeout if there are still active coroutines) -
+      proactor_greedy doesn't apply. The number of budgeted batches and how
+      many of them hit the budget are counted in :attr:`stats`.
+
+    * adaptive: a callable that takes the scheduler and returns a tuner that
+      sets proactor_greedy, ops_greedy and proactor_multiplex_first at
+      runtime (check :mod:`cogen.core.tuning`). None means the knobs stay as
+      they are set.
+
+    * idle_threshold: a timedelta or number of seconds, the idle hooks (see
+      :meth:`add_idle_hook`) are run before the proactor waits for events if
+      there aren't any active coroutines and the next timeout is at least
+      this far away.
+
+    * idle_gc: if True python's automatic garbage collection is disabled while
+      the scheduler runs and the collections are made from a idle hook (see
+      :meth:`collect_garbage`). The number of collections and the pause times
+      are in :attr:`stats`.
+
     """
     def __init__(self, proactor=DefaultProactor, default_priority=priority.LAST,
             default_timeout=None, proactor_resolution=.01, proactor_greedy=True,
             ops_greedy=False, proactor_multiplex_first=None,
-            proactor_default_size=None):
+            proactor_default_size=None, timer_slack=None, policy=None,
+            budget_steps=None, budget_usec=None, adaptive=None,
+            idle_threshold=.01, idle_gc=False):
 
         if not callable(proactor):
             raise RuntimeError("Invalid proactor constructor")
         self.timeouts = []
-        self.active = collections.deque()
-        self.sigwait = collections.defaultdict(collections.deque)
+        if policy is None:
+            self.active = collections.deque()
+        else:
+            self.active = policy(self)
+        self.sigwait = collections.defaultdict(events.WaitList)
         self.signals = collections.defaultdict(collections.deque)
         proactor_options = {}
         if proactor_multiplex_first is not None:
@@ -71,9 +112,37 @@ class Scheduler(object):
 
         self.default_priority = default_priority
         self.default_timeout = default_timeout
+        self.timer_slack = timer_slack
         self.running = False
+        self.wakeup_fds = None
         self.proactor_greedy = proactor_greedy
         self.ops_greedy = ops_greedy
+        self.budget_steps = budget_steps
+        self.budget_usec = budget_usec
+        self.stats = {
+            'budget_batches': 0,
+            'budget_step_hits': 0,
+            'budget_time_hits': 0,
+            'idle_runs': 0,
+        }
+        if adaptive is None:
+            self.tuner = None
+        else:
+            self.tuner = adaptive(self)
+        if not isinstance(idle_threshold, datetime.timedelta):
+            idle_threshold = datetime.timedelta(seconds=idle_threshold)
+        self.idle_threshold = idle_threshold
+        self.idle_hooks = []
+        self.idle_gc = idle_gc
+        self.gc_was_enabled = None
+        if idle_gc:
+            self.stats.update(
+                gc_collections = 0,
+                gc_forced = 0,
+                gc_pause_total = 0.0,
+                gc_pause_max = 0.0,
+            )
+            self.add_idle_hook(self.collect_garbage)
     def __repr__(self):
         return "<%s@0x%X active:%s sigwait:%s timeouts:%s proactor:%s default_priority:%s default_timeout:%s>" % (
             self.__class__.__name__,
@@ -97,6 +166,98 @@ class Scheduler(object):
             self.active.appendleft( (None, coro) )
         return coro
 
+    def call_at(self, when, callback, *args, **kws):
+        """Calls `callback` with `args` at the `when` datetime, right from
+        the scheduler's loop (not in a coroutine). Returns a
+        :class:`cogen.core.events.Timer` that can be cancelled.
+
+        The `slack` keyword argument overrides the scheduler's timer_slack."""
+        return events.Timer(when, callback, args, **kws).schedule(self)
+
+    def call_later(self, delay, callback, *args, **kws):
+        """Like :meth:`call_at` but the callback is called after `delay` (a
+        timedelta or number of seconds)."""
+        if not isinstance(delay, datetime.timedelta):
+            delay = datetime.timedelta(seconds=delay)
+        return events.Timer(getnow() + delay, callback, args, **kws
+                            ).schedule(self)
+
+    def call_every(self, interval, callback, *args, **kws):
+        """Calls `callback` with `args` every `interval` (a timedelta or number
+        of seconds), the first call is after a interval. Returns a
+        :class:`cogen.core.events.Timer` - the scheduler keeps running while
+        there are periodic timers so cancel it when it's not needed
+        anymore."""
+        if not isinstance(interval, datetime.timedelta):
+            interval = datetime.timedelta(seconds=interval)
+        return events.Timer(getnow() + interval, callback, args, interval,
+                            **kws).schedule(self)
+
+    def add_idle_hook(self, hook):
+        """Adds a callable to be called (without arguments) when the scheduler
+        is idle (check `idle_threshold`). The hooks should do a small piece of
+        work every time, errors are printed."""
+        self.idle_hooks.append(hook)
+
+    def remove_idle_hook(self, hook):
+        self.idle_hooks.remove(hook)
+
+    def run_idle_hooks(self):
+        """Runs the idle hooks if the scheduler is idle: nothing is active and
+        the next timeout isn't closer than `idle_threshold`."""
+        if self.active:
+            return
+        delta = self.next_timer_delta()
+        if delta is not None and (not delta or delta < self.idle_threshold):
+            return
+        self.stats['idle_runs'] += 1
+        for hook in list(self.idle_hooks):
+            try:
+                hook()
+            except:
+                traceback.print_exc()
+
+    def disable_gc(self):
+        """Turns python's automatic garbage collection off (for `idle_gc`)
+        while the scheduler runs. See :meth:`restore_gc`."""
+        if self.gc_was_enabled is None:
+            self.gc_was_enabled = gc.isenabled()
+        gc.disable()
+
+    def restore_gc(self):
+        "Turns the automatic garbage collection back on if it was on."
+        if self.gc_was_enabled:
+            gc.enable()
+        self.gc_was_enabled = None
+
+    def collect_garbage(self, force=False):
+        """
+        The idle hook for `idle_gc`: makes the collection python's gc would
+        have made by now - the oldest generation that's over it's threshold
+        (check :func:`gc.get_threshold`) - and records the pause time.
+
+        The main loop calls it with `force` if the youngest generation gets
+        way over it's threshold (the scheduler wasn't idle for a long time).
+        """
+        counts = gc.get_count()
+        thresholds = gc.get_threshold()
+        for generation in (2, 1, 0):
+            if thresholds[generation] and \
+                    counts[generation] > thresholds[generation]:
+                break
+        else:
+            return
+        stats = self.stats
+        start = time.time()
+        gc.collect(generation)
+        pause = time.time() - start
+        stats['gc_collections'] += 1
+        if force:
+            stats['gc_forced'] += 1
+        stats['gc_pause_total'] += pause
+        if pause > stats['gc_pause_max']:
+            stats['gc_pause_max'] = pause
+
     def next_timer_delta(self):
         "Returns a timevalue that the proactor will wait on."
         if self.timeouts and not self.active:
@@ -129,6 +290,8 @@ class Scheduler(object):
           timeout we push it back in the heapq with a timeout value we'll check
           it again
 
+        Callback timers (:class:`cogen.core.events.Timer`) are just run.
+
         Also, we call a cleanup on the op, only if cleanup return true we raise
         the timeout (finalized isn't enough to check if the op has completed
         since finalized is set when the operation gets back in the coro - and
@@ -139,18 +302,23 @@ class Scheduler(object):
         #~ print '>to:', self.timeouts, self.timeouts and self.timeouts[0].timeout <= now
         while self.timeouts and self.timeouts[0].timeout <= now:
             op = heapq.heappop(self.timeouts)
+            if isinstance(op, events.Timer):
+                op.run(self)
+                continue
 
             coro = op.coro
             if op.weak_timeout and hasattr(op, 'last_update'):
                 if op.last_update > op.last_checkpoint:
                     op.last_checkpoint = op.last_update
                     op.timeout = op.last_checkpoint + op.delta
+                    if op.slack:
+                        op.timeout = events.coalesce(op.timeout, op.slack)
                     heapq.heappush(self.timeouts, op)
                     continue
 
             if op.state is events.RUNNING and coro and coro.running and \
                                                     op.cleanup(self, coro):
-
+                op.coro = None
                 self.active.append((
                     CoroutineException(
                         events.OperationTimeout,
@@ -175,6 +343,84 @@ class Scheduler(object):
             return result
         return None, None
 
+    def run_coro(self, op, coro):
+        """Run the (op, coro) pair and keep running the resulting pairs till
+        the coroutine gets suspended.
+
+        Calls and returns between coroutines are trampolined here: a called
+        coroutine is started right away (without a trip through the active
+        queue) and a finished coroutine resumes it's caller directly. This
+        mirrors what :meth:`CoroutineInstance.process` does, anything else
+        goes through :meth:`process_op`.
+        """
+        started = False
+        while True:
+            rop = coro.run_op(op, self)
+            if rop is None:
+                if started:
+                    # the called coroutine has just created it's generator
+                    started = False
+                    continue
+            elif isinstance(rop, CoroutineInstance):
+                state = rop.state
+                if state == rop.STATE_NEED_INIT and rop is not coro:
+                    rop.caller = coro
+                    if coro.debug:
+                        rop.debug = True
+                    op, coro = None, rop
+                    started = True
+                    continue
+                elif rop is coro and rop.caller and \
+                        (state == rop.STATE_COMPLETED or
+                         state == rop.STATE_FAILED):
+                    if rop.waiters:
+                        if self.default_priority:
+                            self.active.extendleft(rop.waiters)
+                        else:
+                            self.active.extend(rop.waiters)
+                        rop.waiters = None
+                    coro = rop.caller
+                    rop.caller = None
+                    if rop.exception:
+                        op = CoroutineException(*rop.exception)
+                    else:
+                        op = rop
+                    started = False
+                    continue
+            started = False
+            op, coro = self.process_op(rop, coro)
+            if not op and not coro:
+                break
+
+    def run_batch(self, urgent=None):
+        """
+        Runs the `urgent` pair and then active coroutines till the active
+        queue is empty or the budget (`budget_steps`, `budget_usec`) is
+        exhausted. Returns True if the budget was hit.
+        """
+        active = self.active
+        steps = self.budget_steps
+        usec = self.budget_usec
+        stats = self.stats
+        stats['budget_batches'] += 1
+        if usec:
+            deadline = time.time() + usec / 1000000.0
+        done = 0
+        if urgent:
+            self.run_coro(*urgent)
+            done = 1
+        while active:
+            if steps and done >= steps:
+                stats['budget_step_hits'] += 1
+                return True
+            if usec and time.time() >= deadline:
+                stats['budget_time_hits'] += 1
+                return True
+            op, coro = active.popleft()
+            self.run_coro(op, coro)
+            done += 1
+        return False
+
     def iter_run(self):
         """
         The actual processing for the main loop is here.
@@ -186,30 +432,162 @@ class Scheduler(object):
         """
         self.running = True
         urgent = None
-        while self.running and (self.active or self.proactor or self.timeouts or urgent):
-            if self.active or urgent:
-                op, coro = urgent or self.active.popleft()
-                urgent = None
-                while True:
-                    op, coro = self.process_op(coro.run_op(op, self), coro)
-                    if not op and not coro:
-                        break
-
-            if (self.proactor_greedy or not self.active) and self.proactor:
+        budgeted = self.budget_steps or self.budget_usec
+        tuner = self.tuner
+        if self.idle_gc:
+            self.disable_gc()
+            gc_limit = gc.get_threshold()[0] * 10
+        else:
+            gc_limit = None
+        try:
+            while self.running and (self.active or self.proactor or self.timeouts or urgent):
+                if budgeted:
+                    if self.active or urgent:
+                        self.run_batch(urgent)
+                        urgent = None
+                elif self.active or urgent:
+                    op, coro = urgent or self.active.popleft()
+                    urgent = None
+                    self.run_coro(op, coro)
+
+                polled = (budgeted or self.proactor_greedy or not self.active) and \
+                        self.proactor
+                if polled:
+                    if self.idle_hooks and not self.active:
+                        self.run_idle_hooks()
+                    try:
+                        urgent = self.proactor.run(timeout = self.next_timer_delta())
+                    except (OSError, select.error, IOError), exc:
+                        if exc[0] != errno.EINTR:
+                            raise
+                    #~ if urgent:print '>urgent:', urgent
+                if tuner:
+                    tuner.sample(polled)
+                if gc_limit and gc.get_count()[0] > gc_limit:
+                    self.collect_garbage(force=True)
+                if self.timeouts:
+                    self.handle_timeouts()
+                yield
+                # this could had beed a ordinary function and have the run() call
+                #this repeatedly but the _urgent_ operation this is usefull (as it
+                #saves us needlessly hammering the active coroutines queue with
+                #append and pop calls on the same thing
+        finally:
+            # also when the loop is left with a exception
+            if self.idle_gc:
+                self.restore_gc()
+        self.cleanup()
+
+    def run_once(self, timeout=0):
+        """
+        Runs one iteration of the main loop - use this to drive the scheduler
+        from a foreign event loop (together with :meth:`fileno` and
+        :meth:`next_deadline`).
+
+        Runs the coroutines that are active when called, runs the proactor
+        (waiting at most `timeout` - a timedelta or number of seconds, None
+        for no limit other than the next timer and the proactor's resolution -
+        if there isn't anything active) and handles the expired timeouts.
+
+        Returns True if there is still something to run.
+        """
+        if self.idle_gc:
+            self.disable_gc()
+        try:
+            if self.wakeup_fds:
+                try:
+                    while os.read(self.wakeup_fds[0], 4096):
+                        pass
+                except OSError, exc:
+                    if exc[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        raise
+            active = self.active
+            for _ in xrange(len(active)):
+                if not active:
+                    break
+                op, coro = active.popleft()
+                self.run_coro(op, coro)
+            if self.proactor:
+                if active:
+                    wait = 0
+                else:
+                    if self.idle_hooks:
+                        self.run_idle_hooks()
+                    wait = self.next_timer_delta()
+                    if timeout is not None:
+                        if not isinstance(timeout, datetime.timedelta):
+                            timeout = datetime.timedelta(seconds=timeout)
+                        if wait is None or (wait and timeout < wait):
+                            wait = timeout
                 try:
-                    urgent = self.proactor.run(timeout = self.next_timer_delta())
+                    urgent = self.proactor.run(timeout=wait)
                 except (OSError, select.error, IOError), exc:
                     if exc[0] != errno.EINTR:
                         raise
-                #~ if urgent:print '>urgent:', urgent
+                else:
+                    if urgent:
+                        self.run_coro(*urgent)
+                if self.tuner:
+                    self.tuner.sample(True)
             if self.timeouts:
                 self.handle_timeouts()
-            yield
-            # this could had beed a ordinary function and have the run() call
-            #this repeatedly but the _urgent_ operation this is usefull (as it
-            #saves us needlessly hammering the active coroutines queue with
-            #append and pop calls on the same thing
-        self.cleanup()
+        finally:
+            if self.idle_gc:
+                self.restore_gc()
+        return bool(self.active or self.proactor or self.timeouts)
+
+    def fileno(self):
+        """
+        Returns a descriptor for a foreign event loop to watch: when it's
+        readable :meth:`run_once` has work to do.
+
+        This is the proactor's descriptor (epoll or kqueue). If the proactor
+        doesn't have one (select, poll, iocp) this is the read end of a pipe
+        that only becomes readable when :meth:`wakeup` is called - the
+        foreign loop has to call :meth:`run_once` at :meth:`next_deadline`
+        in that case.
+        """
+        fileno = self.proactor.fileno()
+        if fileno is None:
+            if self.wakeup_fds is None:
+                import fcntl
+                self.wakeup_fds = os.pipe()
+                for fd in self.wakeup_fds:
+                    fcntl.fcntl(fd, fcntl.F_SETFL,
+                        fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+            fileno = self.wakeup_fds[0]
+        return fileno
+
+    def wakeup(self):
+        """Makes the :meth:`fileno` pipe readable (only for proactors that
+        don't have their own descriptor). Can be called from other threads."""
+        if self.wakeup_fds:
+            try:
+                os.write(self.wakeup_fds[1], '.')
+            except OSError, exc:
+                if exc[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+
+    def next_deadline(self):
+        """
+        Returns the datetime when :meth:`run_once` should be called even if
+        the :meth:`fileno` descriptor isn't readable: now if there are active
+        coroutines, the earliest timeout or None if there's nothing to wait
+        for.
+
+        If the proactor doesn't have it's own descriptor and there are pending
+        socket operations the deadline is at most `proactor_resolution` away.
+        """
+        now = getnow()
+        if self.active:
+            return now
+        deadline = self.timeouts and self.timeouts[0].timeout or None
+        if self.proactor and self.proactor.fileno() is None:
+            poll_deadline = now + datetime.timedelta(
+                                        seconds=self.proactor.resolution)
+            if deadline is None or poll_deadline < deadline:
+                deadline = poll_deadline
+        return deadline
 
     def run(self):
         """This is the main loop.
@@ -237,3 +615,8 @@ class Scheduler(object):
                 del self.proactor.scheduler
             if hasattr(self.proactor, 'close'):
                 self.proactor.close()
+        if self.wakeup_fds:
+            for fd in self.wakeup_fds:
+                os.close(fd)
+            self.wakeup_fds = None
+        self.restore_gc()
@@ -0,0 +1,177 @@
+"""
+Single-flight calls: concurrent calls with the same key share one run of the
+coroutine.
+
+The first caller for a key starts the call (in a new coroutine, so the call
+finishes even if the first caller goes away) and the other callers for that
+key wait (:class:`cogen.core.events.WaitForSignal`) till it's done. All of
+them get its result - or the exception it raised.
+
+With `cache_ttl` the result is also kept for that many seconds: calls in that
+time get it right away (exceptions aren't kept, nor the results `cacheable`
+rejects).
+
+Usage:
+
+.. sourcecode:: python
+
+    @singleflight(cache_ttl=1)
+    @coroutine
+    def get_user(user_id):
+        ...
+        raise StopIteration(user)
+
+    user = yield get_user(123)
+
+    # or
+    group = SingleFlight()
+    user = yield group.do(('user', 123), get_user, 123)
+
+See :class:`cogen.web.coalesce.CoalescingMiddleware` for identical
+concurrent requests.
+"""
+__all__ = ['SingleFlight', 'singleflight']
+
+import collections
+import functools
+import sys
+import time
+
+import events
+from coroutines import coroutine
+from util import priority
+
+
+class Flight(object):
+    "A call in progress."
+    __slots__ = ('key', 'waiters', 'outcome')
+
+    def __init__(self, key):
+        self.key = key
+        self.waiters = 0
+        self.outcome = None
+
+    def __repr__(self):
+        return "<%s@%X key:%r waiters:%s>" % (
+            self.__class__.__name__,
+            id(self),
+            self.key,
+            self.waiters
+        )
+
+class SingleFlight(object):
+    """
+    Options:
+
+    * cache_ttl - seconds a result is kept after the call (0 - not kept)
+    * cache_size - the maximum number of kept results
+    * cacheable - a function that gets the result and returns False if it
+      shouldn't be kept
+
+    The `calls` (actual runs), the `shared` calls (that waited for a call in
+    progress) and the cache `hits` are counted in `stats`.
+    """
+    def __init__(self, cache_ttl=0, cache_size=1024, cacheable=None):
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.cacheable = cacheable
+        self.flights = {}
+        self.results = collections.OrderedDict()
+        self.stats = {
+            'calls': 0,
+            'shared': 0,
+            'hits': 0,
+        }
+
+    def __repr__(self):
+        return "<%s@%X flights:%s results:%s>" % (
+            self.__class__.__name__,
+            id(self),
+            len(self.flights),
+            len(self.results)
+        )
+
+    @coroutine
+    def do(self, key, func, *args, **kwargs):
+        """Returns the result of ``func(*args, **kwargs)`` (a coroutine) or
+        of the call in progress for `key`. Raises what the call raised."""
+        if self.cache_ttl:
+            cached = self.results.get(key)
+            if cached is not None:
+                expires, result = cached
+                if expires > time.time():
+                    self.stats['hits'] += 1
+                    raise StopIteration(result)
+                del self.results[key]
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = self.flights[key] = Flight(key)
+            self.stats['calls'] += 1
+            yield events.AddCoro(self.run, args=(flight, func, args, kwargs),
+                                 prio=priority.CORO)
+        else:
+            self.stats['shared'] += 1
+        if flight.outcome is None:
+            flight.waiters += 1
+            outcome = yield events.WaitForSignal(flight, timeout=-1)
+        else:
+            outcome = flight.outcome
+        success, value = outcome
+        if success:
+            raise StopIteration(value)
+        raise value[0], value[1], value[2]
+
+    @coroutine
+    def run(self, flight, func, args, kwargs):
+        "Makes the call and signals the waiters."
+        try:
+            result = yield func(*args, **kwargs)
+        except (KeyboardInterrupt, SystemExit, GeneratorExit):
+            raise
+        except:
+            flight.outcome = False, sys.exc_info()
+        else:
+            flight.outcome = True, result
+            if self.cache_ttl and (self.cacheable is None or
+                                   self.cacheable(result)):
+                self.store(flight.key, result)
+        finally:
+            if self.flights.get(flight.key) is flight:
+                del self.flights[flight.key]
+        if flight.waiters:
+            yield events.Signal(flight, flight.outcome)
+
+    def store(self, key, result):
+        results = self.results
+        results.pop(key, None)
+        results[key] = time.time() + self.cache_ttl, result
+        if len(results) > self.cache_size:
+            # drop the expired ones, and the oldest if that's not enough
+            now = time.time()
+            for old_key, (expires, _) in results.items():
+                if expires <= now:
+                    del results[old_key]
+            while len(results) > self.cache_size:
+                results.popitem(last=False)
+
+    def forget(self, key):
+        """Drops the kept result for `key` - the next call runs again (a call
+        in progress is still shared)."""
+        self.results.pop(key, None)
+
+def default_key(*args, **kwargs):
+    return args, tuple(sorted(kwargs.iteritems()))
+
+def singleflight(key=default_key, cache_ttl=0, cache_size=1024):
+    """A decorator for coroutines: concurrent calls with the same `key` (a
+    function of the call's arguments, all the arguments by default) share one
+    call. The :class:`SingleFlight` is in the wrapper's `group`
+    attribute."""
+    def decorator(func):
+        group = SingleFlight(cache_ttl, cache_size)
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return group.do(key(*args, **kwargs), func, *args, **kwargs)
+        wrapper.group = group
+        return wrapper
+    return decorator
@@ -7,17 +7,30 @@ the :class:`~cogen.core.sockets.Socket` class.
 #TODO: how to deal with requets that have unicode params
 
 __all__ = [
-    'getdefaulttimeout', 'setdefaulttimeout', 'Socket', 'SendFile', 'Recv',
+    'getdefaulttimeout', 'setdefaulttimeout', 'getreuseops', 'setreuseops',
+    'Socket', 'SendFile', 'Recv', 'Park',
     'Send', 'SendAll','Accept','Connect',
+    'RecvFrom', 'SendTo', 'RecvMany', 'SendMany',
+    'SpliceIn', 'SpliceOut', 'Splice', 'proxy', 'RecvToFile',
     'SocketOperation', 'SocketError', 'ConnectionClosed'
 ]
 
-from socket import socket as stdsocket, AF_INET, SOCK_STREAM
+from socket import socket as stdsocket, AF_INET, SOCK_STREAM, inet_pton, \
+                   error as soerror, SHUT_WR, SHUT_RDWR, fromfd, \
+                   SOL_SOCKET, SO_SNDBUF, IPPROTO_TCP
+try:
+    from socket import TCP_CORK
+except ImportError:
+    TCP_CORK = None
 
 import events
+import splice
 from coroutines import coro
+from util import priority
 
 _TIMEOUT = None
+_REUSE_OPS = False
+_FREELIST_SIZE = 256
 
 
 class SocketError(Exception):
@@ -37,6 +50,38 @@ def setdefaulttimeout(timeout):
     global _TIMEOUT
     _TIMEOUT = timeout
 
+def is_address(host, family=AF_INET):
+    """Returns True if `host` is a address (not a name that needs to be
+    resolved) for the `family`."""
+    try:
+        inet_pton(family, host)
+    except (soerror, ValueError, TypeError):
+        return False
+    return True
+
+def getreuseops():
+    return _REUSE_OPS
+
+def setreuseops(flag, freelist_size=None):
+    """Enable or disable recycling of the Recv/Send/SendAll operations for
+    sockets created after this call.
+
+    When enabled each socket keeps one instance of each of those operations
+    and reinitializes it on every call (as long as the previous one was
+    finalized). When the socket is closed the instances are put on a bounded
+    per-class freelist so new sockets don't need to allocate them.
+
+    Note: a recycled operation is only valid till the next call of the same
+    kind on that socket - don't keep references to it.
+    """
+    global _REUSE_OPS, _FREELIST_SIZE
+    _REUSE_OPS = flag
+    if freelist_size is not None:
+        _FREELIST_SIZE = freelist_size
+    if not flag:
+        for freelist in _freelists.itervalues():
+            del freelist[:]
+
 
 class Socket(object):
     """
@@ -66,7 +111,7 @@ class Socket(object):
 
     A socket object represents one endpoint of a network connection.
     """
-    __slots__ = ('_fd', '_timeout', '_proactor_added')
+    __slots__ = ('_fd', '_timeout', '_proactor_added', '_ops')
     
     def __init__(self, family=AF_INET, type=SOCK_STREAM, proto=0, 
             _timeout=None, _sock=None, _proactor_added=False):
@@ -75,14 +120,40 @@ class Socket(object):
         self._fd.setblocking(0)
         self._timeout = _timeout or _TIMEOUT
         self._proactor_added = _proactor_added
+        self._ops = {} if _REUSE_OPS else None
+
+    def _reuse_op(self, klass, arg, kws):
+        """Returns the cached `klass` operation reinitialized with the given
+        arguments. A new instance (from the freelist if possible) is used if
+        the cached one is still in use."""
+        op = self._ops.get(klass)
+        if op is None or op.state != events.FINALIZED:
+            freelist = _freelists[klass]
+            if freelist:
+                op = freelist.pop()
+            else:
+                op = self._ops[klass] = klass(self, arg, **kws)
+                return op
+            self._ops[klass] = op
+        op.reset(self, arg, **kws)
+        return op
 
     def recv(self, bufsize, **kws):
         """Receive data from the socket. The return value is a string
         representing the data received. The amount of data may be less than the
         ammount specified by _bufsize_. """
+        if self._ops is not None:
+            kws.setdefault('timeout', self._timeout)
+            return self._reuse_op(Recv, bufsize, kws)
         return Recv(self, bufsize, timeout=self._timeout, **kws)
 
 
+    def park(self, coro, bufsize=4096, **kws):
+        """Wait for data without keeping the calling coroutine around: `coro`
+        (a coroutine that wasn't started) is started when data is received.
+        See :class:`Park`."""
+        return Park(self, bufsize, coro, timeout=self._timeout, **kws)
+
     def makefile(self, mode='r', bufsize=-1):
         """
         Returns a special fileobject that has corutines instead of the usual
@@ -93,13 +164,39 @@ class Socket(object):
     def send(self, data, **kws):
         """Send data to the socket. The socket must be connected to a remote
         socket. Ammount sent may be less than the data provided."""
+        if self._ops is not None:
+            kws.setdefault('timeout', self._timeout)
+            return self._reuse_op(Send, data, kws)
         return Send(self, data, timeout=self._timeout, **kws)
 
     def sendall(self, data, **kws):
         """Send data to the socket. The socket must be connected to a remote
         socket. All the data is guaranteed to be sent."""
+        if self._ops is not None:
+            kws.setdefault('timeout', self._timeout)
+            return self._reuse_op(SendAll, data, kws)
         return SendAll(self, data, timeout=self._timeout, **kws)
 
+    def recvfrom(self, bufsize, **kws):
+        """Receive a datagram from the socket. The return value is a pair
+        (data, address) where address is the address of the sending
+        socket."""
+        return RecvFrom(self, bufsize, timeout=self._timeout, **kws)
+
+    def sendto(self, data, address, **kws):
+        """Send a datagram to _address_. Returns the number of bytes
+        sent."""
+        return SendTo(self, data, address, timeout=self._timeout, **kws)
+
+    def recvmany(self, count=64, bufsize=2048, **kws):
+        """Receive up to _count_ datagrams (of at most _bufsize_ bytes) in one
+        go. Returns a list of (data, address) pairs. See :class:`RecvMany`."""
+        return RecvMany(self, count, bufsize, timeout=self._timeout, **kws)
+
+    def sendmany(self, datagrams, **kws):
+        """Send a list of (data, address) pairs. See :class:`SendMany`."""
+        return SendMany(self, datagrams, timeout=self._timeout, **kws)
+
     def accept(self, **kws):
         """Accept a connection. The socket must be bound to an address and
         listening for connections. The return value is a pair (conn, address)
@@ -120,6 +217,14 @@ class Socket(object):
         flushed). Sockets are automatically closed when they are garbage-collected.
         """
         self._fd.close()
+        if self._ops:
+            for klass, op in self._ops.iteritems():
+                freelist = _freelists[klass]
+                if op.state == events.FINALIZED and \
+                        len(freelist) < _FREELIST_SIZE:
+                    op.sock = op.coro = op.buff = None
+                    freelist.append(op)
+            self._ops.clear()
 
     def bind(self, *args):
         """Bind the socket to _address_. The socket must not already be bound.
@@ -128,7 +233,13 @@ class Socket(object):
         return self._fd.bind(*args)
 
     def connect(self, address, **kws):
-        """Connect to a remote socket at _address_. """
+        """Connect to a remote socket at _address_. A hostname is resolved
+        with :func:`cogen.core.resolver.Resolve` first (without blocking the
+        scheduler)."""
+        if isinstance(address, tuple) and address[0] and \
+                                not is_address(address[0], self._fd.family):
+            from cogen.core import resolver
+            return resolver.connect(self, address, timeout=self._timeout, **kws)
         return Connect(self, address, timeout=self._timeout, **kws)
 
     def fileno(self):
@@ -173,7 +284,9 @@ class Socket(object):
         method."""
         self._fd.setsockopt(*args)
 
-    def sendfile(self, file_handle, offset=None, length=None, blocksize=4096, **kws):
+    def sendfile(self, file_handle, offset=None, length=None, blocksize=None,
+                 **kws):
+        """Send the file's data (see :class:`SendFile`)."""
         return SendFile(file_handle, self, offset, length, blocksize, **kws)
 
     def __repr__(self):
@@ -211,6 +324,20 @@ class SocketOperation(events.TimedOperation):
     def fileno(self):
         return self.sock._fd.fileno()
 
+    def reset(self, sock, timeout=None, weak_timeout=True, slack=None,
+                                                    prio=priority.DEFAULT):
+        """Reinitializes a finalized operation so it can be reused (this is
+        a flat version of the __init__ chain)."""
+        self.sock = sock
+        self.prio = prio
+        self.state = events.RUNNING
+        if timeout:
+            self.set_timeout(timeout)
+        else:
+            self.timeout = timeout
+        self.weak_timeout = weak_timeout
+        self.slack = slack
+
     def cleanup(self, sched, coro):
         super(SocketOperation, self).cleanup(sched, coro)
         return sched.proactor.remove_token(self)
@@ -218,8 +345,8 @@ class SocketOperation(events.TimedOperation):
 
 class SendFile(SocketOperation):
     """
-    Uses underling OS sendfile (or equivalent) call or a regular memory copy
-    operation if there is no sendfile.
+    Uses underling OS sendfile (or equivalent) call or a send from a memory
+    map of the file if there is no sendfile.
     You can use this as a WriteAll if you specify the length.
     Usage::
 
@@ -229,25 +356,45 @@ class SendFile(SocketOperation):
         yield sockets.SendFile(file_object, socket_object, 0, blocksize=0)
             # there will be only one send operation (if successfull)
             # that meas the whole file will be read in memory if there is
-            #no sendfile
+            #no sendfile and the file can't be mapped
 
         yield sockets.SendFile(file_object, socket_object, 0, file_size)
             # this will hang if we can't read file_size bytes
             #from the file
 
+    A `blocksize` of None means the size of the socket's send buffer (a
+    send can't take more than that anyway).
+
+    The `header` and `trailer` strings are sent before and after the file, in
+    the same operation. The socket is corked (TCP_CORK) while they're sent so
+    the header goes out in the same packets as the start of the file.
     """
     __slots__ = (
         'sent', 'file_handle', 'offset',
-        'position', 'length', 'blocksize'
+        'position', 'length', 'blocksize',
+        'header', 'trailer', 'corked', 'sending_file', 'mapping'
     )
 
-    def __init__(self, file_handle, sock, offset=None, length=None, blocksize=4096, **kws):
+    def __init__(self, file_handle, sock, offset=None, length=None,
+                 blocksize=None, header='', trailer='', **kws):
         super(SendFile, self).__init__(sock, **kws)
         self.file_handle = file_handle
-        self.offset = self.position = offset or file_handle.tell()
+        if offset is None:
+            offset = file_handle.tell()
+        self.offset = self.position = offset
         self.length = length
         self.sent = 0
+        if blocksize is None:
+            try:
+                blocksize = sock._fd.getsockopt(SOL_SOCKET, SO_SNDBUF)
+            except soerror:
+                blocksize = 65536
         self.blocksize = blocksize
+        self.header = str(header)
+        self.trailer = str(trailer)
+        self.corked = None
+        self.sending_file = True
+        self.mapping = None
 
     def process(self, sched, coro):
         super(SendFile, self).process(sched, coro)
@@ -255,8 +402,20 @@ class SendFile(SocketOperation):
 
     def finalize(self, sched):
         super(SendFile, self).finalize(sched)
+        if self.mapping:
+            self.mapping.close()
         return self.sent
 
+    def cleanup(self, sched, coro):
+        if self.mapping:
+            self.mapping.close()
+        if self.corked:
+            try:
+                self.sock._fd.setsockopt(IPPROTO_TCP, TCP_CORK, 0)
+            except soerror:
+                pass
+        return super(SendFile, self).cleanup(sched, coro)
+
 
 class Recv(SocketOperation):
     """
@@ -276,6 +435,11 @@ class Recv(SocketOperation):
         self.len = len
         self.buff = None
 
+    def reset(self, sock, len = 4096, **kws):
+        super(Recv, self).reset(sock, **kws)
+        self.len = len
+        self.buff = None
+
     def process(self, sched, coro):
         super(Recv, self).process(sched, coro)
         return sched.proactor.request_recv(self, coro)
@@ -284,6 +448,40 @@ class Recv(SocketOperation):
         super(Recv, self).finalize(sched)
         return self.buff
 
+class Park(Recv):
+    """
+    A recv that doesn't need a suspended coroutine. Example usage:
+
+    .. sourcecode:: python
+
+        data = yield sockets.Park(socket_object, buffer_length, some_coro())
+        if data is None:
+            return # some_coro will get the data
+
+    If the data is already there the calling coroutine gets it. Otherwise the
+    calling coroutine gets None and the (not started) `target` coroutine is
+    started with the received data - or the CoroutineException for a closed
+    connection, error or timeout - appended to it's arguments.
+
+    This is for keeping a lot of idle connections (eg: http keep-alive) - a
+    coroutine that wasn't started is a lot smaller than a suspended generator.
+    """
+    __slots__ = ('target',)
+
+    def __init__(self, sock, len, target, **kws):
+        super(Park, self).__init__(sock, len, **kws)
+        self.target = target
+
+    def process(self, sched, coro):
+        # the timeout and the proactor token are for the target
+        SocketOperation.process(self, sched, self.target)
+        result = sched.proactor.request_recv(self, self.target)
+        self.target = None
+        if result:
+            return result[0], coro
+        else:
+            return None, coro
+
 
 class Send(SocketOperation):
     """
@@ -296,6 +494,11 @@ class Send(SocketOperation):
         self.buff = str(buff)
         self.sent = 0
 
+    def reset(self, sock, buff, **kws):
+        super(Send, self).reset(sock, **kws)
+        self.buff = str(buff)
+        self.sent = 0
+
     def process(self, sched, coro):
         super(Send, self).process(sched, coro)
         return sched.proactor.request_send(self, coro)
@@ -315,6 +518,11 @@ class SendAll(SocketOperation):
         self.buff = str(buff)
         self.sent = 0
 
+    def reset(self, sock, buff, **kws):
+        super(SendAll, self).reset(sock, **kws)
+        self.buff = str(buff)
+        self.sent = 0
+
     def process(self, sched, coro):
         super(SendAll, self).process(sched, coro)
         return sched.proactor.request_sendall(self, coro)
@@ -323,6 +531,178 @@ class SendAll(SocketOperation):
         super(SendAll, self).finalize(sched)
         return self.sent
 
+class RecvFrom(Recv):
+    """
+    Receives a datagram. Returns a (data, address) tuple when the operation
+    completes.
+    """
+    __slots__ = ('addr',)
+
+    def __init__(self, sock, len = 4096, **kws):
+        super(RecvFrom, self).__init__(sock, len, **kws)
+        self.addr = None
+
+    def process(self, sched, coro):
+        SocketOperation.process(self, sched, coro)
+        return sched.proactor.request_recvfrom(self, coro)
+
+    def finalize(self, sched):
+        super(RecvFrom, self).finalize(sched)
+        return (self.buff, self.addr)
+
+class SendTo(Send):
+    """
+    Sends a datagram to `address`. Returns the number of bytes sent.
+    """
+    __slots__ = ('addr',)
+
+    def __init__(self, sock, buff, address, **kws):
+        super(SendTo, self).__init__(sock, buff, **kws)
+        self.addr = address
+
+    def process(self, sched, coro):
+        SocketOperation.process(self, sched, coro)
+        return sched.proactor.request_sendto(self, coro)
+
+class RecvMany(SocketOperation):
+    """
+    Receives the datagrams that are waiting - at least one and at most `count`
+    (of at most `len` bytes each). Returns a list of (data, address) tuples.
+
+    On linux this is one ``recvmmsg`` call (see :mod:`cogen.core.mmsg`),
+    elsewhere ``recvfrom`` is called till there isn't any datagram left. Use
+    this for a busy datagram socket:
+
+    .. sourcecode:: python
+
+        while True:
+            for data, address in (yield sock.recvmany(256)):
+                handle(data, address)
+    """
+    __slots__ = ('count', 'len', 'datagrams')
+
+    def __init__(self, sock, count=64, len=2048, **kws):
+        super(RecvMany, self).__init__(sock, **kws)
+        self.count = count
+        self.len = len
+        self.datagrams = None
+
+    def process(self, sched, coro):
+        super(RecvMany, self).process(sched, coro)
+        return sched.proactor.request_recvmany(self, coro)
+
+    def finalize(self, sched):
+        super(RecvMany, self).finalize(sched)
+        return self.datagrams
+
+class SendMany(SocketOperation):
+    """
+    Sends a list of (data, address) tuples (the address is None for a
+    connected socket), with ``sendmmsg`` if available. Runs till all the
+    datagrams have been sent and returns their number. The addresses need to
+    be numeric.
+    """
+    __slots__ = ('sent', 'datagrams')
+
+    def __init__(self, sock, datagrams, **kws):
+        super(SendMany, self).__init__(sock, **kws)
+        self.datagrams = list(datagrams)
+        self.sent = 0
+
+    def process(self, sched, coro):
+        super(SendMany, self).process(sched, coro)
+        return sched.proactor.request_sendmany(self, coro)
+
+    def finalize(self, sched):
+        super(SendMany, self).finalize(sched)
+        return self.sent
+
+class SpliceIn(SocketOperation):
+    """
+    Moves up to `len` bytes from the socket into `pipe` (a
+    :class:`cogen.core.splice.Pipe`) with ``splice``. Returns the number of
+    bytes moved - 0 if the peer closed the connection.
+    """
+    __slots__ = ('pipe', 'len', 'moved')
+
+    def __init__(self, sock, pipe, len, **kws):
+        super(SpliceIn, self).__init__(sock, **kws)
+        self.pipe = pipe
+        self.len = len
+        self.moved = 0
+
+    def process(self, sched, coro):
+        super(SpliceIn, self).process(sched, coro)
+        return sched.proactor.request_splice_in(self, coro)
+
+    def finalize(self, sched):
+        super(SpliceIn, self).finalize(sched)
+        return self.moved
+
+class SpliceOut(SocketOperation):
+    """
+    Moves the data in `pipe` to the socket with ``splice``. Runs till the pipe
+    is empty and returns the number of bytes moved.
+    """
+    __slots__ = ('pipe', 'moved')
+
+    def __init__(self, sock, pipe, **kws):
+        super(SpliceOut, self).__init__(sock, **kws)
+        self.pipe = pipe
+        self.moved = 0
+
+    def process(self, sched, coro):
+        super(SpliceOut, self).process(sched, coro)
+        return sched.proactor.request_splice_out(self, coro)
+
+    def finalize(self, sched):
+        super(SpliceOut, self).finalize(sched)
+        return self.moved
+
+class RecvToFile(SocketOperation):
+    """
+    Receives `length` bytes from the socket and writes them to `file_handle`
+    (a file object or a file descriptor, at it's current position). Returns
+    the number of bytes written. Raises ConnectionClosed if the peer closes
+    the connection before that.
+
+    On linux the data goes through a kernel pipe with ``splice`` and it's never
+    copied to userspace (but not for a TLS socket - the data needs to be
+    decrypted), elsewhere it's read in `bufsize` chunks.
+
+    .. sourcecode:: python
+
+        written = yield sockets.RecvToFile(sock, open('upload', 'wb'), length)
+    """
+    __slots__ = ('file_handle', 'fd', 'length', 'bufsize', 'received', 'pipe')
+
+    def __init__(self, sock, file_handle, length, bufsize=65536, **kws):
+        super(RecvToFile, self).__init__(sock, **kws)
+        self.file_handle = file_handle
+        if hasattr(file_handle, 'fileno'):
+            file_handle.flush()
+            self.fd = file_handle.fileno()
+        else:
+            self.fd = file_handle
+        self.length = length
+        self.bufsize = bufsize
+        self.received = 0
+        if splice.available and isinstance(sock._fd, stdsocket):
+            self.pipe = splice.Pipe()
+        else:
+            self.pipe = None
+
+    def process(self, sched, coro):
+        super(RecvToFile, self).process(sched, coro)
+        return sched.proactor.request_recv_to_file(self, coro)
+
+    def finalize(self, sched):
+        super(RecvToFile, self).finalize(sched)
+        if self.pipe:
+            self.pipe.close()
+        self.file_handle = None
+        return self.received
+
 class Accept(SocketOperation):
     """
     Returns a (conn, addr) tuple when the operation completes.
@@ -372,6 +752,8 @@ class Connect(SocketOperation):
         super(Connect, self).finalize(sched)
         return self.sock
 
+_freelists = {Recv: [], Send: [], SendAll: []}
+
 @coro
 def RecvAll(sock, length, **k):
     recvd = 0
@@ -384,6 +766,109 @@ def RecvAll(sock, length, **k):
 
     raise StopIteration(''.join(data))
 
+@coro
+def Splice(src, dst, length=None, pipe=None, **k):
+    """
+    Moves `length` bytes (or everything till the peer closes `src` if `length`
+    is None) from the `src` socket to the `dst` socket. Returns the number of
+    bytes moved.
+
+    On linux the data goes through a kernel pipe with ``splice`` (it's never
+    copied to userspace), `pipe` is the :class:`cogen.core.splice.Pipe` to use
+    (a new one is made if None). Elsewhere this is a Recv/SendAll loop.
+    """
+    moved = 0
+    if not splice.available:
+        while length is None or moved < length:
+            try:
+                data = yield Recv(src, length is None and 65536 or
+                                       min(65536, length - moved), **k)
+            except ConnectionClosed:
+                break
+            yield SendAll(dst, data, **k)
+            moved += len(data)
+        raise StopIteration(moved)
+    own_pipe = pipe is None
+    if own_pipe:
+        pipe = splice.Pipe()
+    try:
+        while length is None or moved < length:
+            chunk = yield SpliceIn(src, pipe, length is None and pipe.size or
+                                              length - moved, **k)
+            if not chunk:
+                break
+            yield SpliceOut(dst, pipe, **k)
+            moved += chunk
+    finally:
+        if own_pipe:
+            pipe.close()
+    raise StopIteration(moved)
+
+@coro
+def _forward(src, dst, pipe_size, **k):
+    pipe = splice.available and splice.Pipe(pipe_size) or None
+    try:
+        moved = yield Splice(src, dst, pipe=pipe, **k)
+    except (SocketError, soerror, events.OperationTimeout):
+        # wake up the other direction too
+        for sock in (src, dst):
+            try:
+                sock.shutdown(SHUT_RDWR)
+            except soerror:
+                pass
+        raise StopIteration(None)
+    finally:
+        if pipe:
+            pipe.close()
+    try:
+        # pass on the end of the stream
+        dst.shutdown(SHUT_WR)
+    except soerror:
+        pass
+    raise StopIteration(moved)
+
+@coro
+def proxy(a, b, pipe_size=None, **k):
+    """
+    Forwards the data between the connected sockets `a` and `b`, both ways,
+    with :func:`Splice`. The end of the stream is passed on (a half-close)
+    and proxying ends when both directions are done. The sockets aren't
+    closed.
+
+    The proactor waits for one operation per file descriptor, so the data is
+    written through duplicates of the sockets' descriptors (the reads use the
+    originals).
+
+    Returns the number of bytes moved from `a` to `b` and from `b` to `a`
+    (None for a direction that ended with a error or a timeout).
+
+    .. sourcecode:: python
+
+        client, address = yield server_sock.accept()
+        backend = Socket()
+        yield backend.connect(('backend', 8080))
+        yield sockets.proxy(client, backend)
+        client.close()
+        backend.close()
+    """
+    a_out, b_out = [
+        Socket(_sock=fromfd(sock.fileno(), sock._fd.family, sock._fd.type),
+               _timeout=sock._timeout)
+        for sock in (a, b)
+    ]
+    try:
+        other = yield events.AddCoro(_forward, args=(b, a_out, pipe_size),
+                                     kwargs=k, prio=priority.CORO)
+        sent = yield _forward(a, b_out, pipe_size, **k)
+        if other.running:
+            received = yield events.Join(other)
+        else:
+            received = other.result
+    finally:
+        a_out.close()
+        b_out.close()
+    raise StopIteration((sent, received))
+
 class _fileobject(object):
     """Faux file object attached to a socket object."""
 
@@ -410,7 +895,7 @@ class _fileobject(object):
             self._rbufsize = bufsize
         self._wbufsize = bufsize
         self._rbuf = "" # A string
-        self._wbuf = [] # A list of strings
+        self._wbuf = None # A list of strings, allocated on the first write
         self._close = close
 
     def _getclosed(self):
@@ -438,7 +923,7 @@ class _fileobject(object):
     def flush(self, **kws):
         if self._wbuf:
             buffer = "".join(self._wbuf)
-            self._wbuf = []
+            self._wbuf = None
             yield self._sock.sendall(buffer, **kws)
 
     def fileno(self):
@@ -449,6 +934,8 @@ class _fileobject(object):
         data = str(data) # XXX Should really reject non-string non-buffers
         if not data:
             return
+        if self._wbuf is None:
+            self._wbuf = []
         self._wbuf.append(data)
         if (self._wbufsize == 0 or
             self._wbufsize == 1 and '\n' in data or
@@ -459,6 +946,8 @@ class _fileobject(object):
     def writelines(self, list, **kws):
         # XXX We could do better here for very long lists
         # XXX Should really reject non-string non-buffers
+        if self._wbuf is None:
+            self._wbuf = []
         self._wbuf.extend(filter(None, map(str, list)))
         if (self._wbufsize <= 1 or
             self._get_wbuf_len() >= self._wbufsize):
@@ -466,7 +955,7 @@ class _fileobject(object):
 
     def _get_wbuf_len(self):
         buf_len = 0
-        for x in self._wbuf:
+        for x in self._wbuf or ():
             buf_len += len(x)
         return buf_len
 
@@ -589,6 +1078,21 @@ class _fileobject(object):
                 buf_len += n
             raise StopIteration("".join(buffers))
 
+    @coro
+    def recv_to_file(self, file_handle, length, **kws):
+        """Writes the next `length` bytes to `file_handle` (a file object) -
+        the buffered data first, the rest with :class:`RecvToFile`. Returns the
+        number of bytes written."""
+        data = self._rbuf[:length]
+        if data:
+            self._rbuf = self._rbuf[length:]
+            file_handle.write(data)
+        written = len(data)
+        if written < length:
+            written += yield RecvToFile(self._sock, file_handle,
+                                        length - written, **kws)
+        raise StopIteration(written)
+
     @coro
     def readlines(self, sizehint=0, **kws):
         total = 0
@@ -0,0 +1,86 @@
+"""
+ctypes binding for the linux ``splice`` call: it moves data between a file
+descriptor and a pipe in the kernel, the data isn't copied to userspace.
+Socket to socket data goes through a :class:`Pipe` (socket -> pipe -> socket).
+
+`available` is False if ``splice`` can't be used (the operations in
+:mod:`cogen.core.sockets` that use it fall back to regular buffered copies).
+"""
+__all__ = ['available', 'splice', 'Pipe']
+
+import ctypes
+import ctypes.util
+import fcntl
+import os
+import socket
+
+SPLICE_F_MOVE = 1
+SPLICE_F_NONBLOCK = 2
+SPLICE_F_MORE = 4
+
+# not in the fcntl module
+F_SETPIPE_SZ = 1031
+F_GETPIPE_SZ = 1032
+
+try:
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _splice = libc.splice
+    _splice.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int,
+                        ctypes.c_void_p, ctypes.c_size_t, ctypes.c_uint]
+    _splice.restype = ctypes.c_ssize_t
+    available = True
+except (OSError, AttributeError, TypeError):
+    available = False
+
+def splice(fd_in, fd_out, length, flags=SPLICE_F_MOVE | SPLICE_F_NONBLOCK):
+    """Moves up to `length` bytes from `fd_in` to `fd_out` (one of them must
+    be a pipe). Returns the number of bytes moved, 0 at the end of the input.
+    Raises socket.error (eg: EAGAIN if a non-blocking fd isn't ready)."""
+    moved = _splice(fd_in, None, fd_out, None, length, flags)
+    if moved < 0:
+        err = ctypes.get_errno()
+        raise socket.error(err, os.strerror(err))
+    return moved
+
+class Pipe(object):
+    """
+    A non-blocking pipe to splice through. `pending` is the number of bytes in
+    the pipe and `size` it's capacity - a bigger pipe (up to
+    ``/proc/sys/fs/pipe-max-size``) moves more data per wakeup.
+    """
+    __slots__ = ('read_fd', 'write_fd', 'size', 'pending')
+
+    def __init__(self, size=None):
+        self.read_fd, self.write_fd = os.pipe()
+        for fd in (self.read_fd, self.write_fd):
+            fcntl.fcntl(fd, fcntl.F_SETFL,
+                        fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+            fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+        if size:
+            try:
+                fcntl.fcntl(self.write_fd, F_SETPIPE_SZ, size)
+            except IOError:
+                pass # over the limit, keep the default size
+        try:
+            self.size = fcntl.fcntl(self.write_fd, F_GETPIPE_SZ)
+        except IOError:
+            self.size = 65536
+        self.pending = 0
+
+    def close(self):
+        if getattr(self, 'read_fd', None) is not None:
+            os.close(self.read_fd)
+            os.close(self.write_fd)
+            self.read_fd = self.write_fd = None
+
+    # a operation that failed doesn't get to close it's pipe
+    __del__ = close
+
+    def __repr__(self):
+        return "<%s@%X fds:%s,%s pending:%s>" % (
+            self.__class__.__name__,
+            id(self),
+            self.read_fd,
+            self.write_fd,
+            self.pending
+        )
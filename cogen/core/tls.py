@@ -0,0 +1,219 @@
+"""
+TLS sockets.
+
+:class:`SSLSocket` is a :class:`cogen.core.sockets.Socket` with a non-blocking
+``ssl.SSLSocket`` underneath. The regular socket operations work on it: the
+proactor retries a read that needs more data from the peer (a
+``SSL_ERROR_WANT_READ``) when the socket is readable again, like for a EAGAIN,
+without waking up the coroutine. Renegotiation is disabled in the contexts
+made by :func:`server_context` - a read never needs to write (and the other
+way around) after the handshake.
+
+The same ``ssl.SSLContext`` should be used for all the connections of a
+server: returning clients skip the full handshake with the session tickets it
+gave them (the ticket keys are kept in the context). The ``ssl`` module
+doesn't set a session id context so the server side session id cache isn't
+used - clients that don't support tickets always make a full handshake. See
+``context.session_stats()`` for the counters (``hits`` are the resumed
+sessions).
+
+Usage:
+
+.. sourcecode:: python
+
+    # client
+    sock = yield tls.connect(('example.com', 443),
+                             ssl.create_default_context(),
+                             server_hostname='example.com')
+    yield sock.sendall(request)
+
+    # server
+    conn, address = yield sockets.Accept(server_socket)
+    conn = tls.SSLSocket(conn, context, server_side=True)
+    yield conn.do_handshake()
+"""
+from __future__ import absolute_import
+
+__all__ = ['SSLSocket', 'server_context', 'connect']
+
+import errno
+import os
+import ssl
+from socket import error as soerror
+
+from cogen.core import sockets
+from cogen.core.coroutines import coroutine
+from cogen.core.proactors.base import perform_recv, perform_readable, \
+                                      perform_writable
+
+# SSL_OP_NO_RENEGOTIATION, not in the ssl module (openssl 1.1.0h+)
+OP_NO_RENEGOTIATION = 0x40000000
+
+def server_context(certfile, keyfile=None, password=None, ciphers=None):
+    """Returns a ``ssl.SSLContext`` for a server (with session tickets and
+    without renegotiation or compression)."""
+    context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    context.options |= ssl.OP_NO_SSLv2 | ssl.OP_NO_SSLv3 | \
+                       ssl.OP_NO_COMPRESSION | ssl.OP_CIPHER_SERVER_PREFERENCE
+    if ssl.OPENSSL_VERSION_INFO >= (1, 1, 0, 8):
+        context.options |= OP_NO_RENEGOTIATION
+    if ciphers:
+        context.set_ciphers(ciphers)
+    context.load_cert_chain(certfile, keyfile, password)
+    return context
+
+class SSLConnection(object):
+    """The ``_fd`` of a :class:`SSLSocket`: a ``ssl.SSLSocket`` with a recv
+    that raises a EAGAIN (like a regular non-blocking socket) when the TLS
+    layer needs more data. (``ssl.SSLSocket.send`` already returns 0
+    then.)"""
+    __slots__ = ('ssl',)
+
+    def __init__(self, sslsock):
+        self.ssl = sslsock
+
+    def recv(self, bufsize):
+        try:
+            return self.ssl.recv(bufsize)
+        except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            raise soerror(errno.EAGAIN, os.strerror(errno.EAGAIN))
+
+    def __getattr__(self, name):
+        return getattr(self.ssl, name)
+
+def request_recv(act, sched, coro):
+    """Like the proactor's request_recv but the read is always tried before
+    waiting: decrypted data can be buffered in the TLS layer and the socket
+    isn't readable then."""
+    proactor = sched.proactor
+    result = proactor.try_run_act(act, perform_recv)
+    if result:
+        return result, coro
+    proactor.add_token(act, coro, perform_recv)
+
+class SSLRecv(sockets.Recv):
+    "A :class:`cogen.core.sockets.Recv` for a :class:`SSLSocket`."
+    __slots__ = ()
+
+    def process(self, sched, coro):
+        sockets.SocketOperation.process(self, sched, coro)
+        return request_recv(self, sched, coro)
+
+class SSLPark(sockets.Park):
+    "A :class:`cogen.core.sockets.Park` for a :class:`SSLSocket`."
+    __slots__ = ()
+
+    def process(self, sched, coro):
+        sockets.SocketOperation.process(self, sched, self.target)
+        result = request_recv(self, sched, self.target)
+        self.target = None
+        if result:
+            return result[0], coro
+        else:
+            return None, coro
+
+class Readable(sockets.SocketOperation):
+    "Waits for the socket to be readable."
+    __slots__ = ()
+
+    def process(self, sched, coro):
+        super(Readable, self).process(sched, coro)
+        sched.proactor.add_token(self, coro, perform_readable)
+
+class Writable(sockets.SocketOperation):
+    "Waits for the socket to be writable."
+    __slots__ = ()
+
+    def process(self, sched, coro):
+        super(Writable, self).process(sched, coro)
+        sched.proactor.add_token(self, coro, perform_writable)
+
+class SSLSocket(sockets.Socket):
+    """
+    A TLS socket over a connected :class:`cogen.core.sockets.Socket` (the
+    `sock` shouldn't be used after this). The handshake is made with
+    :meth:`do_handshake`.
+    """
+    __slots__ = ('context', 'established')
+
+    def __init__(self, sock, context, server_side=False,
+                 server_hostname=None):
+        sslsock = context.wrap_socket(sock._fd, server_side=server_side,
+                                      do_handshake_on_connect=False,
+                                      server_hostname=server_hostname)
+        super(SSLSocket, self).__init__(
+            _sock=SSLConnection(sslsock),
+            _timeout=sock._timeout,
+            _proactor_added=sock._proactor_added
+        )
+        self.context = context
+        self.established = False
+
+    @coroutine
+    def do_handshake(self, **kws):
+        """Makes the TLS handshake (if it wasn't made already)."""
+        kws.setdefault('timeout', self._timeout)
+        while not self.established:
+            try:
+                self._fd.ssl.do_handshake()
+            except ssl.SSLWantReadError:
+                wait = Readable
+            except ssl.SSLWantWriteError:
+                wait = Writable
+            else:
+                self.established = True
+                break
+            yield wait(self, **kws)
+
+    def recv(self, bufsize, **kws):
+        return SSLRecv(self, bufsize, timeout=self._timeout, **kws)
+
+    def park(self, coro, bufsize=4096, **kws):
+        return SSLPark(self, bufsize, coro, timeout=self._timeout, **kws)
+
+    @coroutine
+    def sendfile(self, file_handle, offset=None, length=None, blocksize=None,
+                 header='', trailer='', **kws):
+        """The file's data has to go through the TLS layer, so this just
+        reads the file and sends the data (the `header` in the same records
+        as the first block). The file is read from `offset` + the data sent
+        so far every time - the file object can be shared by several
+        responses."""
+        if offset is None:
+            offset = file_handle.tell()
+        kws.setdefault('timeout', self._timeout)
+        sent = 0
+        blocksize = blocksize or 65536
+        while length is None or sent < length:
+            file_handle.seek(offset + sent)
+            data = file_handle.read(length is None and blocksize or
+                                    min(blocksize, length - sent))
+            if not data:
+                break
+            yield sockets.SendAll(self, header + data, **kws)
+            header = ''
+            sent += len(data)
+        if header or trailer:
+            yield sockets.SendAll(self, header + trailer, **kws)
+        raise StopIteration(sent)
+
+    def getpeercert(self, binary_form=False):
+        return self._fd.ssl.getpeercert(binary_form)
+
+    def cipher(self):
+        return self._fd.ssl.cipher()
+
+@coroutine
+def connect(address, context, server_hostname=None, family=sockets.AF_INET,
+            timeout=None):
+    """Connects to `address` and makes the TLS handshake. Returns a
+    :class:`SSLSocket`."""
+    sock = sockets.Socket(family, _timeout=timeout)
+    try:
+        yield sock.connect(address)
+        sock = SSLSocket(sock, context, server_hostname=server_hostname)
+        yield sock.do_handshake()
+    except:
+        sock.close()
+        raise
+    raise StopIteration(sock)
@@ -0,0 +1,138 @@
+"""
+Adaptive tuning of the scheduler's knobs (`proactor_greedy`, `ops_greedy`
+and the proactor's `multiplex_first`).
+
+The tuner is sampled on every iteration of the main loop and every `window`
+iterations it looks at what happened in that window:
+
+* the multiplex-first hit rate - how many of the socket operations tried
+  before getting in the proactor completed right away,
+* the event batch size - how many events a proactor poll handled on average,
+* the active queue depth - the average number of coroutines ready to run.
+
+and sets the knobs accordingly:
+
+* `multiplex_first` is kept on while the hit rate is at least `hit_rate`.
+  When it's off nothing is measured, so it's turned back on for one window
+  every `probe` windows.
+* `ops_greedy` is on while the batches are small (at most `batch_size`
+  events): running the coroutines right from the proactor saves a trip
+  through the active queue and doesn't hold back many other events.
+* `proactor_greedy` is off when the active queue is deep (at least `depth`
+  coroutines) and the polls come back mostly empty (less than `poll_events`
+  events per poll): polling after every coroutine run is just overhead then.
+  When it's off the proactor is rarely polled so, like `multiplex_first`, it's
+  turned back on for one window every `probe` windows.
+
+Every change is counted in the scheduler's `stats` (``tuning_changes``) and
+recorded in :attr:`Adaptive.decisions` as ``(time, knob, value, metrics)``
+tuples (the last `history` of them). The measurements for the last window
+are in :attr:`Adaptive.metrics`. A `callback` is called with the same knob,
+value and metrics on every change.
+
+Usage:
+
+.. sourcecode:: python
+
+    sched = Scheduler(adaptive=tuning.Adaptive)
+
+    sched = Scheduler(adaptive=lambda sched: tuning.Adaptive(sched, window=1000))
+
+"""
+__all__ = ['Adaptive']
+
+import collections
+from time import time
+
+
+class Adaptive(object):
+    def __init__(self, sched, window=256, hit_rate=.5, batch_size=4, depth=32,
+                 poll_events=.25, probe=16, history=100, callback=None):
+        self.sched = sched
+        self.window = window
+        self.hit_rate = hit_rate
+        self.batch_size = batch_size
+        self.depth = depth
+        self.poll_events = poll_events
+        self.probe = probe
+        self.callback = callback
+        self.decisions = collections.deque(maxlen=history)
+        self.metrics = {}
+        self.iterations = 0
+        self.polls = 0
+        self.depth_sum = 0
+        self.windows_off = 0
+        self.windows_not_greedy = 0
+        self.last_counters = self.counters()
+        sched.stats.setdefault('tuning_changes', 0)
+
+    def __repr__(self):
+        return "<%s@0x%X metrics:%s>" % (
+            self.__class__.__name__, id(self), self.metrics)
+
+    def counters(self):
+        proactor = self.sched.proactor
+        return proactor.multiplex_tries, proactor.multiplex_hits, \
+                proactor.events
+
+    def sample(self, polled):
+        """Called by the scheduler on every iteration, `polled` tells if the
+        proactor was run."""
+        self.iterations += 1
+        self.depth_sum += len(self.sched.active)
+        if polled:
+            self.polls += 1
+        if self.iterations >= self.window:
+            self.adjust()
+
+    def adjust(self):
+        "Takes the measurements for the window and sets the knobs."
+        sched = self.sched
+        proactor = sched.proactor
+        counters = self.counters()
+        tries, hits, events = [new - old for new, old in
+                               zip(counters, self.last_counters)]
+        self.last_counters = counters
+        metrics = self.metrics = {
+            'hit_rate': float(hits) / tries if tries else None,
+            'batch_size': float(events) / self.polls if self.polls else None,
+            'depth': float(self.depth_sum) / self.iterations,
+        }
+        self.iterations = self.polls = self.depth_sum = 0
+
+        if proactor.supports_multiplex_first:
+            if proactor.multiplex_first:
+                if metrics['hit_rate'] is not None and \
+                        metrics['hit_rate'] < self.hit_rate:
+                    self.windows_off = 0
+                    self.set(proactor, 'multiplex_first', False)
+            else:
+                self.windows_off += 1
+                if self.windows_off >= self.probe:
+                    self.set(proactor, 'multiplex_first', True)
+        if metrics['batch_size'] is not None:
+            self.set(sched, 'ops_greedy',
+                     metrics['batch_size'] <= self.batch_size)
+        if metrics['depth'] >= self.depth:
+            polling = metrics['batch_size'] is not None and \
+                    metrics['batch_size'] >= self.poll_events
+            if sched.proactor_greedy:
+                if metrics['batch_size'] is not None and not polling:
+                    self.windows_not_greedy = 0
+                    self.set(sched, 'proactor_greedy', False)
+            else:
+                self.windows_not_greedy += 1
+                if polling or self.windows_not_greedy >= self.probe:
+                    self.set(sched, 'proactor_greedy', True)
+        else:
+            self.set(sched, 'proactor_greedy', True)
+
+    def set(self, obj, knob, value):
+        "Sets the knob on `obj` and records the change (if it's a change)."
+        if getattr(obj, knob) == value:
+            return
+        setattr(obj, knob, value)
+        self.sched.stats['tuning_changes'] += 1
+        self.decisions.append((time(), knob, value, self.metrics))
+        if self.callback:
+            self.callback(knob, value, self.metrics)
@@ -69,7 +69,7 @@ class CoroletInstance(coroutines.CoroutineInstance):
 
         self.caller = None
         self.prio = priority.FIRST
-        self.waiters = []
+        self.waiters = None
         self.exception = None
 
     #~ from cogen.core.util import debug as dbg
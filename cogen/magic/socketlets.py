@@ -82,6 +82,6 @@ class Socket(CogenSocket):
         """Connect to a remote socket at _address_. """
         return yield_(Connect(self, address, timeout=self._timeout, **kws))
 
-    def sendfile(self, file_handle, offset=None, length=None, blocksize=4096, **kws):
+    def sendfile(self, file_handle, offset=None, length=None, blocksize=None, **kws):
         return yield_(SendFile(file_handle, self, offset, length, blocksize, **kws))
 
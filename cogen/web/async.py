@@ -9,6 +9,7 @@ __all__ = [
 ]
 
 
+import tempfile
 try:
     from cStringIO import StringIO
 except ImportError:
@@ -102,15 +103,28 @@ lazy_sr = LazyStartResponseMiddleware
 class SynchronousInputMiddleware:
     """Middleware for providing a regular synchronous wsgi.input to the app.
     Note that it reads the whole input in memory so you sould rather use the
-    async input (environ['cogen.input']) for large requests.
+    async input (environ['cogen.input']) for large requests - or set
+    `spool_size`: bigger inputs are written to a temporary file with
+    ``environ['cogen.input'].recv_to_file`` (on linux the data doesn't go
+    through python at all, see :class:`cogen.core.sockets.RecvToFile`).
     """
-    def __init__(self, app, global_conf={}, buffer_length=1024):
+    def __init__(self, app, global_conf={}, buffer_length=1024,
+                 spool_size=None):
         self.app = app
         self.buffer_length = int(buffer_length)
+        self.spool_size = spool_size and int(spool_size) or None
 
     def __call__(self, environ, start_response):
         buff = StringIO()
         remaining = content_length = environ['cogen.wsgi'].content_length or 0
+        if self.spool_size and content_length > self.spool_size:
+            buff = tempfile.TemporaryFile()
+            yield environ['cogen.input'].recv_to_file(buff, content_length)
+            result = environ['cogen.wsgi'].result
+            if isinstance(result, Exception):
+                import traceback
+                traceback.print_exception(*environ['cogen.wsgi'].exception)
+            remaining = 0
         while remaining:
             yield environ['cogen.input'].read(min(remaining, self.buffer_length))
             result = environ['cogen.wsgi'].result
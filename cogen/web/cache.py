@@ -0,0 +1,206 @@
+"""
+A in-process HTTP response cache for :class:`cogen.web.wsgi.WSGIServer`.
+
+Give the server a :class:`ResponseCache` (the `response_cache` option) and
+the cacheable responses of GET requests are kept, already rendered. A request
+that hits the cache is answered straight from the connection's coroutine: the
+app isn't called (and the wsgi environ isn't built).
+
+The key is the host, path, query string and the request headers in `vary`
+(the method is GET or HEAD). A response is cached if:
+
+* it's a 200 for a GET request without a body or ``Authorization``
+* it doesn't have a ``Set-Cookie``
+* it's ``Cache-Control`` doesn't have ``no-store``, ``no-cache`` or
+  ``private`` - the TTL is the ``s-maxage`` or ``max-age`` (`default_ttl` if
+  there's none)
+* it doesn't ``Vary`` on headers other than the ones in `vary`
+* it's not sent with the ``wsgi.file_wrapper`` (sendfile is cheap already)
+
+HEAD requests are answered from the GET responses. A request with
+``Cache-Control: no-cache`` (or ``Pragma: no-cache``) goes to the app and the
+new response replaces the cached one.
+
+The entries are evicted least recently used first when the total size is
+over `max_size` bytes.
+
+Usage:
+
+.. sourcecode:: python
+
+    server = wsgi.WSGIServer(('0.0.0.0', 8080), app, sched,
+                             response_cache=cache.ResponseCache())
+"""
+__all__ = ['ResponseCache']
+
+import collections
+import rfc822
+import time
+
+# these aren't cached, they're set for each response
+SKIPPED_HEADERS = ('date', 'connection', 'keep-alive', 'transfer-encoding',
+                   'content-length', 'age')
+
+_date = [0, None]
+
+def http_date():
+    "Returns the Date header's value (it's formatted once a second)."
+    now = int(time.time())
+    if _date[0] != now:
+        _date[0], _date[1] = now, rfc822.formatdate(now)
+    return _date[1]
+
+def parse_cache_control(value):
+    "Returns a dict of the Cache-Control directives."
+    directives = {}
+    for item in value.split(','):
+        name, _, arg = item.partition('=')
+        name = name.strip().lower()
+        if name:
+            directives[name] = arg.strip().strip('"')
+    return directives
+
+class CacheEntry(object):
+    "A rendered response."
+    __slots__ = ('head', 'body', 'stored', 'expires', 'size')
+
+    def __init__(self, head, body, ttl):
+        self.head = head
+        self.body = body
+        self.stored = time.time()
+        self.expires = self.stored + ttl
+        self.size = len(head) + len(body)
+
+    def render(self, head_only, extra_headers=''):
+        "Returns the bytes to send (`extra_headers` is rendered already)."
+        buf = [self.head,
+               "Age: %d\r\n" % (time.time() - self.stored),
+               "Date: ", http_date(), "\r\n",
+               extra_headers, "\r\n"]
+        if not head_only:
+            buf.append(self.body)
+        return "".join(buf)
+
+class ResponseCache(object):
+    """
+    Options:
+
+    * max_size - the maximum size (in bytes) of all the cached responses
+    * max_entry_size - bigger responses aren't cached
+    * default_ttl - seconds a response without a max-age is cached (0 - not
+      cached)
+    * vary - the request headers that are part of the key
+
+    The cache `hits`, `misses`, `stores` and `evictions` are counted in
+    `stats`.
+    """
+    def __init__(self, max_size=64*1024*1024, max_entry_size=1024*1024,
+                 default_ttl=0, vary=('Accept-Encoding', )):
+        self.max_size = max_size
+        self.max_entry_size = max_entry_size
+        self.default_ttl = default_ttl
+        self.vary = [header.lower() for header in vary]
+        self.environ_vary = tuple(
+            'HTTP_' + header.upper().replace('-', '_') for header in vary
+        )
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+        }
+
+    def __repr__(self):
+        return "<%s@%X entries:%s size:%s>" % (
+            self.__class__.__name__,
+            id(self),
+            len(self.entries),
+            self.size
+        )
+
+    def key(self, environ):
+        """Returns the key for the request (None if it can't be cached - eg:
+        it has a body)."""
+        method = environ['REQUEST_METHOD']
+        if method != 'GET' and method != 'HEAD' or \
+                environ.get('CONTENT_LENGTH') not in (None, '', '0') or \
+                'HTTP_AUTHORIZATION' in environ:
+            return
+        return (environ.get('HTTP_HOST'), environ['PATH_INFO'],
+                environ['QUERY_STRING']) + \
+               tuple(environ.get(name) for name in self.environ_vary)
+
+    def lookup(self, key, environ):
+        """Returns the CacheEntry for the key or None (if there isn't one,
+        it expired or the client wants a fresh response)."""
+        if 'no-cache' in environ.get('HTTP_CACHE_CONTROL', '') or \
+                'no-cache' in environ.get('HTTP_PRAGMA', ''):
+            self.stats['misses'] += 1
+            return
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.stats['misses'] += 1
+            return
+        if entry.expires < time.time():
+            self.size -= entry.size
+            self.stats['misses'] += 1
+            return
+        # the most recently used are on the right
+        self.entries[key] = entry
+        self.stats['hits'] += 1
+        return entry
+
+    def ttl(self, status, headers):
+        """Returns the seconds the response can be cached (0 if it
+        can't)."""
+        if status[:3] != '200':
+            return 0
+        ttl = self.default_ttl
+        for name, value in headers:
+            name = name.lower()
+            if name == 'set-cookie':
+                return 0
+            elif name == 'cache-control':
+                directives = parse_cache_control(value)
+                if 'no-store' in directives or 'no-cache' in directives or \
+                        'private' in directives:
+                    return 0
+                try:
+                    ttl = int(directives.get('s-maxage') or
+                              directives['max-age'])
+                except (KeyError, ValueError):
+                    pass
+            elif name == 'vary':
+                for header in value.split(','):
+                    if header.strip().lower() not in self.vary:
+                        return 0
+        return max(ttl, 0)
+
+    def store(self, key, status_line, headers, body, ttl):
+        """Caches the response for `ttl` seconds. `headers` are the
+        response's headers, the ones that change for every response are
+        skipped."""
+        head = [status_line]
+        for name, value in headers:
+            if name.lower() not in SKIPPED_HEADERS:
+                head.extend((name, ": ", value, "\r\n"))
+        head.append("Content-Length: %d\r\n" % len(body))
+        entry = CacheEntry("".join(head), body, ttl)
+        if entry.size > self.max_entry_size:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= old.size
+        self.entries[key] = entry
+        self.size += entry.size
+        self.stats['stores'] += 1
+        while self.size > self.max_size:
+            self.size -= self.entries.popitem(last=False)[1].size
+            self.stats['evictions'] += 1
+
+    def clear(self):
+        "Empties the cache."
+        self.entries.clear()
+        self.size = 0
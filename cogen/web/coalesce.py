@@ -0,0 +1,164 @@
+"""
+Request coalescing middleware.
+
+:class:`CoalescingMiddleware` runs the app once for identical concurrent
+requests: the first request runs it (with
+:class:`cogen.core.singleflight.SingleFlight`), the ones that come while it
+runs wait for it and all of them get the same response - or the same
+exception. With `cache_ttl` the response is also kept for that many seconds,
+that absorbs repeated bursts.
+
+Requests are identical if they have the same method (GET or HEAD), host, path,
+query string and the same values for the `vary` headers. Requests with a body,
+a ``Cookie`` or ``Authorization`` header (unless they are in `vary`) aren't
+coalesced. Responses with a ``Set-Cookie`` or ``Cache-Control: private`` (or
+``no-store``) aren't shared: the waiting requests run the app themselves (and
+aren't kept).
+
+The response is collected in memory before it's sent (so this isn't for big or
+streamed responses); the app can use the coroutine extensions - the operations
+are run by the first request.
+
+Usage:
+
+.. sourcecode:: python
+
+    app = coalesce.CoalescingMiddleware(app, cache_ttl=1)
+"""
+__all__ = ['CoalescingMiddleware']
+
+import sys
+
+from cogen.core.coroutines import coroutine
+from cogen.core.singleflight import SingleFlight
+
+def environ_key(header):
+    "Returns the environ key for a request header."
+    return 'HTTP_' + header.upper().replace('-', '_')
+
+def shareable(headers):
+    "Returns False if the response is for a single client."
+    for name, value in headers:
+        name = name.lower()
+        if name == 'set-cookie':
+            return False
+        if name == 'cache-control':
+            value = value.lower()
+            if 'private' in value or 'no-store' in value:
+                return False
+    return True
+
+def cacheable(result):
+    leader, status, headers, body = result
+    return status.startswith('200') and shareable(headers)
+
+class CoalescingMiddleware(object):
+    """
+    Options:
+
+    * cache_ttl - seconds a response is kept after the app finished it
+      (0 - not kept)
+    * cache_size - the maximum number of kept responses
+    * vary - the request headers that make different responses
+
+    The counts in `group.stats`: `calls` (the app ran), `shared` (the request
+    waited for another one) and `hits` (a kept response was sent).
+    """
+    def __init__(self, app, global_conf={}, cache_ttl=0, cache_size=1024,
+                 vary=('Accept-Encoding',)):
+        self.app = app
+        if isinstance(vary, basestring):
+            vary = vary.split()
+        self.vary = tuple(environ_key(header) for header in vary)
+        self.group = SingleFlight(float(cache_ttl), int(cache_size),
+                                  cacheable)
+
+    def __repr__(self):
+        return "<%s@%X group:%r>" % (
+            self.__class__.__name__,
+            id(self),
+            self.group
+        )
+
+    def key(self, environ):
+        "Returns the key for `environ` or None if it can't be coalesced."
+        method = environ['REQUEST_METHOD']
+        if method not in ('GET', 'HEAD'):
+            return
+        if environ.get('CONTENT_LENGTH') not in (None, '', '0') or \
+                'HTTP_TRANSFER_ENCODING' in environ:
+            return
+        for private in ('HTTP_COOKIE', 'HTTP_AUTHORIZATION'):
+            if private in environ and private not in self.vary:
+                return
+        return (method, environ.get('HTTP_HOST'), environ.get('PATH_INFO'),
+                environ.get('QUERY_STRING')) + \
+               tuple(environ.get(header) for header in self.vary)
+
+    def __call__(self, environ, start_response):
+        key = self.key(environ)
+        if key is None:
+            return self.app(environ, start_response)
+        return self.coalesced(environ, start_response, key)
+
+    def coalesced(self, environ, start_response, key):
+        # tells if this request ran the app (the kept responses don't hold
+        # on to the environ)
+        token = object()
+        yield environ['cogen.call'](self.group.do)(key, self.run_app, environ,
+                                                   token)
+        proxy = environ['cogen.wsgi']
+        if proxy.exception:
+            exc_type, exc_value, traceback = proxy.exception
+            proxy.exception = None
+            raise exc_type, exc_value, traceback
+        leader, status, headers, body = proxy.result
+        proxy.result = None
+        if leader is not token and not shareable(headers):
+            result = self.app(environ, start_response)
+            try:
+                for chunk in result:
+                    yield chunk
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+            return
+        start_response(status, list(headers))
+        yield body
+
+    @coroutine
+    def run_app(self, environ, token):
+        """Runs the app (and the operations it yields) and returns a
+        (token, status, headers, body) tuple."""
+        response = []
+        body = []
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            response[:] = status, headers
+            return body.append
+        proxy = environ['cogen.wsgi']
+        result = self.app(environ, start_response)
+        try:
+            for chunk in result:
+                if chunk:
+                    body.append(chunk)
+                elif proxy.operation:
+                    operation = proxy.operation
+                    proxy.operation = None
+                    try:
+                        proxy.exception = None
+                        proxy.result = yield operation
+                    except:
+                        proxy.exception = sys.exc_info()
+                        proxy.result = proxy.exception[1]
+                    del operation
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        if not response:
+            raise RuntimeError("The app hasn't called start_response.")
+        status, headers = response
+        raise StopIteration((token, status, headers, ''.join(body)))
+
+coalesce = CoalescingMiddleware
@@ -0,0 +1,382 @@
+"""
+Response compression middleware.
+
+:class:`CompressionMiddleware` compresses the responses (gzip or deflate, as
+the client accepts) chunk by chunk while the app iterator yields them. The
+empty strings the coroutine extensions yield are passed through (the data
+compressed till then is flushed first, so the client gets it before the app
+waits).
+
+Small bodies (a ``Content-Length`` or a list response under `min_size`),
+content types that don't compress well (images, archives etc) and responses
+with a ``Content-Encoding`` or ``Cache-Control: no-transform`` aren't
+compressed. A ``wsgi.file_wrapper`` that isn't compressed is passed as it is -
+the server still uses sendfile.
+
+The compressed variants of responses with a ``ETag`` (eg: the files of
+:class:`cogen.web.static.StaticApp`) are cached, in at most `cache_size`
+bytes: the next time the app returns the same ETag the cached data is sent
+without iterating the app. The ETag of a compressed response gets a
+``-gzip`` (or ``-deflate``) suffix, it's removed from ``If-None-Match``
+before the app sees it.
+
+A HEAD request gets the headers the GET would get (without a
+``Content-Length`` if the compressed variant isn't cached).
+
+Usage:
+
+.. sourcecode:: python
+
+    app = compression.CompressionMiddleware(app, min_size=1024)
+"""
+__all__ = ['CompressionMiddleware']
+
+import collections
+import itertools
+import zlib
+
+COMPRESSIBLE_TYPES = (
+    'application/javascript', 'application/json', 'application/xml',
+    'application/xhtml+xml', 'application/rss+xml', 'application/atom+xml',
+    'application/x-javascript', 'image/svg+xml',
+)
+
+def choose_encoding(accept_encoding):
+    """Returns 'gzip', 'deflate' or None (if the client accepts none of
+    them) for a ``Accept-Encoding`` header."""
+    qualities = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        if name == 'x-gzip':
+            name = 'gzip'
+        qualities[name] = quality
+    default = qualities.get('*', 0)
+    best = None, 0
+    for encoding in ('gzip', 'deflate'):
+        quality = qualities.get(encoding, default)
+        if quality > best[1]:
+            best = encoding, quality
+    return best[0]
+
+def compressible(content_type, types=COMPRESSIBLE_TYPES):
+    content_type = content_type.split(';', 1)[0].strip().lower()
+    return content_type.startswith('text/') or content_type in types or \
+           content_type.endswith('+json') or content_type.endswith('+xml')
+
+def get_header(headers, name):
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+
+class CompressedResponse(object):
+    "The state of a response that might get compressed."
+    __slots__ = ('middleware', 'encoding', 'suffix', 'server_start_response',
+                 'status', 'headers', 'exc_info', 'pending', 'stripped',
+                 'head')
+
+    def __init__(self, middleware, encoding, start_response, head=False):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.suffix = '-' + encoding + '"'
+        self.server_start_response = start_response
+        self.status = None
+        self.headers = None
+        self.exc_info = None
+        self.pending = []
+        self.stripped = False
+        self.head = head
+
+    def start_response(self, status, headers, exc_info=None):
+        "The start_response for the app - the decision is made later."
+        self.status = status
+        self.headers = list(headers)
+        self.exc_info = exc_info
+        return self.pending.append
+
+    def should_compress(self, result):
+        "Returns True if the response should be compressed."
+        middleware = self.middleware
+        if self.status[:3] != '200':
+            return False
+        headers = self.headers
+        if get_header(headers, 'content-encoding'):
+            return False
+        if 'no-transform' in (get_header(headers, 'cache-control') or ''):
+            return False
+        content_type = get_header(headers, 'content-type')
+        if not content_type or not compressible(content_type,
+                                                middleware.types):
+            return False
+        length = get_header(headers, 'content-length')
+        if length is not None:
+            length = int(length)
+        elif isinstance(result, (list, tuple)):
+            length = sum(len(chunk) for chunk in result)
+        if length is not None and \
+                length + sum(len(chunk) for chunk in self.pending) < \
+                middleware.min_size:
+            return False
+        return True
+
+    def cache_key(self, environ):
+        """Returns the key for the cache (None if the response shouldn't be
+        cached)."""
+        if not self.middleware.cache_size:
+            return
+        etag = get_header(self.headers, 'etag')
+        if not etag or etag.startswith('W/'):
+            return
+        cache_control = get_header(self.headers, 'cache-control') or ''
+        if 'no-store' in cache_control or 'private' in cache_control:
+            return
+        return (environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', ''),
+                etag, self.encoding)
+
+    def pass_through(self):
+        "Starts the response as the app made it."
+        status, headers = self.status, self.headers
+        if status[:3] == '304' and self.stripped:
+            # the client has our compressed variant
+            headers = self.tag_headers(headers)
+        write = self.server_start_response(status, headers, self.exc_info)
+        for data in self.pending:
+            write(data)
+
+    def tag_headers(self, headers):
+        "Changes the ETag for the compressed variant."
+        return [
+            (key, key.lower() == 'etag' and value.endswith('"') and
+                  value[:-1] + self.suffix or value)
+            for key, value in headers
+        ]
+
+    def start_compressed(self, length=None):
+        headers = []
+        vary = None
+        for key, value in self.tag_headers(self.headers):
+            name = key.lower()
+            if name in ('content-length', 'accept-ranges'):
+                continue
+            if name == 'vary':
+                vary = value
+                value += ', Accept-Encoding'
+            headers.append((key, value))
+        if vary is None:
+            headers.append(('Vary', 'Accept-Encoding'))
+        headers.append(('Content-Encoding', self.encoding))
+        if length is not None:
+            headers.append(('Content-Length', str(length)))
+        self.server_start_response(self.status, headers, self.exc_info)
+
+class CompressionMiddleware(object):
+    """
+    Options:
+
+    * level - the zlib compression level
+    * min_size - bodies smaller than this aren't compressed
+    * types - the compressible content types (besides text/* and the +json
+      and +xml types)
+    * cache_size - the maximum size (in bytes) of the cached compressed
+      variants (0 - no caching)
+    * cache_entry_size - bigger compressed variants aren't cached
+
+    The `compressed` and `skipped` (not compressed) responses, the cache
+    `hits` and the bytes before (`bytes_in`) and after compression
+    (`bytes_out`) are counted in `stats`.
+    """
+    def __init__(self, app, global_conf={}, level=6, min_size=512,
+                 types=COMPRESSIBLE_TYPES, cache_size=8*1024*1024,
+                 cache_entry_size=1024*1024):
+        self.app = app
+        self.level = int(level)
+        self.min_size = int(min_size)
+        if isinstance(types, basestring):
+            types = types.split()
+        self.types = tuple(types)
+        self.cache_size = int(cache_size)
+        self.cache_entry_size = int(cache_entry_size)
+        self.cache = collections.OrderedDict()
+        self.cache_bytes = 0
+        self.stats = {
+            'compressed': 0,
+            'skipped': 0,
+            'hits': 0,
+            'bytes_in': 0,
+            'bytes_out': 0,
+        }
+
+    def __repr__(self):
+        return "<%s@%X cached:%s/%s>" % (
+            self.__class__.__name__,
+            id(self),
+            len(self.cache),
+            self.cache_bytes
+        )
+
+    def __call__(self, environ, start_response):
+        encoding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if not encoding:
+            return self.app(environ, start_response)
+        response = CompressedResponse(self, encoding, start_response,
+                                      environ['REQUEST_METHOD'] == 'HEAD')
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and response.suffix in if_none_match:
+            environ['HTTP_IF_NONE_MATCH'] = if_none_match.replace(
+                response.suffix, '"')
+            response.stripped = True
+        result = self.app(environ, response.start_response)
+        if response.status is not None:
+            # started already (not a generator)
+            if response.head:
+                if hasattr(result, 'close'):
+                    result.close()
+                # measured like for the GET, if the app made the body
+                self.start_head(environ, response, result or None)
+                return []
+            if not response.should_compress(result):
+                # this keeps a file wrapper
+                self.stats['skipped'] += 1
+                response.pass_through()
+                return result
+            data = self.cached(environ, response)
+            if data is not None:
+                if hasattr(result, 'close'):
+                    result.close()
+                return [data]
+        return self.respond(environ, response, result)
+
+    def cached(self, environ, response):
+        """Starts the response and returns the cached compressed data (None
+        if it isn't cached)."""
+        key = response.cache_key(environ)
+        data = key and self.lookup(key)
+        if data is not None:
+            self.stats['hits'] += 1
+            response.start_compressed(len(data))
+        return data
+
+    def start_head(self, environ, response, result=None):
+        """Starts the response for a HEAD request, with the headers of the
+        GET. Without a body (in `result`) just the ``Content-Length`` is
+        checked for the `min_size`."""
+        if not response.should_compress(result):
+            self.stats['skipped'] += 1
+            response.pass_through()
+        elif self.cached(environ, response) is None:
+            response.start_compressed()
+
+    def respond(self, environ, response, result):
+        """Yields the response's data. The app iterator is compressed if
+        it should be."""
+        chunks = iter(result)
+        started = False
+        try:
+            for chunk in chunks:
+                if started:
+                    yield chunk
+                    continue
+                if response.status is None:
+                    # a coroutine operation before start_response
+                    yield chunk
+                    continue
+                started = True
+                if response.head:
+                    self.start_head(environ, response)
+                    return
+                if not response.should_compress(None):
+                    self.stats['skipped'] += 1
+                    response.pass_through()
+                    yield chunk
+                    continue
+                data = self.cached(environ, response)
+                if data is not None:
+                    yield data
+                    return
+                response.start_compressed()
+                for data in self.compress(response, chunks, chunk,
+                                          response.cache_key(environ)):
+                    yield data
+                return
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        if not started and response.status is not None:
+            # the app started the response but didn't yield anything
+            if response.head:
+                self.start_head(environ, response)
+            else:
+                self.stats['skipped'] += 1
+                response.pass_through()
+
+    def compress(self, response, chunks, first, key):
+        """Yields the compressed data of the `first` chunk and the rest of
+        the `chunks`."""
+        self.stats['compressed'] += 1
+        if response.encoding == 'gzip':
+            wbits = 16 + zlib.MAX_WBITS
+        else:
+            wbits = zlib.MAX_WBITS
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, wbits)
+        output = key and []
+        unflushed = False
+        bytes_in = bytes_out = 0
+        try:
+            for chunk in itertools.chain(response.pending, (first, ), chunks):
+                if chunk:
+                    bytes_in += len(chunk)
+                    data = compressor.compress(chunk)
+                    unflushed = True
+                elif unflushed:
+                    # the app waits for a operation, send what we have first
+                    data = compressor.flush(zlib.Z_SYNC_FLUSH)
+                    unflushed = False
+                else:
+                    data = ''
+                if data:
+                    bytes_out += len(data)
+                    if output is not None:
+                        output.append(data)
+                    yield data
+                if not chunk:
+                    yield ''
+            data = compressor.flush()
+            bytes_out += len(data)
+            yield data
+        finally:
+            self.stats['bytes_in'] += bytes_in
+            self.stats['bytes_out'] += bytes_out
+        if output is not None:
+            output.append(data)
+            self.store(key, ''.join(output))
+
+    def lookup(self, key):
+        "Returns the cached compressed data or None."
+        data = self.cache.pop(key, None)
+        if data is not None:
+            # the most recently used are on the right
+            self.cache[key] = data
+        return data
+
+    def store(self, key, data):
+        if len(data) > self.cache_entry_size:
+            return
+        old = self.cache.pop(key, None)
+        if old is not None:
+            self.cache_bytes -= len(old)
+        self.cache[key] = data
+        self.cache_bytes += len(data)
+        while self.cache_bytes > self.cache_size:
+            self.cache_bytes -= len(self.cache.popitem(last=False)[1])
+
+compress = CompressionMiddleware
@@ -0,0 +1,388 @@
+"""
+A static file app.
+
+:class:`StaticApp` serves the files from a directory:
+
+* the open files and their ``stat`` results are kept in a LRU cache - a file
+  is stat'ed again (and reopened if it changed) only after `ttl` seconds
+* conditional GETs (``If-None-Match`` and ``If-Modified-Since``) get a 304 from
+  the cached ETag and modification time
+* a single ``Range`` (and ``If-Range``) is served with a 206 - the server
+  sendfile's just that part of the file
+* small files are served from memory
+
+Usage:
+
+.. sourcecode:: python
+
+    from cogen.web import wsgi, static
+
+    server = wsgi.WSGIServer(('0.0.0.0', 8080), static.StaticApp('/var/www'),
+                             sched)
+
+The files are sent with the server's sendfile if the app isn't wrapped in
+middleware that replaces ``wsgi.file_wrapper``, or read in `block_size`
+chunks from a new file object otherwise.
+"""
+__all__ = ['StaticApp']
+
+import collections
+import mimetypes
+import os
+import rfc822
+import time
+
+from wsgiref import util
+
+from cogen.web.wsgi import WSGIFileWrapper
+
+
+class FileEntry(object):
+    "A cached file."
+    __slots__ = ('path', 'file', 'data', 'key', 'size', 'mtime', 'etag',
+                 'last_modified', 'content_type', 'checked', 'users',
+                 'evicted')
+
+    def __init__(self, path, st, content_type):
+        self.path = path
+        self.file = None
+        self.data = None
+        self.key = stat_key(st)
+        self.size = st.st_size
+        self.mtime = int(st.st_mtime)
+        self.etag = '"%x-%x-%x"' % (st.st_ino, st.st_size,
+                                    int(st.st_mtime * 1000))
+        self.last_modified = rfc822.formatdate(st.st_mtime)
+        self.content_type = content_type
+        self.checked = time.time()
+        self.users = 0
+        self.evicted = False
+
+    def __repr__(self):
+        return "<%s@%X path:%r size:%s users:%s>" % (
+            self.__class__.__name__,
+            id(self),
+            self.path,
+            self.size,
+            self.users
+        )
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+def stat_key(st):
+    return st.st_ino, st.st_size, st.st_mtime
+
+def parse_range(value, size):
+    """Returns the (first, last) byte positions for a single range ``Range``
+    header, None if the header should be ignored (malformed or multiple
+    ranges) or False if the range can't be satisfied."""
+    unit, _, spec = value.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        return
+    try:
+        if first:
+            first = int(first)
+            if last:
+                last = int(last)
+                if last < first:
+                    return
+                last = min(last, size - 1)
+            else:
+                last = size - 1
+            if first >= size:
+                return False
+        elif last:
+            suffix = int(last)
+            if not suffix:
+                return False
+            first, last = max(size - suffix, 0), size - 1
+        else:
+            return
+    except ValueError:
+        return
+    return first, last
+
+class StaticApp(object):
+    """
+    Options:
+
+    * root - the directory with the files
+    * ttl - seconds a cached file isn't checked for changes
+    * max_files - the maximum number of open files kept in the cache
+    * max_memory - the maximum size (in bytes) of the small files kept in
+      memory
+    * small_size - files up to this size are kept in memory (0 - none)
+    * block_size - the size of the chunks when the file is read
+    * index_file - the file served for a directory (None - 404)
+    * max_age - the ``Cache-Control`` max-age (None - no header)
+    * default_type - the ``Content-Type`` for unknown extensions
+
+    The cache `hits`, `misses`, `revalidations` (a changed file),
+    `evictions` and `not_modified` responses are counted in `stats`.
+    """
+    def __init__(self, root, ttl=1, max_files=256, max_memory=16*1024*1024,
+                 small_size=16*1024, block_size=64*1024,
+                 index_file='index.html', max_age=None,
+                 default_type='application/octet-stream'):
+        self.root = os.path.abspath(root)
+        self.ttl = ttl
+        self.max_files = max_files
+        self.max_memory = max_memory
+        self.small_size = small_size
+        self.block_size = block_size
+        self.index_file = index_file
+        self.max_age = max_age
+        self.default_type = default_type
+        self.cache = collections.OrderedDict()
+        self.open_files = 0
+        self.memory = 0
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'revalidations': 0,
+            'evictions': 0,
+            'not_modified': 0,
+        }
+
+    def __repr__(self):
+        return "<%s@%X root:%r files:%s open:%s memory:%s>" % (
+            self.__class__.__name__,
+            id(self),
+            self.root,
+            len(self.cache),
+            self.open_files,
+            self.memory
+        )
+
+    def full_path(self, path_info):
+        """Returns the file's path for `path_info` (None if it's outside the
+        root or it can't be a file name)."""
+        if '\0' in path_info:
+            return
+        path = os.path.normpath(os.path.join(self.root,
+                                             path_info.lstrip('/')))
+        if path != self.root and \
+                not path.startswith(self.root.rstrip(os.sep) + os.sep):
+            return
+        return path
+
+    def load(self, path):
+        """Returns a new FileEntry for `path`. Raises EnvironmentError if the
+        file can't be opened."""
+        fh = open(path, 'rb')
+        try:
+            st = os.fstat(fh.fileno())
+            entry = FileEntry(
+                path, st,
+                mimetypes.guess_type(path)[0] or self.default_type
+            )
+            if entry.size <= self.small_size:
+                entry.data = fh.read()
+                self.memory += len(entry.data)
+            else:
+                entry.file = fh
+                self.open_files += 1
+                fh = None
+        finally:
+            if fh:
+                fh.close()
+        return entry
+
+    def lookup(self, path):
+        """Returns the FileEntry for `path` from the cache (loads it if it
+        isn't cached or it changed). Raises EnvironmentError if the file can't
+        be opened."""
+        entry = self.cache.pop(path, None)
+        if entry is not None:
+            now = time.time()
+            if now - entry.checked > self.ttl:
+                try:
+                    changed = stat_key(os.stat(path)) != entry.key
+                except EnvironmentError:
+                    changed = True
+                if changed:
+                    self.stats['revalidations'] += 1
+                    self.drop(entry)
+                    entry = None
+                else:
+                    entry.checked = now
+        if entry is None:
+            self.stats['misses'] += 1
+            entry = self.load(path)
+        else:
+            self.stats['hits'] += 1
+        # the most recently used are on the right
+        self.cache[path] = entry
+        self.trim()
+        return entry
+
+    def drop(self, entry):
+        """Forgets a entry that isn't in the cache anymore. The file is
+        closed when the last response using it is done."""
+        entry.evicted = True
+        if entry.data is not None:
+            self.memory -= len(entry.data)
+        if entry.file:
+            self.open_files -= 1
+            if not entry.users:
+                entry.close()
+
+    def trim(self):
+        "Evicts the least recently used entries till the limits are met."
+        for path in list(self.cache):
+            too_many = self.open_files > self.max_files
+            too_big = self.memory > self.max_memory
+            if not too_many and not too_big:
+                break
+            entry = self.cache[path]
+            if entry.file and too_many or entry.data is not None and too_big:
+                del self.cache[path]
+                self.drop(entry)
+                self.stats['evictions'] += 1
+
+    def release(self, entry):
+        "Called when a response that sends the entry's file is done."
+        entry.users -= 1
+        if entry.evicted and not entry.users:
+            entry.close()
+
+    def clear(self):
+        "Empties the cache."
+        while self.cache:
+            self.drop(self.cache.popitem()[1])
+
+    def not_modified(self, entry, environ):
+        """Returns True if the client has the current version of the file
+        (If-None-Match wins over If-Modified-Since)."""
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            if if_none_match.strip() == '*':
+                return True
+            for tag in if_none_match.split(','):
+                tag = tag.strip()
+                if tag.startswith('W/'):
+                    tag = tag[2:]
+                if tag == entry.etag:
+                    return True
+            return False
+        if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since:
+            date = rfc822.parsedate_tz(if_modified_since)
+            return bool(date) and rfc822.mktime_tz(date) >= entry.mtime
+        return False
+
+    def respond(self, start_response, status, headers=(), body=''):
+        headers = list(headers)
+        headers.extend([
+            ('Content-Type', 'text/plain'),
+            ('Content-Length', str(len(body))),
+        ])
+        start_response(status, headers)
+        return [body]
+
+    def __call__(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        if method not in ('GET', 'HEAD'):
+            return self.respond(start_response, '405 Method Not Allowed',
+                                [('Allow', 'GET, HEAD')],
+                                'Method not allowed.')
+        path_info = environ.get('PATH_INFO', '') or '/'
+        path = self.full_path(path_info)
+        if path is None:
+            return self.respond(start_response, '404 Not Found', (),
+                                'Not found.')
+        try:
+            entry = self.lookup(path)
+        except EnvironmentError:
+            # a directory can't be opened - it's only stat'ed then, the
+            # cached files aren't
+            if not os.path.isdir(path):
+                return self.respond(start_response, '404 Not Found', (),
+                                    'Not found.')
+            if not path_info.endswith('/'):
+                location = util.request_uri(environ, include_query=False)
+                location += '/'
+                if environ.get('QUERY_STRING'):
+                    location += '?' + environ['QUERY_STRING']
+                return self.respond(start_response, '301 Moved Permanently',
+                                    [('Location', location)])
+            if not self.index_file:
+                return self.respond(start_response, '404 Not Found', (),
+                                    'Not found.')
+            path = os.path.join(path, self.index_file)
+            try:
+                entry = self.lookup(path)
+            except EnvironmentError:
+                return self.respond(start_response, '404 Not Found', (),
+                                    'Not found.')
+
+        headers = [
+            ('ETag', entry.etag),
+            ('Last-Modified', entry.last_modified),
+        ]
+        if self.max_age is not None:
+            headers.append(('Cache-Control', 'max-age=%d' % self.max_age))
+        if self.not_modified(entry, environ):
+            self.stats['not_modified'] += 1
+            start_response('304 Not Modified', headers)
+            return []
+
+        status = '200 OK'
+        first, last = 0, entry.size - 1
+        value = environ.get('HTTP_RANGE')
+        if value and entry.size:
+            if_range = environ.get('HTTP_IF_RANGE')
+            if not if_range or if_range in (entry.etag, entry.last_modified):
+                byte_range = parse_range(value, entry.size)
+                if byte_range is False:
+                    headers.append(('Content-Range', 'bytes */%d' % entry.size))
+                    return self.respond(start_response,
+                                        '416 Requested Range Not Satisfiable',
+                                        headers)
+                if byte_range:
+                    first, last = byte_range
+                    status = '206 Partial Content'
+                    headers.append(('Content-Range', 'bytes %d-%d/%d' % (
+                        first, last, entry.size)))
+        length = last - first + 1
+        headers.extend([
+            ('Content-Type', entry.content_type),
+            ('Content-Length', str(length)),
+            ('Accept-Ranges', 'bytes'),
+        ])
+        start_response(status, headers)
+        if method == 'HEAD' or not length:
+            return []
+        if entry.data is not None:
+            if length == entry.size:
+                return [entry.data]
+            return [entry.data[first:last + 1]]
+        if environ.get('wsgi.file_wrapper') is WSGIFileWrapper:
+            # the cached file is shared: the server and the wrapper (when
+            # it's iterated) read from their own position
+            entry.users += 1
+            response = WSGIFileWrapper(entry.file, self.block_size, first,
+                                       length)
+            response.close = lambda: self.release(entry)
+            return response
+        return self.read_file(path, first, length)
+
+    def read_file(self, path, offset, length):
+        "Yields `length` bytes from `offset` in `block_size` chunks."
+        fh = open(path, 'rb')
+        try:
+            fh.seek(offset)
+            while length > 0:
+                data = fh.read(min(self.block_size, length))
+                if not data:
+                    break
+                length -= len(data)
+                yield data
+        finally:
+            fh.close()
@@ -68,14 +68,20 @@ from urlparse import urlparse
 from traceback import format_exc
 
 from cogen import core, __version__
-from cogen.core import proactors, sockets, events
+from cogen.core import proactors, sockets, events, tuning, resolver
 from cogen.core.util import priority
 from cogen.core.sockets import SocketError, ConnectionClosed
 from cogen.core.events import OperationTimeout
-from cogen.core.coroutines import coroutine, local
+from cogen.core.coroutines import coroutine, local, CoroutineException
 from cogen.core.schedulers import Scheduler
+try:
+  from cogen.core import tls
+except ImportError:
+  # python without ssl
+  tls = None
 
 import async
+import cache
 
 quoted_slash = re.compile("(?i)%2F")
 useless_socket_errors = {}
@@ -94,14 +100,37 @@ comma_separated_headers = ['ACCEPT', 'ACCEPT-CHARSET', 'ACCEPT-ENCODING',
   'WWW-AUTHENTICATE']
 
 class WSGIFileWrapper:
-  def __init__(self, filelike, blocksize=8192):
+  """The wsgi.file_wrapper. The server sends the file with sendfile.
+
+  `offset` and `length` (cogen extensions) select a part of the file: the
+  data from `offset` (the file's current position if None) and at most
+  `length` bytes (till the end of the file if None).
+
+  When iterated (eg: by middleware) the wrapper seeks to it's own position
+  before every read, so the file object can be shared by several
+  responses."""
+  def __init__(self, filelike, blocksize=8192, offset=None, length=None):
     self.filelike = filelike
     self.blocksize = blocksize
+    self.offset = offset
+    self.length = length
+    self.remaining = length
+    self.position = offset
     if hasattr(filelike,'close'):
       self.close = filelike.close
 
   def __getitem__(self, key):
-    data = self.filelike.read(self.blocksize)
+    if self.position is None and hasattr(self.filelike, 'tell'):
+      self.position = self.filelike.tell()
+    if self.position is not None:
+      self.filelike.seek(self.position)
+    if self.remaining is None:
+      data = self.filelike.read(self.blocksize)
+    else:
+      data = self.filelike.read(min(self.blocksize, self.remaining))
+      self.remaining -= len(data)
+    if self.position is not None:
+      self.position += len(data)
     if data:
       return data
     raise IndexError
@@ -151,12 +180,19 @@ class WSGIConnection(object):
     "wsgi.input": None,
     "wsgi.file_wrapper": WSGIFileWrapper,
   }
+  __slots__ = ('conn', 'wsgi_app', 'server_environ', 'sendfile_timeout',
+               'in_flight', 'connfh', 'environ', 'started_response', 'status',
+               'outheaders', 'sent_headers', 'chunked_write', 'write_buffer',
+               'content_length', 'close_connection', 'response_protocol',
+               'response_cache', 'cache_key', 'cache_ttl', 'cache_body',
+               'cache_bytes')
 
   def __init__(self, sock, wsgi_app, environ, sendfile_timeout):
     self.conn = sock
     self.wsgi_app = wsgi_app
     self.server_environ = environ
     self.sendfile_timeout = sendfile_timeout
+    self.in_flight = None
     self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
     self.connfh = self.conn.makefile()
 
@@ -227,15 +263,41 @@ class WSGIConnection(object):
     buf.append("\r\n")
     return "".join(buf)
 
+  def connection_header(self):
+    """Returns the Connection header for a response that doesn't go
+    through render_headers."""
+    if self.response_protocol == 'HTTP/1.1':
+      if self.close_connection:
+        return "Connection: close\r\n"
+    elif not self.close_connection:
+      return "Connection: Keep-Alive\r\n"
+    return ""
+
+  def cache_start(self):
+    """Starts collecting the response's body if the response can go in the
+    server's response cache."""
+    if self.cache_key is not None:
+      self.cache_ttl = self.response_cache.ttl(self.status, self.outheaders)
+      if self.cache_ttl:
+        self.cache_body = [self.write_buffer.getvalue()]
+        self.cache_bytes = len(self.cache_body[0])
+
+  def cache_collect(self, chunk):
+    self.cache_bytes += len(chunk)
+    if self.cache_bytes > self.response_cache.max_entry_size:
+      self.cache_body = None
+    else:
+      self.cache_body.append(chunk)
+
   def simple_response(self, status, msg=""):
     """Return a operation for writing simple response back to the client."""
     status = str(status)
-    buf = ["%s %s\r\n" % (self.environ['ACTUAL_SERVER_PROTOCOL'], status),
+    buf = ["%s %s\r\n" % (self.server_environ['ACTUAL_SERVER_PROTOCOL'], status),
          "Content-Length: %s\r\n" % len(msg),
          "Content-Type: text/plain\r\n"]
 
-    if status[:3] == "413" and self.response_protocol == 'HTTP/1.1':
-      # Request Entity Too Large
+    if status[:3] in ("413", "503") and self.response_protocol == 'HTTP/1.1':
+      # Request Entity Too Large or we're shedding load
       self.close_connection = True
       buf.append("Connection: close\r\n")
 
@@ -244,15 +306,70 @@ class WSGIConnection(object):
       buf.append(msg)
     return sockets.SendAll(self.conn, "".join(buf))
 
+  def request_done(self):
+    """Takes the request out of the server's in-flight count."""
+    if self.in_flight:
+      self.in_flight.requests -= 1
+      self.in_flight = None
+
+  def park(self):
+    """Returns a operation that waits for the next request without keeping
+    the connection's coroutine around (or None if the server doesn't park
+    idle connections). See :class:`cogen.core.sockets.Park`."""
+    server = self.server_environ.get('cogen.server')
+    if not server or not server.park_idle:
+      return
+    if server.max_connections:
+      target = server.handle(self)
+    else:
+      target = self.run()
+    return self.conn.park(target, self.connfh._rbufsize)
+
   #~ from cogen.core.coroutines import debug_coroutine
   #~ @debug_coroutine
   @coroutine
-  def run(self):
-    """A bit bulky atm..."""
+  def run(self, wakeup=None):
+    """A bit bulky atm...
+
+    Returns True if the connection was parked. `wakeup` is the data (or the
+    CoroutineException) a parked connection got."""
     self.close_connection = False
+    parked = False
 
     try:
+      if wakeup is not None:
+        if isinstance(wakeup, CoroutineException):
+          # closed, errored or timed out while parked
+          return
+        self.connfh._rbuf = wakeup
+      elif tls and isinstance(self.conn, tls.SSLSocket):
+        try:
+          yield self.conn.do_handshake()
+        except (socket.error, OperationTimeout, SocketError):
+          # there's no one to send a error response to
+          return
       while True:
+        if not self.connfh._rbuf:
+          op = self.park()
+          if op is not None:
+            data = yield op
+            if data is None:
+              parked = True
+              break
+            self.connfh._rbuf = data
+
+        request_line = yield self.connfh.readline()
+        if request_line == "\r\n":
+          # RFC 2616 sec 4.1: "... it should ignore the CRLF."
+          tolerance = 5
+          while tolerance and request_line == "\r\n":
+            request_line = yield self.connfh.readline()
+            tolerance -= 1
+          if not tolerance:
+            return
+
+        # the request's state is created only now, a idle connection doesn't
+        # need it
         self.started_response = False
         self.status = ""
         self.outheaders = []
@@ -264,15 +381,6 @@ class WSGIConnection(object):
         ENVIRON = self.environ = self.connection_environ.copy()
         self.environ.update(self.server_environ)
 
-        request_line = yield self.connfh.readline()
-        if request_line == "\r\n":
-          # RFC 2616 sec 4.1: "... it should ignore the CRLF."
-          tolerance = 5
-          while tolerance and request_line == "\r\n":
-            request_line = yield self.connfh.readline()
-            tolerance -= 1
-          if not tolerance:
-            return
         method, path, req_protocol = request_line.strip().split(" ", 2)
         ENVIRON["REQUEST_METHOD"] = method
         ENVIRON["CONTENT_LENGTH"] = ''
@@ -393,6 +501,26 @@ class WSGIConnection(object):
           yield self.simple_response("501 Unimplemented")
           self.close_connection = True
           return
+
+        server = ENVIRON.get('cogen.server')
+        self.response_cache = server and server.response_cache
+        self.cache_key = self.cache_body = None
+        if self.response_cache:
+          key = self.response_cache.key(ENVIRON)
+          if key is not None:
+            entry = self.response_cache.lookup(key, ENVIRON)
+            if entry:
+              # a pre-rendered response, the app isn't called
+              yield sockets.SendAll(self.conn, entry.render(
+                method == 'HEAD', self.connection_header()))
+              if self.close_connection:
+                return
+              ENVIRON = entry = None
+              self.environ = self.outheaders = self.write_buffer = None
+              continue
+            if method == 'GET':
+              self.cache_key = key
+
         ENV_COGEN_PROXY = ENVIRON['cogen.wsgi'] = async.COGENProxy(
           content_length = int(ENVIRON.get('CONTENT_LENGTH', None) or 0) or None,
           read_count = 0,
@@ -411,41 +539,49 @@ class WSGIConnection(object):
           self.connfh
         )
         ENVIRON['cogen.yield'] = async.COGENSimpleWrapper(ENV_COGEN_PROXY)
+
+        if server:
+          reason = server.overloaded()
+          if reason:
+            yield self.simple_response("503 Service Unavailable", reason)
+            return
+          server.requests += 1
+          self.in_flight = server
         response = self.wsgi_app(ENVIRON, self.start_response)
         #~ print 'WSGI RESPONSE:', response
         try:
           if isinstance(response, WSGIFileWrapper):
-            # set tcp_cork to pack the header with the file data
-            if hasattr(socket, "TCP_CORK"):
-              self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 1)
-
             assert self.started_response, "App returned the wsgi.file_wrapper but didn't call start_response."
             assert not self.sent_headers
 
             self.sent_headers = True
-            yield sockets.SendAll(self.conn,
-                    self.render_headers()+self.write_buffer.getvalue()
-            )
-
-            offset = response.filelike.tell()
+            header = self.render_headers()+self.write_buffer.getvalue()
+            trailer = ''
+
+            offset = response.offset
+            if offset is None:
+              offset = response.filelike.tell()
+            length = response.length
+            if length is None:
+              length = self.content_length
             if self.chunked_write:
-              fsize = os.fstat(response.filelike.fileno()).st_size
-              yield sockets.SendAll(self.conn, hex(int(fsize-offset))+"\r\n")
+              if length is None:
+                fsize = os.fstat(response.filelike.fileno()).st_size
+                length = fsize-offset
+              header += hex(int(length))[2:]+"\r\n"
+              trailer = "\r\n"
+            # the headers go in the same packets as the file data (the
+            # socket is corked while sending)
             yield self.conn.sendfile(
               response.filelike,
-              blocksize=response.blocksize,
               offset=offset,
-              length=self.content_length,
+              length=length,
+              blocksize=response.blocksize,
+              header=header,
+              trailer=trailer,
               timeout=self.sendfile_timeout
             )
 
-            if self.chunked_write:
-              yield sockets.SendAll(self.conn, "\r\n")
-            #  also, tcp_cork will make the file data sent on packet boundaries,
-            # wich is a good thing
-            if hasattr(socket, "TCP_CORK"):
-              self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 0)
-
           else:
             for chunk in response:
               if chunk:
@@ -453,8 +589,11 @@ class WSGIConnection(object):
                 if not self.sent_headers:
                   self.sent_headers = True
                   headers = [self.render_headers(), self.write_buffer.getvalue()]
+                  self.cache_start()
                 else:
                   headers = []
+                if self.cache_body is not None:
+                  self.cache_collect(chunk)
                 if self.chunked_write:
                   buf = [hex(len(chunk))[2:], "\r\n", chunk, "\r\n"]
                   if headers:
@@ -474,6 +613,7 @@ class WSGIConnection(object):
                     self.sent_headers = True
                     yield sockets.SendAll(self.conn,
                           self.render_headers()+self.write_buffer.getvalue())
+                    self.cache_start()
                 if ENV_COGEN_PROXY.operation:
                   op = ENV_COGEN_PROXY.operation
                   ENV_COGEN_PROXY.operation = None
@@ -497,14 +637,28 @@ class WSGIConnection(object):
             yield sockets.SendAll(self.conn,
               self.render_headers()+self.write_buffer.getvalue()
             )
+            self.cache_start()
         else:
           import warnings
           warnings.warn("App was consumed and hasn't called start_response")
 
-        if self.chunked_write:
+        if self.chunked_write and method != 'HEAD':
+          # (a HEAD response has no body, not even the last chunk)
           yield sockets.SendAll(self.conn, "0\r\n\r\n")
+        if self.cache_body is not None:
+          self.response_cache.store(
+            self.cache_key,
+            "%s %s\r\n" % (ENVIRON['ACTUAL_SERVER_PROTOCOL'], self.status),
+            self.outheaders,
+            "".join(self.cache_body),
+            self.cache_ttl
+          )
+          self.cache_body = None
+        self.request_done()
         if self.close_connection:
           return
+        ENV_COGEN_PROXY = ENVIRON = response = None
+        self.environ = self.outheaders = self.write_buffer = None
         # TODO: consume any unread data
 
     except (socket.error, OSError, pywinerror), e:
@@ -529,8 +683,14 @@ class WSGIConnection(object):
         print "*" * 60
       sys.exc_clear()
     finally:
-      self.conn.close()
-      ENVIRON = self.environ = None
+      if not parked:
+        self.request_done()
+        self.conn.close()
+        self.environ = None
+      # the proxy might have a traceback (with this frame) in it's exception
+      ENV_COGEN_PROXY = ENVIRON = None
+    if parked:
+      raise StopIteration(True)
 class WSGIServer(object):
   """
   An HTTP server for WSGI.
@@ -561,7 +721,30 @@ class WSGIServer(object):
                       HTTP responses. For example, "HTTP/1.1" (the default).
                       This also limits the supported features used in the
                       response.
+  max_connections     the maximum number of open connections, the server
+                      stops accepting new ones till some are closed
+                      (default 0 - no limit).
+  max_requests        the maximum number of requests in the apps at the same
+                      time, new requests get a fast 503 over this
+                      (default 0 - no limit).
+  max_lag             new requests get a fast 503 when the scheduler runs a
+                      timer later than this number of seconds (the loop lag,
+                      measured every `lag_interval` seconds)
+                      (default 0 - no limit).
+  park_idle           connections waiting for a request are kept in the
+                      proactor without a suspended coroutine, this takes a
+                      lot less memory for idle keep-alive connections
+                      (default True).
+  ssl_context         a ``ssl.SSLContext`` (see
+                      :func:`cogen.core.tls.server_context`), the server
+                      speaks https with it (default None - plain http).
+  response_cache      a :class:`cogen.web.cache.ResponseCache`, cached
+                      responses are sent without calling the app
+                      (default None - no caching).
   =================== ========================================================
+
+  The number of times the acceptor was paused and of the requests that got a
+  503 are counted in `stats`.
   """
 
   protocol = "HTTP/1.1"
@@ -575,13 +758,35 @@ class WSGIServer(object):
             request_queue_size=64,
             sockoper_timeout=15,
             sendfile_timeout=-1,
-            sockaccept_greedy=False
+            sockaccept_greedy=False,
+            max_connections=0,
+            max_requests=0,
+            max_lag=0,
+            lag_interval=.1,
+            park_idle=True,
+            ssl_context=None,
+            response_cache=None
         ):
     self.request_queue_size = int(request_queue_size)
     self.sendfile_timeout = sendfile_timeout
     self.sockoper_timeout = sockoper_timeout
     self.scheduler = scheduler
     self.sockaccept_greedy = sockaccept_greedy
+    self.max_connections = max_connections
+    self.max_requests = max_requests
+    self.max_lag = max_lag
+    self.lag_interval = lag_interval
+    self.park_idle = park_idle
+    self.ssl_context = ssl_context
+    self.response_cache = response_cache
+    self.connections = 0
+    self.requests = 0
+    self.lag = 0
+    self.accept_paused = False
+    self.stats = {
+      'accept_pauses': 0,
+      'shed_requests': 0,
+    }
     self.environ['cogen.sched'] = self.scheduler
 
     self.version = "cogen.web/%s %s" % (__version__, scheduler.proactor.__class__.__name__)
@@ -634,6 +839,44 @@ class WSGIServer(object):
 
     For UNIX sockets, supply the filename as a string.""")
 
+  def overloaded(self):
+    """Returns the reason a new request should get a 503 (or None if it
+    can go in the app)."""
+    if self.max_requests and self.requests >= self.max_requests:
+      reason = "Too many requests."
+    elif self.max_lag and self.lag > self.max_lag:
+      reason = "Server overloaded."
+    else:
+      return
+    self.stats['shed_requests'] += 1
+    return reason
+
+  @coroutine
+  def monitor_lag(self):
+    """Measures how late the scheduler wakes up a sleeping coroutine. A high
+    lag is kept and halved every interval so a single good sample doesn't
+    turn off the shedding right away."""
+    while True:
+      start = time.time()
+      yield events.Sleep(self.lag_interval, slack=0)
+      self.lag = max(time.time() - start - self.lag_interval, self.lag / 2)
+
+  @coroutine
+  def handle(self, conn, wakeup=None):
+    """Runs the connection and resumes the acceptor if it was paused by
+    max_connections. A parked connection is still open, it gets a new
+    handle when it wakes up."""
+    parked = False
+    try:
+      parked = yield conn.run(wakeup)
+    finally:
+      # also when the connection failed, or the acceptor stays paused
+      if not parked:
+        self.connections -= 1
+        if self.accept_paused:
+          self.accept_paused = False
+          yield events.Signal(self)
+
   @coroutine
   def serve(self):
     """Run the server forever."""
@@ -658,10 +901,18 @@ class WSGIServer(object):
       host, port = self.bind_addr
       try:
         info = socket.getaddrinfo(host, port, socket.AF_UNSPEC,
-                      socket.SOCK_STREAM, 0, socket.AI_PASSIVE)
+                      socket.SOCK_STREAM, 0,
+                      socket.AI_PASSIVE | socket.AI_NUMERICHOST)
       except socket.gaierror:
-        # Probably a DNS issue. Assume IPv4.
-        info = [(socket.AF_INET, socket.SOCK_STREAM, 0, "", self.bind_addr)]
+        # A hostname, resolve it without blocking the scheduler (IPv6 if
+        # it doesn't have a IPv4 address).
+        try:
+          family = socket.AF_INET
+          addrs = yield resolver.Resolve(host, port, family)
+        except socket.gaierror:
+          family = socket.AF_INET6
+          addrs = yield resolver.Resolve(host, port, family)
+        info = [(family, socket.SOCK_STREAM, 0, "", addr) for addr in addrs]
 
     self.socket = None
     msg = "No socket could be created"
@@ -669,7 +920,7 @@ class WSGIServer(object):
       af, socktype, proto, canonname, sa = res
       #~ print res
       try:
-        self.bind(af, socktype, proto)
+        self.bind(af, socktype, proto, sa)
       except socket.error, msg:
         if self.socket:
           self.socket.close()
@@ -680,11 +931,21 @@ class WSGIServer(object):
       raise socket.error, msg
 
     self.socket.listen(self.request_queue_size)
+    if self.max_lag:
+      yield events.AddCoro(self.monitor_lag)
     with closing(self.socket):
       while True:
+        if self.max_connections and self.connections >= self.max_connections:
+          self.accept_paused = True
+          self.stats['accept_pauses'] += 1
+          yield events.WaitForSignal(self, timeout=-1)
+          continue
         try:
           s, addr = yield sockets.Accept(self.socket, timeout=-1)
           s.settimeout(self.sockoper_timeout)
+          if self.ssl_context:
+            # the handshake is made in the connection's coroutine
+            s = tls.SSLSocket(s, self.ssl_context, server_side=True)
         except Exception, exc:
           # make acceptor more robust in the face of weird
           # accept bugs, XXX: but we might get a infinite loop
@@ -703,6 +964,10 @@ class WSGIServer(object):
         # See http://www.faqs.org/rfcs/rfc2145.html.
         environ["ACTUAL_SERVER_PROTOCOL"] = self.protocol
         environ["SERVER_NAME"] = self.server_name
+        environ["cogen.server"] = self
+        if self.ssl_context:
+          environ["wsgi.url_scheme"] = "https"
+          environ["HTTPS"] = "on"
 
         if isinstance(self.bind_addr, basestring):
           # AF_UNIX. This isn't really allowed by WSGI, which doesn't
@@ -717,16 +982,23 @@ class WSGIServer(object):
 
         conn = self.ConnectionClass(s, self.wsgi_app, environ,
           self.sendfile_timeout)
-        yield events.AddCoro(conn.run, prio=priority.LAST if
-                                     self.sockaccept_greedy else priority.FIRST)
+        prio = priority.LAST if self.sockaccept_greedy else priority.FIRST
+        if self.max_connections:
+          self.connections += 1
+          yield events.AddCoro(self.handle, args=(conn,), prio=prio)
+        else:
+          yield events.AddCoro(conn.run, prio=prio)
 
-  def bind(self, family, type, proto=0):
-    """Create (or recreate) the actual socket object."""
+  def bind(self, family, type, proto=0, addr=None):
+    """Create (or recreate) the actual socket object and bind it to `addr`
+    (a resolved address, the `bind_addr` by default)."""
     self.socket = sockets.Socket(family, type, proto)
     self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     self.socket.setblocking(0)
     #~ self.socket.setsockopt(socket.SOL_SOCKET, socket.TCP_NODELAY, 1)
-    self.socket.bind(self.bind_addr)
+    if addr is None:
+      addr = self.bind_addr
+    self.socket.bind(addr)
 
 def asbool(obj):
     if isinstance(obj, (str, unicode)):
@@ -746,6 +1018,11 @@ class Runner:
       proactor = getattr(proactors, "has_"+options.get('proactor', 'any'))(),
       default_priority = int(options.get('sched_default_priority', priority.FIRST)),
       default_timeout = float(options.get('sched_default_timeout', 0)),
+      timer_slack = float(options.get('sched_timer_slack', 0)),
+      budget_steps = int(options.get('sched_budget_steps', 0)),
+      budget_usec = int(options.get('sched_budget_usec', 0)),
+      adaptive = asbool(options.get('sched_adaptive')) and tuning.Adaptive or None,
+      idle_gc = asbool(options.get('sched_idle_gc')),
       proactor_resolution = float(options.get('proactor_resolution', 0.5)),
       proactor_multiplex_first = asbool(options.get('proactor_multiplex_first', 'true')),
       proactor_greedy = asbool(options.get('proactor_greedy')),
@@ -760,6 +1037,19 @@ class Runner:
       sockoper_timeout=float(options.get('sockoper_timeout', 15)),
       sendfile_timeout=float(options.get('sendfile_timeout', 300)),
       sockaccept_greedy=asbool(options.get('sockaccept_greedy', 'false')),
+      max_connections=int(options.get('max_connections', 0)),
+      max_requests=int(options.get('max_requests', 0)),
+      max_lag=float(options.get('max_lag', 0)),
+      lag_interval=float(options.get('lag_interval', .1)),
+      park_idle=asbool(options.get('park_idle', 'true')),
+      ssl_context=options.get('ssl_certfile') and tls.server_context(
+        options['ssl_certfile'], options.get('ssl_keyfile')
+      ) or None,
+      response_cache=int(options.get('response_cache_size', 0)) and
+        cache.ResponseCache(
+          max_size=int(options['response_cache_size']),
+          default_ttl=float(options.get('response_cache_ttl', 0))
+        ) or None,
     )
     self.sched.add(self.server.serve)
 
@@ -775,6 +1065,16 @@ def server_factory(global_conf, host, port, **options):
     * proactor_resolution: float
     * sched_default_priority: int (see cogen.core.util.priority)
     * sched_default_timeout: float (default: 0 - no timeout)
+    * sched_timer_slack: float (default: 0 - timeouts are not rounded)
+    * sched_budget_steps: int (default: 0 - no limit) - coroutine runs
+      between proactor polls
+    * sched_budget_usec: int (default: 0 - no limit) - microseconds of
+      coroutine runs between proactor polls
+    * sched_adaptive: bool (default: false) - let the scheduler tune
+      proactor_greedy, ops_greedy and proactor_multiplex_first at runtime
+      (the values set here are just the starting point)
+    * sched_idle_gc: bool (default: false) - run python's garbage collection
+      only when the scheduler is idle
     * server_name: str
     * request_queue_size: int
     * sockoper_timeout: float (default: 15 - operations timeout in 15 seconds),
@@ -783,6 +1083,22 @@ def server_factory(global_conf, host, port, **options):
       only applied to sendfile operations (wich might need a much higher timeout
       value)
     * sockaccept_greedy: bool
+    * max_connections: int (default: 0 - no limit) - stop accepting over this
+      number of open connections
+    * max_requests: int (default: 0 - no limit) - respond with 503 over this
+      number of in-flight requests
+    * max_lag: float (default: 0 - no limit) - respond with 503 when the loop
+      lags more than this number of seconds
+    * lag_interval: float (default: 0.1) - how often the loop lag is measured
+    * park_idle: bool (default: true) - keep the connections waiting for a
+      request without a suspended coroutine
+    * ssl_certfile: str (default: none - plain http) - serve https with this
+      certificate (PEM, can have the key too)
+    * ssl_keyfile: str - the private key if it's not in ssl_certfile
+    * response_cache_size: int (default: 0 - no cache) - the size in bytes of
+      the in-process response cache (see cogen.web.cache)
+    * response_cache_ttl: float (default: 0) - seconds a response without a
+      Cache-Control max-age is cached
   """
   port = int(port)
 
@@ -0,0 +1,77 @@
+"""
+Measures the memory a WSGIServer needs for a idle keep-alive connection.
+
+A server is forked, then CONNECTIONS keep-alive connections are opened and
+each does one request. The server's resident memory (from /proc, so this is
+linux only) before and after is divided by the number of connections.
+
+This runs with and without parking the idle connections (the park_idle
+option).
+
+Usage: idle-wsgi.py [connections]
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import resource
+
+from cogen.common import *
+from cogen.web import wsgi
+
+CONNECTIONS = len(sys.argv)>1 and int(sys.argv[1]) or 5000
+PORT = 1201
+REQUEST = "GET / HTTP/1.1\r\nHost: localhost\r\n\r\n"
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-type', 'text/plain'),
+                              ('Content-Length', '5')])
+    return ['hello']
+
+def rss(pid):
+    return int(open('/proc/%s/statm' % pid).read().split()[1]) * \
+                                                    resource.getpagesize()
+
+def serve(addr, park_idle):
+    m = Scheduler(default_priority=priority.FIRST, proactor_resolution=1)
+    server = wsgi.WSGIServer(addr, app, m, request_queue_size=1024,
+                        sockoper_timeout=None, park_idle=park_idle)
+    m.add(server.serve)
+    m.run()
+
+def measure(park_idle):
+    addr = ('localhost', PORT)
+    pid = os.fork()
+    if not pid:
+        try:
+            serve(addr, park_idle)
+        finally:
+            os._exit(0)
+    time.sleep(0.5)
+    # a warm up request
+    conns = [socket.create_connection(addr)]
+    conns[0].sendall(REQUEST)
+    conns[0].recv(4096)
+    time.sleep(0.5)
+    before = rss(pid)
+    for i in xrange(CONNECTIONS):
+        conn = socket.create_connection(addr)
+        conn.sendall(REQUEST)
+        conn.recv(4096)
+        conns.append(conn)
+    time.sleep(0.5)
+    after = rss(pid)
+    os.kill(pid, signal.SIGKILL)
+    os.waitpid(pid, 0)
+    for conn in conns:
+        conn.close()
+    return (after - before) / CONNECTIONS
+
+if __name__ == "__main__":
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    for park_idle in (False, True):
+        print "park_idle=%s: %s bytes per idle connection" % (
+            park_idle, measure(park_idle)
+        )
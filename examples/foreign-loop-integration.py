@@ -0,0 +1,66 @@
+"""
+Drives the scheduler from a foreign event loop (a plain select loop here - it
+would be a QSocketNotifier and a single shot QTimer in a Qt app) using
+Scheduler.fileno, Scheduler.next_deadline and Scheduler.run_once.
+
+The foreign loop watches the scheduler's descriptor and wakes up at the
+deadline, there's no polling with a fixed interval.
+"""
+import select
+import socket
+import datetime
+
+from cogen.common import *
+
+m = Scheduler(default_priority=priority.FIRST)
+
+@coroutine
+def server():
+    srv = sockets.Socket()
+    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    srv.bind(('0.0.0.0', 11111))
+    srv.listen(10)
+    while 1:
+        print "Listening..."
+        conn, addr = yield srv.accept()
+        print "Connection from %s:%s" % addr
+        m.add(handler, args=(conn, addr))
+
+@coroutine
+def handler(sock, addr):
+    fh = sock.makefile()
+    yield fh.write("WELCOME TO ECHO SERVER !\r\n")
+    yield fh.flush()
+    while 1:
+        line = yield fh.readline(8192)
+        if not line or line.strip() == 'exit':
+            yield fh.write("GOOD BYE")
+            yield fh.flush()
+            sock.close()
+            return
+        yield fh.write(line)
+        yield fh.flush()
+
+@coroutine
+def ticker():
+    while 1:
+        yield events.Sleep(5)
+        print "Tick."
+
+def foreign_loop():
+    fileno = m.fileno()
+    while 1:
+        deadline = m.next_deadline()
+        if deadline is None:
+            timeout = None
+        else:
+            delta = deadline - datetime.datetime.now()
+            timeout = max(0, delta.days * 86400 + delta.seconds +
+                             delta.microseconds / 1000000.0)
+        select.select([fileno], [], [], timeout)
+        m.run_once()
+
+if __name__ == "__main__":
+    m.add(server)
+    m.add(ticker)
+    foreign_loop()
@@ -0,0 +1,50 @@
+"""
+Measures the cost of nested coroutine calls: every iteration calls a chain of
+DEPTH coroutines, the innermost one just returns a value.
+
+A few busy coroutines are added so the scheduler's active queue isn't empty
+(that's the usual situation in a loaded server).
+"""
+import timeit
+
+from cogen.common import *
+
+DEPTH = 10
+CALLS = 2000
+BUSY = 10
+
+@coroutine
+def leaf():
+    raise StopIteration(1)
+
+@coroutine
+def nested(depth):
+    if depth:
+        result = yield nested(depth - 1)
+    else:
+        result = yield leaf()
+    raise StopIteration(result + 1)
+
+@coroutine
+def caller():
+    for i in xrange(CALLS):
+        result = yield nested(DEPTH)
+        assert result == DEPTH + 2
+
+@coroutine
+def busy():
+    for i in xrange(CALLS):
+        yield
+
+def run():
+    m = Scheduler(default_priority=priority.FIRST)
+    m.add(caller)
+    for i in xrange(BUSY):
+        m.add(busy)
+    m.run()
+
+if __name__ == "__main__":
+    best = min(timeit.Timer('run()', "from __main__ import run").repeat(3, 1))
+    print "%s calls (depth %s) in %.3fs: %.0f calls/s" % (
+        CALLS * (DEPTH + 2), DEPTH, best, CALLS * (DEPTH + 2) / best
+    )
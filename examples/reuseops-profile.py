@@ -0,0 +1,66 @@
+"""
+Compares a send/recv ping-pong over a socketpair with and without
+sockets.setreuseops.
+
+Shows the number of distinct operation objects the coroutines got (that's the
+number of allocations, we keep references to all of them so the ids aren't
+reused) and the run time.
+"""
+import socket
+import timeit
+
+from cogen.common import *
+
+ROUNDS = 20000
+
+def pingpong(keep):
+    a, b = socket.socketpair()
+    a, b = sockets.Socket(_sock=a), sockets.Socket(_sock=b)
+    @coroutine
+    def ping():
+        for i in xrange(ROUNDS):
+            op = a.sendall("x")
+            keep.append(op)
+            yield op
+            op = a.recv(1)
+            keep.append(op)
+            yield op
+    @coroutine
+    def pong():
+        for i in xrange(ROUNDS):
+            op = b.recv(1)
+            keep.append(op)
+            yield op
+            op = b.sendall("y")
+            keep.append(op)
+            yield op
+    m = Scheduler(default_priority=priority.FIRST)
+    m.add(ping)
+    m.add(pong)
+    m.run()
+    a.close()
+    b.close()
+
+def count_ops(reuse):
+    sockets.setreuseops(reuse)
+    ops = []
+    pingpong(ops)
+    return len(set(map(id, ops)))
+
+class Discard(list):
+    def append(self, obj):
+        pass
+
+def run(reuse):
+    sockets.setreuseops(reuse)
+    pingpong(Discard())
+
+if __name__ == "__main__":
+    for reuse in (False, True):
+        print "reuseops=%s: %s operation objects for %s ops" % (
+            reuse, count_ops(reuse), ROUNDS*4
+        )
+        print "reuseops=%s: %.3fs" % (reuse, min(timeit.Timer(
+            'run(%s)' % reuse,
+            "from __main__ import run"
+        ).repeat(3, 1)))
@@ -0,0 +1,55 @@
+"""
+Sends a big file over a loopback connection with SendFile and prints the
+throughput for the sendfile system call, the memory map fallback and plain
+reads.
+
+    python sendfile-bench.py [size in MB]
+"""
+import sys, os, time, socket, threading, tempfile
+from cogen.common import *
+from cogen.core import ossendfile
+from cogen.core.proactors import base
+
+size = int(sys.argv[1:] and sys.argv[1] or 256) * 1024 * 1024
+bigfile = tempfile.TemporaryFile()
+val = os.urandom(1024 * 1024)
+for i in xrange(size / len(val)):
+    bigfile.write(val)
+bigfile.flush()
+
+def drain(listener):
+    sock, addr = listener.accept()
+    while sock.recv(1024 * 1024):
+        pass
+    sock.close()
+
+def bench(name, **kws):
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    sock = socket.create_connection(listener.getsockname())
+    thread = threading.Thread(target=drain, args=(listener,))
+    thread.start()
+    @coroutine
+    def sender():
+        conn = sockets.Socket(_sock=sock)
+        start = time.time()
+        sent = yield conn.sendfile(bigfile, offset=0, header='head',
+                                   trailer='tail', **kws)
+        elapsed = time.time() - start
+        conn.close()
+        print '%-20s %8.1f MB/s' % (name, sent / elapsed / 1024 / 1024)
+    m = Scheduler(proactor_resolution=.5)
+    m.add(sender)
+    m.run()
+    thread.join()
+    listener.close()
+
+if ossendfile.available:
+    bench('sendfile')
+ossendfile.available = False
+base.sendfile = None
+bench('mmap')
+base.map_file = lambda act: False
+bench('read')
+bench('read, 4096 blocks', blocksize=4096)
@@ -45,7 +45,9 @@ setup(
         ],
         'paste.filter_app_factory': [
             'syncinput=cogen.web.async:SynchronousInputMiddleware',
-            'lazysr=cogen.web.async:LazyStartResponseMiddleware'
+            'lazysr=cogen.web.async:LazyStartResponseMiddleware',
+            'compress=cogen.web.compression:CompressionMiddleware',
+            'coalesce=cogen.web.coalesce:CoalescingMiddleware'
         ],
         'apydia.themes': [
             'cogen=docgen.theme',
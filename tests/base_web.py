@@ -5,7 +5,8 @@ import sys
 import exceptions
 import datetime
 import time
-import random
+import errno
+import socket
 import threading
 import thread
 import wsgiref.validate
@@ -20,8 +21,11 @@ sys.setcheckinterval(0)
 
 class WebTest_Base:
     middleware = [wsgiref.validate.validator, async.sync_input]
+    server_options = {}
     def setUp(self):
-        self.local_addr = ('localhost', random.randint(10000,64000))
+        # port 0: the os picks a free port, it's read back once bound
+        self.local_addr = ('localhost', 0)
+        self.wsgi_server = None
         #~ print "http://%s:%s/"%self.local_addr
         def run():
             try:
@@ -32,7 +36,8 @@ class WebTest_Base:
                                         proactor_resolution=1,#0.001,
                                         proactor=self.poller) 
                 self.wsgi_server = wsgi.WSGIServer(self.local_addr, app, self.sched,
-                            sockoper_timeout=None, sendfile_timeout=None) 
+                            sockoper_timeout=None, sendfile_timeout=None,
+                            **self.server_options) 
                 self.serve_ref = self.sched.add(self.wsgi_server.serve)
                 self.sched.run()
             except:
@@ -41,9 +46,24 @@ class WebTest_Base:
             
         self.m_run = threading.Thread(target=run)
         self.m_run.start()
-        time.sleep(0.1)
+        for i in range(500):
+            server = getattr(self, 'wsgi_server', None)
+            if server and server.socket and server.socket.getsockname()[1]:
+                self.local_addr = ('localhost',
+                                   server.socket.getsockname()[1])
+                break
+            time.sleep(0.01)
         self.conn = httplib.HTTPConnection(*self.local_addr)
-        self.conn.connect()
+        for i in range(500):
+            try:
+                self.conn.connect()
+                break
+            except socket.error, e:
+                # bound but not listening yet
+                if e[0] != errno.ECONNREFUSED or i == 499:
+                    raise
+                self.conn.close()
+                time.sleep(0.01)
         
         #~ self.conn.set_debuglevel(10)
     def tearDown(self):
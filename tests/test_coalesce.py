@@ -0,0 +1,107 @@
+__doc_all__ = []
+
+import unittest
+import sys
+import threading
+import httplib
+
+from cogen.common import *
+from cogen.web import coalesce
+
+from base import priorities, proactors_available
+from base_web import WebTest_Base
+
+class Coalesce_MixIn:
+    # the app yields a operation before start_response (the validator
+    # doesn't allow that)
+    middleware = []
+    cache_ttl = 0
+    def setUp(self):
+        self.calls = 0
+        self.app = coalesce.CoalescingMiddleware(self.slow_app,
+                                                 cache_ttl=self.cache_ttl)
+        WebTest_Base.setUp(self)
+    def slow_app(self, environ, start_response):
+        self.calls += 1
+        yield environ['cogen.core'].events.Sleep(0.3)
+        headers = [('Content-Type', 'text/plain')]
+        if environ['PATH_INFO'] == '/cookie':
+            headers.append(('Set-Cookie', 'session=%s' % self.calls))
+        start_response('200 OK', headers)
+        yield 'path:%s ' % environ['PATH_INFO']
+        yield environ['cogen.core'].events.Sleep(0.01)
+        yield 'query:%s' % environ['QUERY_STRING']
+    def get(self, path, **headers):
+        conn = httplib.HTTPConnection(*self.local_addr)
+        conn.request('GET', path, headers=headers)
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        return resp, body
+    def get_many(self, *requests):
+        "Makes the requests at the same time."
+        results = [None] * len(requests)
+        def request(i, path, headers):
+            results[i] = self.get(path, **headers)
+        threads = [threading.Thread(target=request, args=(i, path, headers))
+                   for i, (path, headers) in enumerate(requests)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+class CoalesceShared_MixIn(Coalesce_MixIn):
+    def test_shared(self):
+        results = self.get_many(('/a?x=1', {}), ('/a?x=1', {}),
+                                ('/a?x=1', {}), ('/a?x=2', {}))
+        for resp, body in results[:3]:
+            self.assertEqual(resp.status, 200)
+            self.assertEqual(body, 'path:/a query:x=1')
+        self.assertEqual(results[3][1], 'path:/a query:x=2')
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.app.group.stats['shared'], 2)
+        # nothing is kept
+        resp, body = self.get('/a?x=1')
+        self.assertEqual(self.calls, 3)
+    def test_not_shared(self):
+        results = self.get_many(('/a', {'Accept-Encoding': 'gzip'}),
+                                ('/a', {'Accept-Encoding': 'identity'}),
+                                ('/a', {'Cookie': 'session=1'}))
+        self.assertEqual(self.calls, 3)
+        results = self.get_many(('/cookie', {}), ('/cookie', {}))
+        # the waiting request ran the app itself
+        self.assertEqual(self.calls, 5)
+        self.assertEqual(self.app.group.stats['shared'], 1)
+        self.assertNotEqual(results[0][0].getheader('set-cookie'),
+                            results[1][0].getheader('set-cookie'))
+
+class CoalesceCached_MixIn(Coalesce_MixIn):
+    cache_ttl = 10
+    def test_cached(self):
+        for i in range(3):
+            resp, body = self.get('/a')
+            self.assertEqual(body, 'path:/a query:')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.app.group.stats['hits'], 2)
+        # the kept response doesn't reference the request
+        for expires, result in self.app.group.results.values():
+            self.assert_(not isinstance(result[0], dict))
+        for i in range(2):
+            resp, body = self.get('/cookie')
+        self.assertEqual(self.calls, 3)
+
+for poller_cls in proactors_available:
+    for prio_mixin in priorities:
+        for mixin in (CoalesceShared_MixIn, CoalesceCached_MixIn):
+            name = '%sTest_%s_%s' % (mixin.__name__[:-6], prio_mixin.__name__,
+                                     poller_cls.__name__)
+            globals()[name] = type(
+                name,
+                (mixin, WebTest_Base, prio_mixin, unittest.TestCase),
+                {'poller':poller_cls}
+            )
+
+if __name__ == "__main__":
+    sys.argv.insert(1, '-v')
+    unittest.main()
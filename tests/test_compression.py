@@ -0,0 +1,131 @@
+__doc_all__ = []
+
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import zlib
+
+from cogen.common import *
+from cogen.web import static, compression
+
+from base import priorities, proactors_available
+from base_web import WebTest_Base
+
+class Compression_MixIn:
+    middleware = []
+    TEXT = ''.join('line %s of some text\n' % i for i in range(5000))
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        fh = open(os.path.join(self.root, 'page.html'), 'w')
+        fh.write(self.TEXT)
+        fh.close()
+        self.static = static.StaticApp(self.root)
+        self.app = compression.CompressionMiddleware(self.dispatch,
+                                                     min_size=100)
+        WebTest_Base.setUp(self)
+    def tearDown(self):
+        WebTest_Base.tearDown(self)
+        self.static.clear()
+        shutil.rmtree(self.root)
+    def dispatch(self, environ, start_response):
+        path = environ['PATH_INFO']
+        if path == '/stream':
+            return self.stream(environ, start_response)
+        elif path == '/small':
+            start_response('200 OK', [('Content-Type', 'application/json')])
+            return ['{"a": 1}']
+        elif path == '/image':
+            start_response('200 OK', [('Content-Type', 'image/png')])
+            return [self.TEXT]
+        return self.static(environ, start_response)
+    def stream(self, environ, start_response):
+        # a coroutine operation before and after start_response
+        yield environ['cogen.core'].events.Sleep(0.01)
+        start_response('200 OK', [('Content-Type', 'application/json')])
+        for i in range(3):
+            yield self.TEXT
+            yield environ['cogen.core'].events.Sleep(0.01)
+        yield '{}'
+    def get(self, path, encoding='gzip', method='GET', **headers):
+        if encoding:
+            headers['Accept-Encoding'] = encoding
+        self.conn.request(method, path, headers=headers)
+        resp = self.conn.getresponse()
+        body = resp.read()
+        if method == 'HEAD':
+            pass
+        elif resp.getheader('content-encoding') == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        elif resp.getheader('content-encoding') == 'deflate':
+            body = zlib.decompress(body)
+        return resp, body
+    def test_stream(self):
+        for encoding in ('gzip', 'deflate'):
+            resp, body = self.get('/stream', encoding)
+            self.assertEqual(resp.getheader('content-encoding'), encoding)
+            self.assertEqual(resp.getheader('vary'), 'Accept-Encoding')
+            self.assertEqual(body, self.TEXT * 3 + '{}')
+        self.assertEqual(self.app.stats['compressed'], 2)
+        self.assert_(self.app.stats['bytes_out'] < self.app.stats['bytes_in'] / 3)
+    def test_skipped(self):
+        for path, data, encoding in (('/small', '{"a": 1}', 'gzip'),
+                                     ('/image', self.TEXT, 'gzip'),
+                                     ('/page.html', self.TEXT, 'identity'),
+                                     ('/page.html', self.TEXT, None)):
+            resp, body = self.get(path, encoding)
+            self.assertEqual(resp.getheader('content-encoding'), None)
+            self.assertEqual(body, data)
+        self.assertEqual(self.app.stats['compressed'], 0)
+    def test_cache(self):
+        resp, body = self.get('/page.html')
+        self.assertEqual(body, self.TEXT)
+        etag = resp.getheader('etag')
+        self.assert_(etag.endswith('-gzip"'))
+        resp, body = self.get('/page.html')
+        self.assertEqual(body, self.TEXT)
+        self.assertEqual(resp.getheader('etag'), etag)
+        self.assertEqual(self.app.stats['hits'], 1)
+        self.assertEqual(self.app.stats['compressed'], 1)
+        resp, body = self.get('/page.html', **{'If-None-Match': etag})
+        self.assertEqual(resp.status, 304)
+        self.assertEqual(resp.getheader('etag'), etag)
+        # a different variant
+        resp, body = self.get('/page.html', 'deflate')
+        self.assertEqual(body, self.TEXT)
+        self.assertEqual(self.app.stats['compressed'], 2)
+        self.assertEqual(len(self.app.cache), 2)
+    def test_head(self):
+        # the same headers as the GET
+        resp, body = self.get('/page.html', method='HEAD')
+        self.assertEqual(body, '')
+        self.assertEqual(resp.getheader('content-encoding'), 'gzip')
+        self.assertEqual(resp.getheader('vary'), 'Accept-Encoding')
+        self.assert_(resp.getheader('etag').endswith('-gzip"'))
+        resp, body = self.get('/page.html')
+        self.assertEqual(body, self.TEXT)
+        etag = resp.getheader('etag')
+        length = len(self.app.cache.values()[0])
+        resp, body = self.get('/page.html', method='HEAD')
+        self.assertEqual(body, '')
+        self.assertEqual(resp.getheader('etag'), etag)
+        self.assertEqual(resp.getheader('content-encoding'), 'gzip')
+        self.assertEqual(resp.getheader('content-length'), str(length))
+        resp, body = self.get('/small', method='HEAD')
+        self.assertEqual(resp.getheader('content-encoding'), None)
+        self.assertEqual(self.app.stats['compressed'], 1)
+
+for poller_cls in proactors_available:
+    for prio_mixin in priorities:
+        name = 'CompressionTest_%s_%s' % (prio_mixin.__name__,
+                                          poller_cls.__name__)
+        globals()[name] = type(
+            name,
+            (Compression_MixIn, WebTest_Base, prio_mixin, unittest.TestCase),
+            {'poller':poller_cls}
+        )
+
+if __name__ == "__main__":
+    sys.argv.insert(1, '-v')
+    unittest.main()
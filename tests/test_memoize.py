@@ -0,0 +1,167 @@
+__doc_all__ = []
+
+import unittest
+import sys
+import time
+
+from cogen.common import *
+from cogen.core.memoize import cached
+from base import priorities
+
+class Memoize_MixIn:
+    def setUp(self):
+        self.m = Scheduler(default_priority=self.prio)
+        self.calls = []
+        self.results = []
+    def lookup(self, value, delay=0):
+        "Returns a cached coroutine, the results are strings."
+        self.calls.append(value)
+        if delay:
+            yield events.Sleep(delay)
+        if value == 'missing':
+            raise KeyError(value)
+        elif value == 'bad':
+            raise ValueError(value)
+        elif value == 'none':
+            raise StopIteration(None)
+        raise StopIteration(value * 2)
+    def run_coros(self, *coros):
+        for coro, args in coros:
+            self.m.add(coro, args)
+        self.m.run()
+    def test_lru(self):
+        lookup = cached(maxsize=2, sizeof=len)(coroutine(self.lookup))
+        @coroutine
+        def caller():
+            for value in ('a', 'a', 'b', 'a', 'c', 'b', 'a'):
+                self.results.append((yield lookup(value)))
+        self.run_coros((caller, ()), )
+        self.assertEqual(self.results, ['aa', 'aa', 'bb', 'aa', 'cc', 'bb',
+                                        'aa'])
+        # b was evicted by c (a was used last), a by b
+        self.assertEqual(self.calls, ['a', 'b', 'c', 'b', 'a'])
+        stats = lookup.cache.stats
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 5)
+        self.assertEqual(stats['evictions'], 3)
+        self.assertEqual(stats['bytes'], 4)
+        self.assertEqual(self.m.stats['cache_hits'], 2)
+        self.assertEqual(self.m.stats['cache_bytes'], 4)
+        lookup.invalidate('a')
+        self.assertEqual(lookup.cache.entries.keys(), [(('b',), ())])
+        lookup.cache.clear()
+        self.assertEqual(stats['bytes'], 0)
+        self.assertEqual(self.m.stats['cache_bytes'], 0)
+    def test_ttl(self):
+        lookup = cached(ttl=0.1, sizeof=len)(coroutine(self.lookup))
+        @coroutine
+        def caller():
+            for value in ('a', 'a', 'b'):
+                self.results.append((yield lookup(value)))
+            yield events.Sleep(0.05)
+            self.results.append((yield lookup('c')))
+            yield events.Sleep(0.08)
+            # a and b expired, c didn't
+            self.results.append(sorted(lookup.cache.entries))
+            yield events.Sleep(0.05)
+            self.results.append(len(lookup.cache.entries))
+            self.results.append((yield lookup('a')))
+        self.run_coros((caller, ()), )
+        self.assertEqual(self.results, ['aa', 'aa', 'bb', 'cc',
+                                        [(('c',), ())], 0, 'aa'])
+        self.assertEqual(self.calls, ['a', 'b', 'c', 'a'])
+        # run returned after the last entry expired
+        self.assertEqual(lookup.cache.stats['expirations'], 4)
+        self.assertEqual(self.m.stats['cache_expirations'], 4)
+        self.assertEqual(len(lookup.cache.entries), 0)
+        self.assertEqual(lookup.cache.timers, {})
+    def test_negative(self):
+        lookup = cached(ttl=10, negative_ttl=0.1, negative_errors=(KeyError,)
+                        )(coroutine(self.lookup))
+        @coroutine
+        def caller():
+            for value in ('missing', 'missing', 'bad', 'bad'):
+                try:
+                    yield lookup(value)
+                except (KeyError, ValueError), e:
+                    self.results.append(e.__class__)
+            for value in ('none', 'none'):
+                self.results.append((yield lookup(value)))
+            # the negative entries expire first
+            yield events.Sleep(0.15)
+            self.results.append(sorted(lookup.cache.entries))
+            lookup.cache.clear()
+        self.run_coros((caller, ()), )
+        self.assertEqual(self.results, [KeyError, KeyError, ValueError,
+                                        ValueError, None, None, []])
+        self.assertEqual(self.calls, ['missing', 'bad', 'bad', 'none'])
+        self.assertEqual(lookup.cache.stats['hits'], 2)
+    def test_concurrent(self):
+        lookup = cached()(coroutine(self.lookup))
+        @coroutine
+        def caller(value):
+            self.results.append((yield lookup(value, delay=0.1)))
+        self.run_coros((caller, ('a', )), (caller, ('a', )),
+                       (caller, ('b', )))
+        self.assertEqual(sorted(self.results), ['aa', 'aa', 'bb'])
+        self.assertEqual(self.calls, ['a', 'b'])
+        self.assertEqual(lookup.cache.stats['misses'], 3)
+        self.assertEqual(lookup.cache.group.stats['shared'], 1)
+    def test_invalidate_loading(self):
+        lookup = cached()(coroutine(self.lookup))
+        @coroutine
+        def caller(value):
+            self.results.append((yield lookup(value, delay=0.1)))
+        @coroutine
+        def invalidator():
+            yield events.Sleep(0.05)
+            lookup.invalidate('a', delay=0.1)
+            # doesn't wait for the load that started before
+            yield caller('a')
+            yield caller('a')
+        self.run_coros((caller, ('a', )), (invalidator, ()))
+        self.assertEqual(self.results, ['aa', 'aa', 'aa'])
+        self.assertEqual(self.calls, ['a', 'a'])
+        self.assertEqual(lookup.cache.stats['misses'], 2)
+        self.assertEqual(lookup.cache.stats['hits'], 1)
+    def test_expiry_queue(self):
+        lookup = cached(maxsize=2, ttl=100)(coroutine(self.lookup))
+        @coroutine
+        def caller():
+            for i in xrange(1000):
+                yield lookup(str(i % 10))
+                self.results.append(len(lookup.cache.queues[100]))
+            lookup.invalidate('8')
+            lookup.invalidate('9')
+        start = time.time()
+        self.run_coros((caller, ()), )
+        # the evicted entries didn't pile up in the queue
+        self.assertEqual(max(self.results), 4)
+        self.assertEqual(lookup.cache.stats['evictions'], 998)
+        # and nothing kept the scheduler running
+        self.assert_(time.time() - start < 5)
+        self.assertEqual(lookup.cache.timers, {})
+        self.assertEqual(lookup.cache.queues, {})
+    def test_scheduler_change(self):
+        lookup = cached(ttl=10)(coroutine(self.lookup))
+        @coroutine
+        def caller():
+            self.results.append((yield lookup('a')))
+            lookup.cache.clear()
+            self.results.append((yield lookup('a')))
+            lookup.cache.clear()
+        self.run_coros((caller, ()), )
+        self.m = Scheduler(default_priority=self.prio)
+        self.run_coros((caller, ()), )
+        self.assertEqual(self.calls, ['a', 'a', 'a', 'a'])
+        self.assertEqual(self.m.stats['cache_misses'], 2)
+
+for prio_mixin in priorities:
+    name = 'MemoizeTest_%s' % prio_mixin.__name__
+    globals()[name] = type(
+        name, (Memoize_MixIn, prio_mixin, unittest.TestCase), {}
+    )
+
+if __name__ == "__main__":
+    sys.argv.insert(1, '-v')
+    unittest.main()
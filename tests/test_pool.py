@@ -0,0 +1,169 @@
+__doc_all__ = []
+
+import unittest
+import threading
+import socket
+import sys
+import os
+import time
+
+from cogen.common import *
+from cogen.core.pool import ConnectionPool
+from base import priorities, proactors_available
+
+class EchoServer(threading.Thread):
+    """Echoes lines back, closes the connection on a "close" line."""
+    def __init__(self):
+        super(EchoServer, self).__init__()
+        self.setDaemon(True)
+        self.accepted = 0
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(16)
+        self.address = self.sock.getsockname()
+    def run(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except socket.error:
+                return
+            self.accepted += 1
+            handler = threading.Thread(target=self.echo, args=(conn,))
+            handler.setDaemon(True)
+            handler.start()
+    def echo(self, conn):
+        fh = conn.makefile()
+        for line in iter(fh.readline, ''):
+            conn.sendall(line)
+            if line == 'close\n':
+                break
+        fh.close()
+        conn.close()
+    def close(self):
+        self.sock.close()
+
+class Pool_MixIn:
+    def setUp(self):
+        self.server = EchoServer()
+        self.server.start()
+        self.m = Scheduler(default_priority=self.prio, proactor=self.poller,
+                           proactor_resolution=0.01)
+        self.results = []
+    def tearDown(self):
+        self.server.close()
+    @coroutine
+    def call(self, pool, line='ping\n', reuse=True, hold=0):
+        sock = yield pool.acquire(self.server.address)
+        yield sock.sendall(line)
+        self.results.append((yield sock.recv(len(line))))
+        if hold:
+            yield events.Sleep(hold)
+        yield pool.release(sock, reuse=reuse)
+        raise StopIteration(sock)
+    def run_coros(self, *coros):
+        for coro, args in coros:
+            self.m.add(coro, args)
+        self.m.run()
+    def test_reuse(self):
+        pool = ConnectionPool()
+        @coroutine
+        def coro():
+            first = yield self.call(pool)
+            second = yield self.call(pool)
+            self.assert_(first is second)
+        self.run_coros((coro, ()))
+        self.assertEqual(self.results, ['ping\n', 'ping\n'])
+        self.assertEqual(self.server.accepted, 1)
+        self.assertEqual(pool.stats['connects'], 1)
+        self.assertEqual(pool.stats['reuses'], 1)
+    def test_peer_closed(self):
+        pool = ConnectionPool()
+        @coroutine
+        def coro():
+            first = yield self.call(pool, 'close\n')
+            yield events.Sleep(0.1)
+            second = yield self.call(pool)
+            self.assert_(first is not second)
+        self.run_coros((coro, ()))
+        self.assertEqual(self.results, ['close\n', 'ping\n'])
+        self.assertEqual(self.server.accepted, 2)
+        self.assertEqual(pool.stats['discards'], 1)
+        self.assertEqual(pool.sizes[self.server.address], 1)
+    def test_idle_timeout(self):
+        pool = ConnectionPool(idle_timeout=0.05)
+        @coroutine
+        def coro():
+            yield self.call(pool)
+            yield events.Sleep(0.1)
+            pool.prune()
+            self.results.append(pool.sizes[self.server.address])
+            yield self.call(pool)
+        self.run_coros((coro, ()))
+        self.assertEqual(self.results, ['ping\n', 0, 'ping\n'])
+        self.assertEqual(self.server.accepted, 2)
+    def test_wait(self):
+        pool = ConnectionPool(max_size=1)
+        socks = []
+        @coroutine
+        def coro(hold):
+            socks.append((yield self.call(pool, hold=hold)))
+        self.run_coros((coro, (0.1,)), (coro, (0,)))
+        self.assertEqual(self.results, ['ping\n', 'ping\n'])
+        self.assert_(socks[0] is socks[1])
+        self.assertEqual(self.server.accepted, 1)
+        self.assertEqual(pool.stats['waits'], 1)
+    def test_wait_discarded(self):
+        pool = ConnectionPool(max_size=1)
+        @coroutine
+        def coro(hold, reuse):
+            yield self.call(pool, hold=hold, reuse=reuse)
+        self.run_coros((coro, (0.1, False)), (coro, (0, True)))
+        self.assertEqual(self.results, ['ping\n', 'ping\n'])
+        self.assertEqual(self.server.accepted, 2)
+        self.assertEqual(pool.sizes[self.server.address], 1)
+    def test_wait_timeout(self):
+        pool = ConnectionPool(max_size=1, wait_timeout=0.1)
+        @coroutine
+        def waiter():
+            try:
+                yield pool.acquire(self.server.address)
+            except events.OperationTimeout:
+                self.results.append('timeout')
+        self.run_coros((self.call, (pool, 'ping\n', True, 0.5)),
+                       (waiter, ()))
+        self.assertEqual(self.results, ['ping\n', 'timeout'])
+        self.assertEqual(self.server.accepted, 1)
+
+class HealthyTest(unittest.TestCase):
+    def test_high_fd(self):
+        # select can't take fds over FD_SETSIZE (1024 usually)
+        fillers = []
+        try:
+            try:
+                while len(fillers) < 1100:
+                    fillers.append(os.dup(0))
+            except OSError:
+                return
+            pair = socket.socketpair()
+            self.assert_(pair[0].fileno() > 1024)
+            sock = sockets.Socket(_sock=pair[0])
+            pool = ConnectionPool()
+            self.assertEqual(pool.healthy(sock, time.time()), True)
+            pair[1].close()
+            self.assertEqual(pool.healthy(sock, time.time()), False)
+            sock.close()
+        finally:
+            for fd in fillers:
+                os.close(fd)
+
+for poller_cls in proactors_available:
+    for prio_mixin in priorities:
+        name = 'PoolTest_%s_%s' % (prio_mixin.__name__, poller_cls.__name__)
+        globals()[name] = type(
+            name, (Pool_MixIn, prio_mixin, unittest.TestCase),
+            {'poller':poller_cls}
+        )
+
+if __name__ == "__main__":
+    sys.argv.insert(1, '-v')
+    unittest.main()
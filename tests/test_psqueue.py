@@ -77,6 +77,20 @@ class QueueTest_MixIn:
         self.m.add(bar)
         self.m.run()
         self.assertEqual(self.msgs, [3,4])
+    def test_compact_every(self):
+        q = pubsub.PublishSubscribeQueue()
+        @coroutine
+        def publisher():
+            yield q.publish('a')
+            yield q.publish('b')
+            yield events.Sleep(0.1)
+            self.msgs.append(len(q.messages))
+            timer.cancel()
+        timer = q.compact_every(self.m, 0.05)
+        self.m.add(publisher)
+        self.m.run()
+        self.assertEqual(self.msgs, [0])
+
     def test_compact2(self):
         q = pubsub.PublishSubscribeQueue()
         self.msgs = []
@@ -0,0 +1,199 @@
+__doc_all__ = []
+
+import unittest
+import random
+import threading
+import socket
+import struct
+import tempfile
+import os
+import sys
+
+from cogen.common import *
+from cogen.core import resolver
+from cogen.web import wsgi
+from base import priorities, proactors_available
+
+class StubNameserver(threading.Thread):
+    """Answers A queries from the `records` {name: ([address, ...], ttl)}
+    dict, with NXDOMAIN for the other names."""
+    def __init__(self, records):
+        super(StubNameserver, self).__init__()
+        self.setDaemon(True)
+        self.records = records
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.address = self.sock.getsockname()
+    def run(self):
+        while True:
+            try:
+                data, peer = self.sock.recvfrom(512)
+            except socket.error:
+                return
+            qid, = struct.unpack('!H', data[:2])
+            question = data[12:]
+            labels, offset = [], 0
+            while ord(question[offset]):
+                length = ord(question[offset])
+                labels.append(question[offset+1:offset+1+length])
+                offset += length + 1
+            name = '.'.join(labels)
+            self.queries.append(name)
+            if name in self.records:
+                addresses, ttl = self.records[name]
+                answers = ''.join(
+                    struct.pack('!HHHIH', 0xC00C, 1, 1, ttl, 4) +
+                    socket.inet_aton(address) for address in addresses
+                )
+                header = struct.pack('!6H', qid, 0x8180, 1, len(addresses),
+                                     0, 0)
+            else:
+                answers = ''
+                header = struct.pack('!6H', qid, 0x8183, 1, 0, 0, 0)
+            self.sock.sendto(header + question + answers, peer)
+    def close(self):
+        self.sock.close()
+
+class Resolver_MixIn:
+    def setUp(self):
+        self.nameserver = StubNameserver({
+            'one.cogen': (['10.0.0.1'], 300),
+            'many.cogen': (['10.0.0.1', '10.0.0.2'], 300),
+            'nottl.cogen': (['10.0.0.3'], 0),
+            'localhost.cogen': (['127.0.0.1'], 300),
+        })
+        self.nameserver.start()
+        self.m = Scheduler(default_priority=self.prio, proactor=self.poller,
+                           proactor_resolution=0.01)
+        self.results = []
+    def tearDown(self):
+        self.nameserver.close()
+        resolver.setresolver(None)
+    def resolve(self, dns, *hosts):
+        @coroutine
+        def coro():
+            for host in hosts:
+                try:
+                    self.results.append((yield dns.resolve(host, 80)))
+                except resolver.ResolveError, exc:
+                    self.results.append(exc.args[0])
+        self.m.add(coro)
+        self.m.run()
+        return self.results
+    def make(self, **kws):
+        return resolver.Resolver([self.nameserver.address], hosts=None, **kws)
+    def test_resolve(self):
+        dns = self.make()
+        self.assertEqual(self.resolve(dns, 'one.cogen', 'many.cogen',
+                                      '10.1.1.1'), [
+            [('10.0.0.1', 80)],
+            [('10.0.0.1', 80), ('10.0.0.2', 80)],
+            [('10.1.1.1', 80)],
+        ])
+        self.assertEqual(self.nameserver.queries, ['one.cogen', 'many.cogen'])
+    def test_cache(self):
+        dns = self.make()
+        self.resolve(dns, 'one.cogen', 'ONE.cogen', 'nottl.cogen',
+                     'nottl.cogen')
+        self.assertEqual(self.results[0], self.results[1])
+        self.assertEqual(self.nameserver.queries,
+                         ['one.cogen', 'nottl.cogen', 'nottl.cogen'])
+        self.assertEqual(dns.stats['hits'], 1)
+        self.assertEqual(dns.stats['misses'], 3)
+    def test_cache_size(self):
+        dns = self.make(cache_size=1)
+        self.resolve(dns, 'one.cogen', 'many.cogen', 'one.cogen',
+                     'one.cogen')
+        self.assertEqual(self.nameserver.queries,
+                         ['one.cogen', 'many.cogen', 'one.cogen'])
+        self.assertEqual(len(dns.cache), 1)
+    def test_nxdomain(self):
+        dns = self.make(fallback=False)
+        self.assertEqual(self.resolve(dns, 'missing.cogen'),
+                         [socket.EAI_NONAME])
+    def test_hosts_file(self):
+        fd, path = tempfile.mkstemp()
+        try:
+            os.write(fd, "10.9.9.9 hosts.cogen alias.cogen # comment\n")
+            os.close(fd)
+            dns = resolver.Resolver([self.nameserver.address], hosts=path)
+        finally:
+            os.unlink(path)
+        self.assertEqual(self.resolve(dns, 'alias.cogen'),
+                         [[('10.9.9.9', 80)]])
+        self.assertEqual(self.nameserver.queries, [])
+    def test_fallback(self):
+        # nothing answers on this port
+        self.nameserver.close()
+        dns = self.make(timeout=0.5, tries=1)
+        self.assertEqual(self.resolve(dns, 'localhost'),
+                         [[('127.0.0.1', 80)]])
+        self.assertEqual(dns.stats['fallbacks'], 1)
+    def test_connect(self):
+        resolver.setresolver(self.make())
+        srv = socket.socket()
+        srv.bind(('127.0.0.1', 0))
+        srv.listen(1)
+        port = srv.getsockname()[1]
+        @coroutine
+        def coro():
+            cli = sockets.Socket()
+            yield cli.connect(('localhost.cogen', port))
+            self.results.append(cli.getpeername())
+            cli.close()
+        self.m.add(coro)
+        self.m.run()
+        srv.close()
+        self.assertEqual(self.results, [('127.0.0.1', port)])
+    def test_wsgi_bind(self):
+        fd, path = tempfile.mkstemp()
+        try:
+            os.write(fd, "::1 ipv6.cogen\n")
+            os.close(fd)
+            resolver.setresolver(resolver.Resolver([self.nameserver.address],
+                                                   hosts=path))
+        finally:
+            os.unlink(path)
+        lookups = []
+        getaddrinfo = socket.getaddrinfo
+        def numeric_getaddrinfo(host, port, family=0, type=0, proto=0,
+                                flags=0):
+            if not flags & socket.AI_NUMERICHOST:
+                lookups.append(host)
+            return getaddrinfo(host, port, family, type, proto, flags)
+        socket.getaddrinfo = numeric_getaddrinfo
+        servers = []
+        try:
+            for host, family, address in (
+                    ('localhost.cogen', socket.AF_INET, '127.0.0.1'),
+                    ('ipv6.cogen', socket.AF_INET6, '::1')):
+                server = wsgi.WSGIServer((host, 0), lambda *args: [],
+                                          self.m)
+                self.m.add(server.serve)
+                servers.append(server)
+                for i in xrange(100):
+                    if getattr(server, 'socket', None):
+                        break
+                    self.m.run_once(timeout=0.01)
+                self.assertEqual(server.socket._fd.family, family)
+                self.assertEqual(server.socket.getsockname()[0], address)
+        finally:
+            socket.getaddrinfo = getaddrinfo
+            for server in servers:
+                if getattr(server, 'socket', None):
+                    server.socket.close()
+        # the hostnames weren't looked up with a blocking getaddrinfo
+        self.assertEqual(lookups, [])
+
+for poller_cls in proactors_available:
+    for prio_mixin in priorities:
+        name = 'ResolverTest_%s_%s' % (prio_mixin.__name__, poller_cls.__name__)
+        globals()[name] = type(
+            name, (Resolver_MixIn, prio_mixin, unittest.TestCase),
+            {'poller':poller_cls}
+        )
+
+if __name__ == "__main__":
+    sys.argv.insert(1, '-v')
+    unittest.main()
@@ -0,0 +1,125 @@
+__doc_all__ = []
+
+import unittest
+import sys
+
+from cogen.common import *
+from cogen.web import cache
+
+from base import priorities, proactors_available
+from base_web import WebTest_Base
+
+class ResponseCache_MixIn:
+    middleware = []
+    def setUp(self):
+        self.calls = 0
+        self.cache = cache.ResponseCache(max_size=4096,
+                                         vary=('Accept-Encoding', ))
+        self.server_options = {'response_cache': self.cache}
+        WebTest_Base.setUp(self)
+    def app(self, environ, start_response):
+        self.calls += 1
+        path = environ['PATH_INFO']
+        headers = [('Content-Type', 'text/plain')]
+        if path == '/nostore':
+            headers.append(('Cache-Control', 'no-store'))
+        elif path == '/cookie':
+            headers.append(('Cache-Control', 'max-age=60'))
+            headers.append(('Set-Cookie', 'a=b'))
+        elif path == '/big':
+            headers.append(('Cache-Control', 'max-age=60'))
+            start_response('200 OK', headers)
+            return ['x' * 3950]
+        else:
+            headers.append(('Cache-Control', 'public, max-age=60'))
+            headers.append(('Vary', 'Accept-Encoding'))
+        start_response('200 OK', headers)
+        return self.body(environ)
+    def body(self, environ):
+        # a chunked response with a coroutine operation in the middle
+        yield 'path:%s ' % environ['PATH_INFO']
+        yield environ['cogen.core'].events.Sleep(0.01)
+        yield 'query:%s ' % environ['QUERY_STRING']
+        yield 'encoding:%s' % environ.get('HTTP_ACCEPT_ENCODING')
+    def get(self, path, method='GET', **headers):
+        self.conn.request(method, path, headers=headers)
+        resp = self.conn.getresponse()
+        return resp, resp.read()
+    def test_hit(self):
+        resp, body = self.get('/a?x=1')
+        self.assertEqual(body, 'path:/a query:x=1 encoding:identity')
+        self.assertEqual(resp.getheader('transfer-encoding'), 'chunked')
+        for i in range(3):
+            resp, body = self.get('/a?x=1')
+            self.assertEqual(resp.status, 200)
+            self.assertEqual(body, 'path:/a query:x=1 encoding:identity')
+            self.assertEqual(resp.getheader('content-length'), str(len(body)))
+            self.assertEqual(resp.getheader('cache-control'), 'public, max-age=60')
+            self.assert_(resp.getheader('age') is not None)
+            self.assert_(resp.getheader('date') is not None)
+        resp, body = self.get('/a?x=1', 'HEAD')
+        self.assertEqual(body, '')
+        self.assertEqual(resp.getheader('content-length'),
+                         str(len('path:/a query:x=1 encoding:identity')))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.cache.stats['hits'], 4)
+        # different query, vary header
+        resp, body = self.get('/a?x=2')
+        resp, body = self.get('/a?x=1', **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(body, 'path:/a query:x=1 encoding:gzip')
+        self.assertEqual(self.calls, 3)
+    def test_not_cached(self):
+        for path in ('/nostore', '/cookie', '/nostore', '/cookie'):
+            resp, body = self.get(path)
+            self.assertEqual(resp.status, 200)
+        self.assertEqual(self.calls, 4)
+        self.assertEqual(self.cache.stats['stores'], 0)
+    def test_refresh(self):
+        self.get('/a')
+        self.get('/a', **{'Cache-Control': 'no-cache'})
+        self.assertEqual(self.calls, 2)
+        for entry in self.cache.entries.values():
+            entry.expires = 0
+        resp, body = self.get('/a')
+        self.assertEqual(body, 'path:/a query: encoding:identity')
+        self.assertEqual(self.calls, 3)
+        self.get('/a')
+        self.assertEqual(self.calls, 3)
+    def test_eviction(self):
+        self.get('/big')
+        self.get('/big')
+        self.assertEqual(self.calls, 1)
+        # doesn't fit with /big
+        self.get('/a')
+        self.assertEqual(self.cache.stats['evictions'], 1)
+        self.get('/a')
+        self.assertEqual(self.calls, 2)
+        self.get('/big')
+        self.assertEqual(self.calls, 3)
+        self.assert_(self.cache.size <= self.cache.max_size)
+    def test_http10(self):
+        self.get('/a')
+        self.conn._http_vsn = 10
+        self.conn._http_vsn_str = 'HTTP/1.0'
+        for i in range(2):
+            # httplib sends these only for HTTP/1.1
+            resp, body = self.get('/a', Connection='keep-alive',
+                                  Host='%s:%s' % self.local_addr,
+                                  **{'Accept-Encoding': 'identity'})
+            self.assertEqual(resp.getheader('connection'), 'Keep-Alive')
+            self.assertEqual(body, 'path:/a query: encoding:identity')
+        self.assertEqual(self.calls, 1)
+
+for poller_cls in proactors_available:
+    for prio_mixin in priorities:
+        name = 'ResponseCacheTest_%s_%s' % (prio_mixin.__name__,
+                                            poller_cls.__name__)
+        globals()[name] = type(
+            name,
+            (ResponseCache_MixIn, WebTest_Base, prio_mixin, unittest.TestCase),
+            {'poller':poller_cls}
+        )
+
+if __name__ == "__main__":
+    sys.argv.insert(1, '-v')
+    unittest.main()
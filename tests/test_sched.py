@@ -5,12 +5,15 @@ import sys
 import exceptions
 import datetime
 import time
+import socket
+import gc
 
 from cStringIO import StringIO
 
 from cogen.common import *
 from base import priorities
 from cogen.core.util import priority
+from cogen.core import policies, tuning
 
 class SchedulerTest_MixIn:
     def setUp(self):
@@ -49,6 +52,35 @@ class SchedulerTest_MixIn:
             self.assertEqual(self.msgs, [1,2,4,3,6,5])
         else:
             self.assertEqual(self.msgs, [1,2,3,4,5,6])
+    def test_signal_timeouts(self):
+        @coroutine
+        def signalee(nr, timeout):
+            try:
+                value = yield events.WaitForSignal("test_sig", timeout=timeout)
+                self.msgs.append((nr, value))
+            except events.OperationTimeout:
+                self.msgs.append((nr, 'timeout'))
+        @coroutine
+        def signaler():
+            yield events.Sleep(0.1)
+            self.msgs.append(('remaining', len(self.m.sigwait["test_sig"])))
+            yield events.Signal("test_sig", 'value')
+            self.msgs.append(('sigwait', dict(self.m.sigwait)))
+        for i in range(100):
+            self.m.add(signalee, args=(i, i % 10 and 0.01 or None))
+        self.m.add(signaler)
+        self.m.run()
+        self.assertEqual(
+            [i for i, value in self.msgs if value == 'timeout'],
+            [i for i in range(100) if i % 10]
+        )
+        self.assert_(('remaining', 10) in self.msgs)
+        self.assert_(('sigwait', {}) in self.msgs)
+        self.assertEqual(
+            sorted(i for i, value in self.msgs if value == 'value'),
+            range(0, 100, 10)
+        )
+        self.assertEqual(self.m.sigwait, {})
     def test_add_coro(self):
         @coroutine
         def added(x):
@@ -129,6 +161,36 @@ class SchedulerTest_MixIn:
         self.assert_('raise StopIteration((yield callee_5_1()))' in self.exc)
         self.assert_('raise StopIteration((yield callee_5_2()))' in self.exc)
         self.assert_('raise Exception("long_one")' in self.exc)
+    def test_call_trampoline(self):
+        @coroutine
+        def callee(depth):
+            if depth:
+                raise StopIteration((yield callee(depth-1)) + 1)
+            raise StopIteration(0)
+        @coroutine
+        def failing(depth):
+            if depth:
+                yield failing(depth-1)
+            else:
+                raise Exception("deep_one")
+        @coroutine
+        def caller():
+            self.msgs.append((yield callee(5)))
+            try:
+                yield failing(5)
+            except Exception, e:
+                self.msgs.append(e.message)
+        @coroutine
+        def other():
+            yield
+            yield
+            self.msgs.append('other')
+        # the calls don't go through the active queue so caller isn't
+        #interrupted by other
+        self.m.add(caller)
+        self.m.add(other)
+        self.m.run()
+        self.assertEqual(self.msgs, [5, 'deep_one', 'other'])
     def test_join(self):
         @coroutine
         def caller():
@@ -213,6 +275,322 @@ class SchedulerTest_MixIn:
         self.m.run()
         self.assertAlmostEqual(time.time() - ts, 1.0, 1)
         self.assert_(self.sleept)
+    def test_timer_slack(self):
+        self.m = Scheduler(default_priority=self.prio, timer_slack=0.2)
+        self.ops = []
+        @coroutine
+        def sleeper(secs, slack=None):
+            op = events.Sleep(secs, slack=slack)
+            self.ops.append(op)
+            start = datetime.datetime.now()
+            yield op
+            self.msgs.append((start, datetime.datetime.now(), secs))
+        # start right after a slack boundary so the sleeps can't straddle one
+        time.sleep(0.2 - time.time() % 0.2)
+        for i in range(10):
+            self.m.add(sleeper, args=(0.01 + i*0.005,))
+        self.m.add(sleeper, args=(0.01, 0.001))
+        self.m.run()
+        self.assertEqual(len(self.msgs), 11)
+        for start, end, secs in self.msgs:
+            self.assert_(end - start >= datetime.timedelta(seconds=secs))
+        # the ones using the scheduler's slack end up in the same bucket
+        timeouts = set(op.timeout for op in self.ops[:10])
+        self.assertEqual(len(timeouts), 1)
+        timeout = timeouts.pop()
+        self.assertEqual(timeout.microsecond % 200000, 0)
+        self.assert_(self.ops[10].timeout < timeout)
+    def test_call_later(self):
+        ts = time.time()
+        self.m.call_later(0.1, self.msgs.append, 2)
+        self.m.call_at(datetime.datetime.now(), self.msgs.append, 1)
+        cancelled = self.m.call_later(0.05, self.msgs.append, 'cancelled')
+        self.assertEqual(cancelled.cancel(), True)
+        self.assertEqual(cancelled.cancel(), False)
+        self.m.run()
+        self.assertEqual(self.msgs, [1, 2])
+        self.assert_(time.time() - ts >= 0.1)
+        self.assertEqual(self.m.timeouts, [])
+    def test_run_once_no_timeout(self):
+        pair = socket.socketpair()
+        reader = sockets.Socket(_sock=pair[0])
+        @coroutine
+        def reading():
+            self.msgs.append((yield reader.recv(10)))
+        self.m.add(reading)
+        self.m.call_later(0.05, pair[1].send, "data")
+        while self.m.run_once(timeout=None):
+            pass
+        self.assertEqual(self.msgs, ["data"])
+        for sock in pair:
+            sock.close()
+    def test_timer_subclass(self):
+        class MessageTimer(events.Timer):
+            __slots__ = ()
+        MessageTimer(datetime.datetime.now(), self.msgs.append, (1,)
+                     ).schedule(self.m)
+        self.m.run()
+        self.assertEqual(self.msgs, [1])
+    def test_call_every(self):
+        def tick():
+            self.msgs.append('tick')
+            if self.msgs.count('tick') == 5:
+                timer.cancel()
+            1/0 # errors don't stop the timer
+        @coroutine
+        def sleeper():
+            yield events.Sleep(0.025)
+            self.msgs.append('sleeper')
+        timer = self.m.call_every(0.01, tick)
+        self.m.add(sleeper)
+        stderr, sys.stderr = sys.stderr, StringIO()
+        try:
+            self.m.run()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(self.msgs, ['tick']*2 + ['sleeper'] + ['tick']*3)
+        self.assertEqual(timer.cancelled, True)
+
+class PolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.msgs = []
+
+    def looper(self, name, count, delay=0):
+        @coroutine
+        def looper():
+            for i in xrange(count):
+                self.msgs.append(name)
+                if delay:
+                    time.sleep(delay)
+                yield
+        return looper
+
+    def test_edf(self):
+        m = Scheduler(policy=policies.EDF)
+        m.add(self.looper('slow', 5))
+        urgent = m.add(self.looper('urgent', 5))
+        m.active.set_deadline(urgent, 0.001)
+        m.run()
+        # the coroutines get in the queue again with the new deadline after
+        #their generators are created
+        self.assertEqual(self.msgs, ['urgent']*5 + ['slow']*5)
+
+    def test_weighted_fair(self):
+        m = Scheduler(policy=lambda sched: policies.WeightedFair(
+            sched, weights={'admin': 3}, max_wait=None))
+        m.active.classify(m.add(self.looper('bulk', 8)), 'bulk')
+        m.active.classify(m.add(self.looper('admin', 8)), 'admin')
+        m.run()
+        self.assertEqual(self.msgs.count('admin'), 8)
+        self.assertEqual(self.msgs.count('bulk'), 8)
+        self.assert_(self.msgs[:8].count('admin') >= 5)
+        self.assert_(''.join(self.msgs).endswith('bulk'*4))
+
+    def test_weighted_fair_aging(self):
+        m = Scheduler(policy=lambda sched: policies.WeightedFair(
+            sched, weights={'admin': 1000}, max_wait=0.02))
+        m.active.classify(m.add(self.looper('admin', 20, 0.01)), 'admin')
+        m.active.classify(m.add(self.looper('bulk', 3)), 'bulk')
+        m.run()
+        self.assertNotEqual(self.msgs[-1], 'bulk')
+
+class BudgetTest(unittest.TestCase):
+    def run_busy(self, **kws):
+        m = Scheduler(proactor_greedy=False, **kws)
+        pair = socket.socketpair()
+        reader = sockets.Socket(_sock=pair[0])
+        self.steps = 0
+        self.got_data_at = None
+        @coroutine
+        def reading():
+            yield reader.recv(10)
+            self.got_data_at = self.steps
+        @coroutine
+        def busy():
+            for i in xrange(200):
+                self.steps += 1
+                if self.steps == 5:
+                    pair[1].send("data")
+                yield
+        m.add(reading)
+        m.add(busy)
+        m.add(busy)
+        m.run()
+        for sock in pair:
+            sock.close()
+        return m
+
+    def test_no_budget(self):
+        m = self.run_busy()
+        self.assertEqual(self.got_data_at, 400)
+        self.assertEqual(m.stats['budget_batches'], 0)
+
+    def test_budget_steps(self):
+        m = self.run_busy(budget_steps=10)
+        self.assert_(self.got_data_at < 20, self.got_data_at)
+        self.assert_(m.stats['budget_step_hits'] >= 39)
+        self.assertEqual(m.stats['budget_time_hits'], 0)
+
+    def test_budget_usec(self):
+        m = self.run_busy(budget_usec=1)
+        self.assert_(self.got_data_at < 20, self.got_data_at)
+        self.assert_(m.stats['budget_time_hits'] > 0)
+        self.assertEqual(m.stats['budget_step_hits'], 0)
+
+class AdaptiveTest(unittest.TestCase):
+    def setUp(self):
+        self.changes = []
+        self.m = Scheduler(adaptive=lambda sched: tuning.Adaptive(
+            sched, window=4, probe=2, depth=8,
+            callback=lambda *args: self.changes.append(args[:2])))
+
+    def feed(self, tries=0, hits=0, events=0, depth=0, polled=True):
+        proactor = self.m.proactor
+        proactor.multiplex_tries += tries
+        proactor.multiplex_hits += hits
+        proactor.events += events
+        self.m.active.extend([(None, None)] * depth)
+        for i in xrange(4):
+            self.m.tuner.sample(polled)
+        self.m.active.clear()
+
+    def test_multiplex_first(self):
+        self.feed(tries=10, hits=8, events=4)
+        self.assertEqual(self.m.proactor.multiplex_first, True)
+        self.feed(tries=10, hits=1, events=4)
+        self.assertEqual(self.m.proactor.multiplex_first, False)
+        self.assertEqual(self.m.tuner.metrics['hit_rate'], .1)
+        self.feed(events=4)
+        self.assertEqual(self.m.proactor.multiplex_first, False)
+        # probe
+        self.feed(events=4)
+        self.assertEqual(self.m.proactor.multiplex_first, True)
+        self.assertEqual([change for change in self.changes
+                          if change[0] == 'multiplex_first'],
+            [('multiplex_first', False), ('multiplex_first', True)])
+        self.assertEqual(self.m.stats['tuning_changes'], len(self.changes))
+
+    def test_ops_greedy(self):
+        self.feed(events=4*20)
+        self.assertEqual(self.m.ops_greedy, False)
+        self.feed(events=4)
+        self.assertEqual(self.m.ops_greedy, True)
+        self.assertEqual(self.m.tuner.metrics['batch_size'], 1)
+        self.assertEqual(self.changes, [('ops_greedy', True)])
+
+    def test_proactor_greedy(self):
+        self.feed(depth=10, events=4)
+        self.assertEqual(self.m.proactor_greedy, True)
+        self.feed(depth=10)
+        self.assertEqual(self.m.proactor_greedy, False)
+        # no polls, nothing to decide on
+        self.feed(depth=10, polled=False)
+        self.assertEqual(self.m.proactor_greedy, False)
+        self.feed(depth=1, polled=False)
+        self.assertEqual(self.m.proactor_greedy, True)
+        self.assertEqual([change for change in self.changes
+                          if change[0] == 'proactor_greedy'],
+            [('proactor_greedy', False), ('proactor_greedy', True)])
+        self.assertEqual(len(self.m.tuner.decisions), len(self.changes))
+
+    def test_proactor_greedy_probe(self):
+        # half of the polls get a event
+        self.feed(depth=10, events=2)
+        self.assertEqual(self.m.proactor_greedy, True)
+        self.feed(depth=10)
+        self.assertEqual(self.m.proactor_greedy, False)
+        # the proactor isn't polled anymore
+        self.feed(depth=10, polled=False)
+        self.assertEqual(self.m.proactor_greedy, False)
+        # probe
+        self.feed(depth=10, polled=False)
+        self.assertEqual(self.m.proactor_greedy, True)
+        self.feed(depth=10, events=4)
+        self.assertEqual(self.m.proactor_greedy, True)
+        self.assertEqual([change for change in self.changes
+                          if change[0] == 'proactor_greedy'],
+            [('proactor_greedy', False), ('proactor_greedy', True)])
+
+    def test_busy_loop(self):
+        pair = socket.socketpair()
+        reader = sockets.Socket(_sock=pair[0])
+        @coroutine
+        def reading():
+            yield reader.recv(10)
+        @coroutine
+        def busy():
+            for i in xrange(50):
+                yield
+            pair[1].send("data")
+        self.m.add(reading)
+        for i in xrange(20):
+            self.m.add(busy)
+        self.m.run()
+        for sock in pair:
+            sock.close()
+        self.assert_(('proactor_greedy', False) in self.changes,
+                     self.changes)
+
+class IdleTest(unittest.TestCase):
+    def run_reader(self, m, work, delay=0.1):
+        pair = socket.socketpair()
+        reader = sockets.Socket(_sock=pair[0])
+        @coroutine
+        def reading():
+            work()
+            yield reader.recv(10)
+        m.add(reading)
+        m.call_later(delay, pair[1].send, "data")
+        m.run()
+        for sock in pair:
+            sock.close()
+
+    def test_idle_hooks(self):
+        m = Scheduler(idle_threshold=0.01)
+        calls = []
+        m.add_idle_hook(lambda: calls.append(len(m.active)))
+        self.run_reader(m, lambda: None)
+        self.assert_(calls)
+        self.assertEqual(set(calls), set([0]))
+        self.assertEqual(m.stats['idle_runs'], len(calls))
+
+    def test_idle_threshold(self):
+        m = Scheduler(idle_threshold=10, proactor_resolution=.01)
+        calls = []
+        m.add_idle_hook(lambda: calls.append(bool(m.timeouts)))
+        self.run_reader(m, lambda: None)
+        # not while the timer is pending
+        self.assert_(True not in calls, calls)
+
+    def test_idle_gc(self):
+        m = Scheduler(idle_gc=True)
+        enabled = gc.isenabled()
+        def garbage():
+            self.gc_enabled = gc.isenabled()
+            for i in xrange(gc.get_threshold()[0] * 2):
+                cycle = []
+                cycle.append(cycle)
+        self.run_reader(m, garbage)
+        self.assertEqual(self.gc_enabled, False)
+        self.assertEqual(gc.isenabled(), enabled)
+        self.assert_(m.stats['gc_collections'] >= 1)
+        self.assertEqual(m.stats['gc_forced'], 0)
+        self.assert_(m.stats['gc_pause_max'] > 0)
+
+    def test_idle_gc_error(self):
+        enabled = gc.isenabled()
+        @coroutine
+        def interrupted():
+            self.gc_enabled = gc.isenabled()
+            raise KeyboardInterrupt()
+            yield
+        for run in (Scheduler.run, Scheduler.run_once):
+            self.gc_enabled = None
+            m = Scheduler(idle_gc=True)
+            m.add(interrupted)
+            self.assertRaises(KeyboardInterrupt, run, m)
+            self.assertEqual(self.gc_enabled, False)
+            self.assertEqual(gc.isenabled(), enabled)
 
 for prio_mixin in priorities:
     name = 'SchedulerTest_%s' % prio_mixin.__name__
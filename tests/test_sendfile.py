@@ -0,0 +1,112 @@
+__doc_all__ = []
+
+import unittest
+import threading
+import socket
+import tempfile
+import os
+import sys
+
+from cogen.common import *
+from cogen.core import ossendfile
+from cogen.core.proactors import base as proactor_base
+from base import priorities, proactors_available
+
+class SendFile_MixIn:
+    DATA = os.urandom(2 * 1024 * 1024 + 1)
+    def setUp(self):
+        self.m = Scheduler(default_priority=self.prio, proactor=self.poller,
+                           proactor_resolution=0.01)
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+        self.file = tempfile.TemporaryFile()
+        self.file.write(self.DATA)
+        self.file.flush()
+        self.results = []
+    def tearDown(self):
+        self.listener.close()
+        self.file.close()
+    def send(self, **kws):
+        def client():
+            sock = socket.create_connection(self.listener.getsockname())
+            received = []
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    break
+                received.append(data)
+            self.results.append(''.join(received))
+            sock.close()
+        @coroutine
+        def server():
+            srv = sockets.Socket(_sock=self.listener)
+            conn, addr = yield srv.accept()
+            self.results.append((yield conn.sendfile(self.file, **kws)))
+            conn.close()
+        thread = threading.Thread(target=client)
+        thread.start()
+        self.m.add(server)
+        self.m.run()
+        thread.join()
+        return self.results
+    def test_whole_file(self):
+        self.assertEqual(self.send(offset=0),
+                         [len(self.DATA), self.DATA])
+    def test_range(self):
+        self.assertEqual(self.send(offset=100, length=1000000),
+                         [1000000, self.DATA[100:1000100]])
+    def test_header_trailer(self):
+        sent, received = self.send(offset=0, header='head', trailer='tail')
+        self.assertEqual(sent, len(self.DATA))
+        self.assert_(received == 'head' + self.DATA + 'tail')
+    def test_blocksize(self):
+        # a single whole-file send (from the memory map if there's no sendfile)
+        self.assertEqual(self.send(offset=0, length=len(self.DATA),
+                                   blocksize=0),
+                         [len(self.DATA), self.DATA])
+    def test_fallbacks(self):
+        available = ossendfile.available
+        sendfile = proactor_base.sendfile
+        map_file = proactor_base.map_file
+        ossendfile.available = False
+        proactor_base.sendfile = None
+        try:
+            # from a memory map
+            self.test_header_trailer()
+            self.tearDown()
+            self.setUp()
+            # plain reads if the file can't be mapped
+            proactor_base.map_file = lambda act: False
+            self.test_range()
+        finally:
+            ossendfile.available = available
+            proactor_base.sendfile = sendfile
+            proactor_base.map_file = map_file
+
+class OsSendfileTest(unittest.TestCase):
+    def test_os_sendfile(self):
+        # there's no ctypes binding if there's a os.sendfile
+        calls = []
+        os.sendfile = lambda *args: calls.append(args) or 0
+        try:
+            reload(ossendfile)
+            self.assertEqual(ossendfile._sendfile, None)
+            self.assertEqual(ossendfile.available, True)
+            self.assertEqual(ossendfile.sendfile(1, 2, 3, 4), 0)
+            self.assertEqual(calls, [(1, 2, 3, 4)])
+        finally:
+            del os.sendfile
+            reload(ossendfile)
+
+for poller_cls in proactors_available:
+    for prio_mixin in priorities:
+        name = 'SendFileTest_%s_%s' % (prio_mixin.__name__, poller_cls.__name__)
+        globals()[name] = type(
+            name, (SendFile_MixIn, prio_mixin, unittest.TestCase),
+            {'poller':poller_cls}
+        )
+
+if __name__ == "__main__":
+    sys.argv.insert(1, '-v')
+    unittest.main()
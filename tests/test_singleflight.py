@@ -0,0 +1,103 @@
+__doc_all__ = []
+
+import unittest
+import sys
+
+from cogen.common import *
+from cogen.core.singleflight import SingleFlight, singleflight
+from base import priorities
+
+class SingleFlight_MixIn:
+    def setUp(self):
+        self.m = Scheduler(default_priority=self.prio)
+        self.calls = []
+        self.results = []
+    @coroutine
+    def work(self, value, delay=0.1):
+        self.calls.append(value)
+        if delay:
+            yield events.Sleep(delay)
+        if isinstance(value, Exception):
+            raise value
+        raise StopIteration(value * 2)
+    def run_coros(self, *coros):
+        for coro, args in coros:
+            self.m.add(coro, args)
+        self.m.run()
+    def test_shared(self):
+        group = SingleFlight()
+        @coroutine
+        def caller(key, value):
+            self.results.append((yield group.do(key, self.work, value)))
+        self.run_coros((caller, ('a', 1)), (caller, ('a', 1)),
+                       (caller, ('b', 2)), (caller, ('a', 1)))
+        self.assertEqual(sorted(self.calls), [1, 2])
+        self.assertEqual(sorted(self.results), [2, 2, 2, 4])
+        self.assertEqual(group.stats['calls'], 2)
+        self.assertEqual(group.stats['shared'], 2)
+        self.assertEqual(group.flights, {})
+        # nothing is kept without cache_ttl
+        self.run_coros((caller, ('a', 1)), )
+        self.assertEqual(len(self.calls), 3)
+    def test_exception(self):
+        group = SingleFlight(cache_ttl=10)
+        error = ValueError('failed')
+        @coroutine
+        def caller():
+            try:
+                yield group.do('a', self.work, error)
+            except ValueError, e:
+                self.results.append(e)
+        self.run_coros((caller, ()), (caller, ()))
+        self.assertEqual(self.results, [error, error])
+        self.assertEqual(len(self.calls), 1)
+        # exceptions aren't kept
+        self.run_coros((caller, ()), )
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(group.stats['hits'], 0)
+    def test_cache(self):
+        group = SingleFlight(cache_ttl=0.2, cacheable=lambda result: result > 2)
+        @coroutine
+        def caller():
+            for value in (1, 1, 2, 2):
+                self.results.append((yield group.do(value, self.work,
+                                                    value, 0)))
+            yield events.Sleep(0.3)
+            self.results.append((yield group.do(2, self.work, 2, 0)))
+        self.run_coros((caller, ()), )
+        self.assertEqual(self.results, [2, 2, 4, 4, 4])
+        self.assertEqual(self.calls, [1, 1, 2, 2])
+        self.assertEqual(group.stats['hits'], 1)
+    def test_cache_size(self):
+        group = SingleFlight(cache_ttl=10, cache_size=2)
+        @coroutine
+        def caller():
+            for value in (1, 2, 3, 1):
+                yield group.do(value, self.work, value, 0)
+        self.run_coros((caller, ()), )
+        self.assertEqual(self.calls, [1, 2, 3, 1])
+        self.assertEqual(group.results.keys(), [3, 1])
+    def test_decorator(self):
+        @singleflight(key=lambda value, delay=0.1: value % 10)
+        @coroutine
+        def work(value, delay=0.1):
+            result = yield self.work(value, delay)
+            raise StopIteration(result)
+        @coroutine
+        def caller(value):
+            self.results.append((yield work(value)))
+        self.run_coros((caller, (1, )), (caller, (11, )), (caller, (2, )))
+        self.assertEqual(self.calls, [1, 2])
+        self.assertEqual(self.results, [2, 2, 4])
+        self.assertEqual(work.group.stats['shared'], 1)
+        self.assertEqual(work.__name__, 'work')
+
+for prio_mixin in priorities:
+    name = 'SingleFlightTest_%s' % prio_mixin.__name__
+    globals()[name] = type(
+        name, (SingleFlight_MixIn, prio_mixin, unittest.TestCase), {}
+    )
+
+if __name__ == "__main__":
+    sys.argv.insert(1, '-v')
+    unittest.main()
@@ -16,7 +16,7 @@ from cStringIO import StringIO
 
 from cogen.common import *
 from base import priorities, proactors_available
-from cogen.core.coroutines import debug_coroutine
+from cogen.core.coroutines import debug_coroutine, CoroutineException
 
 class SocketTest_MixIn:
     sockets = []
@@ -227,6 +227,107 @@ class SocketTest_MixIn:
         except KeyboardInterrupt:
             self.failIf("Interrupted from the coroutine, something failed.")
 
+    def test_reuse_ops(self):
+        sockets.setreuseops(True)
+        try:
+            pair = socket.socketpair()
+            self.sockets.extend(pair)
+            reader = sockets.Socket(_sock=pair[0])
+            writer = sockets.Socket(_sock=pair[1])
+            self.ops = []
+            self.data = []
+            @coroutine
+            def reading():
+                for i in range(10):
+                    op = reader.recv(1, prio=self.prio)
+                    self.ops.append(op)
+                    self.data.append((yield op))
+            @coroutine
+            def writing():
+                for i in range(10):
+                    self.ops.append(writer.sendall(str(i), prio=self.prio))
+                    yield self.ops[-1]
+                    yield events.Sleep(0.01)
+            self.m.add(reading)
+            self.m.add(writing)
+            self.m.run()
+            self.assertEqual(''.join(self.data), '0123456789')
+            self.assertEqual(len(set(map(id, self.ops))), 2)
+
+            recv_op = self.ops[0]
+            reader.close()
+            self.assert_(recv_op in sockets._freelists[sockets.Recv])
+            self.assert_(recv_op.sock is None)
+            other = sockets.Socket()
+            self.sockets.append(other)
+            self.assert_(other.recv(1) is recv_op)
+            self.assert_(recv_op.sock is other)
+        finally:
+            sockets.setreuseops(False)
+
+    def test_park(self):
+        pair = socket.socketpair()
+        self.sockets.extend(pair)
+        reader = sockets.Socket(_sock=pair[0])
+        self.results = []
+        @coroutine
+        def woken(wakeup):
+            self.results.append(wakeup)
+            if not isinstance(wakeup, CoroutineException):
+                data = yield reader.park(woken(), prio=self.prio)
+                if data is not None:
+                    self.results.append(data)
+        @coroutine
+        def parking():
+            self.results.append((yield reader.park(woken(), prio=self.prio)))
+        @coroutine
+        def writing():
+            yield events.Sleep(0.05)
+            pair[1].send("data")
+            yield events.Sleep(0.05)
+            pair[1].close()
+        self.m.add(parking)
+        self.m.add(writing)
+        self.m.run()
+        self.assertEqual(self.results[:2], [None, "data"])
+        self.assertEqual(len(self.results), 3)
+        self.assert_(isinstance(self.results[2], CoroutineException))
+        self.assertEqual(self.results[2].args[0], sockets.ConnectionClosed)
+
+    def test_run_once(self):
+        import select
+        pair = socket.socketpair()
+        self.sockets.extend(pair)
+        reader = sockets.Socket(_sock=pair[0])
+        self.data = None
+        @coroutine
+        def reading():
+            self.data = yield reader.recv(10, prio=self.prio)
+        self.m.add(reading)
+        while self.m.active:
+            self.assert_(self.m.next_deadline() <= datetime.datetime.now())
+            self.assert_(self.m.run_once())
+        self.assertEqual(self.data, None)
+        fileno = self.m.fileno()
+        if self.m.proactor.fileno() is None:
+            self.assertNotEqual(self.m.next_deadline(), None)
+        else:
+            self.assertEqual(fileno, self.m.proactor.fileno())
+            self.assertEqual(self.m.next_deadline(), None)
+            self.assertEqual(select.select([fileno], [], [], 0.1)[0], [])
+        pair[1].send("data")
+        for i in range(100):
+            deadline = self.m.next_deadline()
+            wait = deadline and max(0, (deadline -
+                    datetime.datetime.now()).microseconds / 1000000.0)
+            select.select([fileno], [], [], wait)
+            self.m.run_once()
+            if self.data:
+                break
+        self.assertEqual(self.data, "data")
+        self.failIf(self.m.run_once())
+        self.m.cleanup()
+
 for poller_cls in proactors_available:
     for prio_mixin in priorities:
         if poller_cls.supports_multiplex_first:
@@ -0,0 +1,141 @@
+__doc_all__ = []
+
+import unittest
+import threading
+import socket
+import os
+import sys
+import tempfile
+
+from cogen.common import *
+from cogen.core import splice
+from base import priorities, proactors_available
+
+class Splice_MixIn:
+    # more than a pipe's worth
+    DATA = os.urandom(4 * 1024 * 1024)
+    def setUp(self):
+        self.m = Scheduler(default_priority=self.prio, proactor=self.poller,
+                           proactor_resolution=0.01)
+        self.client, client = socket.socketpair()
+        backend, self.backend = socket.socketpair()
+        self.a = sockets.Socket(_sock=client)
+        self.b = sockets.Socket(_sock=backend)
+        self.results = []
+    def tearDown(self):
+        for sock in (self.client, self.backend, self.a, self.b):
+            sock.close()
+    def read_all(self, sock, length=None):
+        received = []
+        while length is None or sum(map(len, received)) < length:
+            data = sock.recv(65536)
+            if not data:
+                break
+            received.append(data)
+        return ''.join(received)
+    def test_splice(self):
+        length = len(self.DATA) - 100
+        def client():
+            self.client.sendall(self.DATA)
+        received = []
+        def backend():
+            received.append(self.read_all(self.backend, length))
+        @coroutine
+        def forward():
+            self.results.append((yield sockets.Splice(self.a, self.b, length)))
+            # the rest is still there
+            self.results.append((yield sockets.RecvAll(self.a, 100)))
+        threads = [threading.Thread(target=client),
+                   threading.Thread(target=backend)]
+        for thread in threads:
+            thread.start()
+        self.m.add(forward)
+        self.m.run()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.results, [length, self.DATA[-100:]])
+        self.assertEqual(received, [self.DATA[:length]])
+    def test_proxy(self):
+        def client():
+            self.client.sendall(self.DATA)
+            self.client.shutdown(socket.SHUT_WR)
+            self.results.append(self.read_all(self.client) == self.DATA[::-1])
+        def backend():
+            self.backend.sendall(self.read_all(self.backend)[::-1])
+            self.backend.shutdown(socket.SHUT_WR)
+        @coroutine
+        def forward():
+            self.results.append((yield sockets.proxy(self.a, self.b)))
+        threads = [threading.Thread(target=client),
+                   threading.Thread(target=backend)]
+        for thread in threads:
+            thread.start()
+        self.m.add(forward)
+        self.m.run()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(self.results),
+                         [True, (len(self.DATA), len(self.DATA))])
+    def test_proxy_reset(self):
+        @coroutine
+        def forward():
+            self.results.append((yield sockets.proxy(self.a, self.b)))
+        self.m.add(forward)
+        self.client.sendall('data')
+        self.backend.close()
+        self.m.run()
+        self.assertEqual(self.results, [(None, 0)])
+    def test_recv_to_file(self):
+        length = len(self.DATA) - 100
+        def client():
+            self.client.sendall(self.DATA)
+        tfile = tempfile.TemporaryFile()
+        tfile.write('head')
+        @coroutine
+        def receive():
+            self.results.append((yield sockets.RecvToFile(self.a, tfile,
+                                                          length)))
+            self.results.append((yield sockets.RecvAll(self.a, 100)))
+        thread = threading.Thread(target=client)
+        thread.start()
+        self.m.add(receive)
+        self.m.run()
+        thread.join()
+        self.assertEqual(self.results, [length, self.DATA[-100:]])
+        tfile.seek(0)
+        self.assert_(tfile.read() == 'head' + self.DATA[:length])
+    def test_recv_to_file_closed(self):
+        @coroutine
+        def receive():
+            try:
+                yield sockets.RecvToFile(self.a, tempfile.TemporaryFile(), 100)
+            except sockets.ConnectionClosed:
+                self.results.append('closed')
+        self.m.add(receive)
+        self.client.sendall('data')
+        self.client.close()
+        self.m.run()
+        self.assertEqual(self.results, ['closed'])
+    def test_fallback(self):
+        available = splice.available
+        splice.available = False
+        try:
+            self.test_proxy()
+            # the proxy half-closed the sockets
+            self.tearDown()
+            self.setUp()
+            self.test_recv_to_file()
+        finally:
+            splice.available = available
+
+for poller_cls in proactors_available:
+    for prio_mixin in priorities:
+        name = 'SpliceTest_%s_%s' % (prio_mixin.__name__, poller_cls.__name__)
+        globals()[name] = type(
+            name, (Splice_MixIn, prio_mixin, unittest.TestCase),
+            {'poller':poller_cls}
+        )
+
+if __name__ == "__main__":
+    sys.argv.insert(1, '-v')
+    unittest.main()
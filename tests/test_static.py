@@ -0,0 +1,194 @@
+__doc_all__ = []
+
+import unittest
+import sys
+import os
+import time
+import shutil
+import tempfile
+
+from cogen.common import *
+from cogen.web import static
+
+from base import priorities, proactors_available
+from base_web import WebTest_Base
+
+class StaticRoot_MixIn:
+    BIG = os.urandom(200000)
+    SMALL = 'small file\n' * 10
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.root, 'dir'))
+        for name, data in (('big.bin', self.BIG), ('small.txt', self.SMALL),
+                           ('dir/index.html', '<html></html>'),
+                           ('other.bin', self.BIG[::-1])):
+            fh = open(os.path.join(self.root, name), 'wb')
+            fh.write(data)
+            fh.close()
+        self.app = static.StaticApp(self.root, ttl=0, max_files=1,
+                                    small_size=1024)
+    def tearDown(self):
+        self.app.clear()
+        shutil.rmtree(self.root)
+
+class Static_MixIn(StaticRoot_MixIn):
+    # sent with the server's sendfile
+    middleware = []
+    def setUp(self):
+        StaticRoot_MixIn.setUp(self)
+        WebTest_Base.setUp(self)
+    def tearDown(self):
+        WebTest_Base.tearDown(self)
+        StaticRoot_MixIn.tearDown(self)
+    def get(self, path, method='GET', **headers):
+        self.conn.request(method, path, headers=headers)
+        resp = self.conn.getresponse()
+        return resp, resp.read()
+    def test_get(self):
+        for path, data, ctype in (('/big.bin', self.BIG, 'application/octet-stream'),
+                                  ('/small.txt', self.SMALL, 'text/plain')):
+            for i in range(2):
+                resp, body = self.get(path)
+                self.assertEqual(resp.status, 200)
+                self.assertEqual(resp.getheader('content-type'), ctype)
+                self.assertEqual(resp.getheader('accept-ranges'), 'bytes')
+                self.assertEqual(len(body), len(data))
+                self.assert_(body == data)
+        self.assertEqual(self.app.stats['hits'], 2)
+        self.assertEqual(self.app.stats['misses'], 2)
+        resp, body = self.get('/big.bin', 'HEAD')
+        self.assertEqual(resp.getheader('content-length'), str(len(self.BIG)))
+        self.assertEqual(body, '')
+    def test_not_found(self):
+        for path in ('/missing', '/../../../../etc/passwd', '/big%00.bin'):
+            resp, body = self.get(path)
+            self.assertEqual(resp.status, 404)
+        resp, body = self.get('/big.bin', 'POST')
+        self.assertEqual(resp.status, 405)
+        self.assertEqual(resp.getheader('allow'), 'GET, HEAD')
+    def test_directory(self):
+        resp, body = self.get('/dir')
+        self.assertEqual(resp.status, 301)
+        self.assert_(resp.getheader('location').endswith('/dir/'))
+        resp, body = self.get('/dir/')
+        self.assertEqual(body, '<html></html>')
+    def test_range(self):
+        for path, data in (('/big.bin', self.BIG), ('/small.txt', self.SMALL)):
+            size = len(data)
+            for value, first, last in (('bytes=10-99', 10, 99),
+                                       ('bytes=-50', size-50, size-1),
+                                       ('bytes=100-', 100, size-1),
+                                       ('bytes=5-%s' % (size*2), 5, size-1)):
+                resp, body = self.get(path, Range=value)
+                self.assertEqual(resp.status, 206)
+                self.assertEqual(resp.getheader('content-range'),
+                                 'bytes %s-%s/%s' % (first, last, size))
+                self.assert_(body == data[first:last+1])
+            resp, body = self.get(path, Range='bytes=%s-' % size)
+            self.assertEqual(resp.status, 416)
+            self.assertEqual(resp.getheader('content-range'), 'bytes */%s' % size)
+            # multiple ranges are ignored
+            resp, body = self.get(path, Range='bytes=0-1,5-6')
+            self.assertEqual(resp.status, 200)
+            self.assertEqual(len(body), size)
+    def test_conditional(self):
+        resp, body = self.get('/big.bin')
+        etag = resp.getheader('etag')
+        last_modified = resp.getheader('last-modified')
+        resp, body = self.get('/big.bin', **{'If-None-Match': '"x", ' + etag})
+        self.assertEqual(resp.status, 304)
+        self.assertEqual(body, '')
+        resp, body = self.get('/big.bin', **{'If-Modified-Since': last_modified})
+        self.assertEqual(resp.status, 304)
+        resp, body = self.get('/big.bin', **{'If-None-Match': '"x"',
+                                             'If-Modified-Since': last_modified})
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(self.app.stats['not_modified'], 2)
+        # a stale If-Range gets the whole file
+        resp, body = self.get('/big.bin', Range='bytes=0-9',
+                              **{'If-Range': '"stale"'})
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(len(body), len(self.BIG))
+        resp, body = self.get('/big.bin', Range='bytes=0-9',
+                              **{'If-Range': etag})
+        self.assertEqual(resp.status, 206)
+    def test_revalidation(self):
+        resp, body = self.get('/big.bin')
+        etag = resp.getheader('etag')
+        path = os.path.join(self.root, 'big.bin')
+        fh = open(path, 'wb')
+        fh.write('changed')
+        fh.close()
+        os.utime(path, (time.time() + 10, time.time() + 10))
+        resp, body = self.get('/big.bin', **{'If-None-Match': etag})
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(body, 'changed')
+        self.assertEqual(self.app.stats['revalidations'], 1)
+    def test_eviction(self):
+        # max_files is 1
+        for path in ('/big.bin', '/other.bin', '/big.bin'):
+            resp, body = self.get(path)
+            self.assertEqual(len(body), len(self.BIG))
+        self.assertEqual(self.app.stats['evictions'], 2)
+        self.assertEqual(self.app.open_files, 1)
+
+class StaticIter_MixIn(Static_MixIn):
+    # the file wrapper is iterated (the validator wraps the response)
+    middleware = WebTest_Base.middleware
+
+for poller_cls in proactors_available:
+    for prio_mixin in priorities:
+        for mixin in (Static_MixIn, StaticIter_MixIn):
+            name = '%sTest_%s_%s' % (mixin.__name__[:-6], prio_mixin.__name__,
+                                     poller_cls.__name__)
+            globals()[name] = type(
+                name,
+                (mixin, WebTest_Base, prio_mixin, unittest.TestCase),
+                {'poller':poller_cls}
+            )
+
+class StaticAppTest(StaticRoot_MixIn, unittest.TestCase):
+    # the app is called directly, no server
+    def test_shared_file(self):
+        # two responses iterated in turns share the cached file object
+        from cogen.web.wsgi import WSGIFileWrapper
+        def start_response(status, headers):
+            pass
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/big.bin',
+                   'wsgi.file_wrapper': WSGIFileWrapper}
+        first = iter(self.app(environ, start_response))
+        environ = dict(environ, HTTP_RANGE='bytes=100-')
+        second = iter(self.app(environ, start_response))
+        bodies = [[], []]
+        for chunks in map(None, first, second):
+            for body, chunk in zip(bodies, chunks):
+                body.append(chunk or '')
+        self.assert_(''.join(bodies[0]) == self.BIG)
+        self.assert_(''.join(bodies[1]) == self.BIG[100:])
+
+    def test_cached_stat(self):
+        # a cached file isn't stat'ed for every request
+        self.app.ttl = 60
+        def start_response(status, headers):
+            self.results.append(status)
+        stats = []
+        stat = os.stat
+        def counting_stat(path):
+            if path.startswith(self.root):
+                stats.append(path)
+            return stat(path)
+        self.results = []
+        os.stat = counting_stat
+        try:
+            for path in ('/small.txt', '/small.txt', '/dir/', '/dir/'):
+                self.app({'REQUEST_METHOD': 'GET', 'PATH_INFO': path},
+                         start_response)
+        finally:
+            os.stat = stat
+        self.assertEqual(self.results, ['200 OK'] * 4)
+        # just the directory
+        self.assertEqual(stats, [os.path.join(self.root, 'dir')] * 2)
+
+if __name__ == "__main__":
+    sys.argv.insert(1, '-v')
+    unittest.main()
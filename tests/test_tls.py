@@ -0,0 +1,190 @@
+__doc_all__ = []
+
+import unittest
+import threading
+import socket
+import ssl
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import httplib
+
+from cogen.common import *
+from cogen.core import tls
+from base import priorities, proactors_available
+from base_web import WebTest_Base
+
+CERTFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'keycert.pem')
+
+def client_context():
+    context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+class TLS_MixIn:
+    # big enough to need a lot of records and partial writes
+    DATA = os.urandom(1024 * 1024)
+    def setUp(self):
+        self.m = Scheduler(default_priority=self.prio, proactor=self.poller,
+                           proactor_resolution=0.01)
+        self.context = tls.server_context(CERTFILE)
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(5)
+        self.address = self.listener.getsockname()
+        self.results = []
+    def tearDown(self):
+        self.listener.close()
+    def test_server(self):
+        def client():
+            sock = client_context().wrap_socket(socket.create_connection(
+                                                            self.address))
+            sock.sendall(self.DATA)
+            received = []
+            while sum(map(len, received)) < len(self.DATA):
+                received.append(sock.recv(65536))
+            self.results.append(''.join(received) == self.DATA)
+            sock.close()
+        @coroutine
+        def server():
+            srv = sockets.Socket(_sock=self.listener)
+            conn, addr = yield srv.accept()
+            conn = tls.SSLSocket(conn, self.context, server_side=True)
+            yield conn.do_handshake()
+            received = 0
+            while received < len(self.DATA):
+                # small reads, the rest stays in the TLS buffers
+                data = yield conn.recv(1000)
+                yield conn.sendall(data)
+                received += len(data)
+            conn.close()
+        thread = threading.Thread(target=client)
+        thread.start()
+        self.m.add(server)
+        self.m.run()
+        thread.join()
+        self.assertEqual(self.results, [True])
+    def test_client(self):
+        def server():
+            conn, addr = self.listener.accept()
+            conn = self.context.wrap_socket(conn, server_side=True)
+            data = conn.recv(100)
+            conn.sendall(data.upper())
+            conn.close()
+        @coroutine
+        def client():
+            sock = yield tls.connect(self.address, client_context())
+            yield sock.sendall('hello')
+            self.results.append((yield sock.recv(100)))
+            sock.close()
+        thread = threading.Thread(target=server)
+        thread.start()
+        self.m.add(client)
+        self.m.run()
+        thread.join()
+        self.assertEqual(self.results, ['HELLO'])
+    def test_handshake_failure(self):
+        def client():
+            conn = socket.create_connection(self.address)
+            conn.sendall('GET / HTTP/1.0\r\n\r\n')
+            conn.close()
+        @coroutine
+        def server():
+            srv = sockets.Socket(_sock=self.listener)
+            conn, addr = yield srv.accept()
+            conn = tls.SSLSocket(conn, self.context, server_side=True)
+            try:
+                yield conn.do_handshake()
+            except ssl.SSLError:
+                self.results.append('failed')
+            conn.close()
+        thread = threading.Thread(target=client)
+        thread.start()
+        self.m.add(server)
+        self.m.run()
+        thread.join()
+        self.assertEqual(self.results, ['failed'])
+
+class HttpsTest_MixIn:
+    middleware = []
+    server_options = {'ssl_context': tls.server_context(CERTFILE),
+                      'max_connections': 10}
+    BODY = os.urandom(256 * 1024)
+    def upload_app(self, environ):
+        tfile = tempfile.TemporaryFile()
+        yield environ['cogen.input'].recv_to_file(
+                        tfile, environ['cogen.wsgi'].content_length)
+        tfile.seek(0)
+        yield str(tfile.read() == self.BODY)
+
+    def app(self, environ, start_response):
+        start_response('200 OK', [('Content-type', 'text/plain')])
+        if environ['PATH_INFO'] == '/upload':
+            # the data is decrypted, no splice
+            return self.upload_app(environ)
+        if environ['PATH_INFO'] == '/file':
+            tfile = tempfile.TemporaryFile()
+            tfile.write(self.BODY)
+            tfile.seek(0)
+            return environ['wsgi.file_wrapper'](tfile, 16384)
+        return [environ['wsgi.url_scheme'], environ['HTTPS']]
+
+    def setUp(self):
+        WebTest_Base.setUp(self)
+        self.conn.close()
+        self.conn = httplib.HTTPSConnection(*self.local_addr,
+                                            **{'context': client_context()})
+
+    def test_keep_alive(self):
+        for i in range(3):
+            self.conn.request('GET', '/')
+            self.assertEqual(self.conn.getresponse().read(), 'httpson')
+            time.sleep(0.1)
+            # the connection waits for the next request in a SSLPark
+            self.assertEqual(len([act for act in self.sched.proactor.tokens
+                                  if isinstance(act, tls.SSLPark)]), 1)
+
+    def test_file_wrapper(self):
+        self.conn.request('GET', '/file')
+        self.assertEqual(self.conn.getresponse().read(), self.BODY)
+
+    def test_upload(self):
+        self.conn.request('POST', '/upload', self.BODY)
+        self.assertEqual(self.conn.getresponse().read(), 'True')
+
+    def test_session_resumption(self):
+        try:
+            client = subprocess.Popen(
+                # s_client doesn't resume tls 1.3 sessions on -reconnect
+                ['openssl', 's_client', '-tls1_2', '-reconnect', '-connect',
+                 '%s:%s' % self.local_addr],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT
+            )
+        except OSError:
+            return # no openssl binary
+        output = client.communicate('')[0]
+        self.assert_('Reused' in output, output)
+        stats = self.wsgi_server.ssl_context.session_stats()
+        self.assert_(stats['hits'] > 0, stats)
+
+for poller_cls in proactors_available:
+    for prio_mixin in priorities:
+        name = 'TLSTest_%s_%s' % (prio_mixin.__name__, poller_cls.__name__)
+        globals()[name] = type(
+            name, (TLS_MixIn, prio_mixin, unittest.TestCase),
+            {'poller':poller_cls}
+        )
+        name = 'HttpsTest_%s_%s' % (prio_mixin.__name__, poller_cls.__name__)
+        globals()[name] = type(
+            name,
+            (HttpsTest_MixIn, WebTest_Base, prio_mixin, unittest.TestCase),
+            {'poller':poller_cls}
+        )
+
+if __name__ == "__main__":
+    sys.argv.insert(1, '-v')
+    unittest.main()
@@ -0,0 +1,83 @@
+__doc_all__ = []
+
+import unittest
+import socket
+import sys
+
+from cogen.common import *
+from cogen.core import mmsg
+from base import priorities, proactors_available
+
+class UDP_MixIn:
+    COUNT = 200
+    def setUp(self):
+        self.m = Scheduler(default_priority=self.prio, proactor=self.poller,
+                           proactor_resolution=0.01)
+        self.sock = sockets.Socket(type=socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.address = self.sock.getsockname()
+        self.peer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.peer.bind(('127.0.0.1', 0))
+        self.peer.settimeout(5)
+        self.results = []
+    def tearDown(self):
+        self.sock.close()
+        self.peer.close()
+    def test_recvfrom_sendto(self):
+        @coroutine
+        def server():
+            data, address = yield self.sock.recvfrom(100)
+            yield self.sock.sendto(data.upper(), address)
+        self.m.add(server)
+        self.peer.sendto('ping', self.address)
+        self.m.run()
+        self.assertEqual(self.peer.recvfrom(100),
+                         ('PING', self.address))
+    def test_recvmany(self):
+        for i in range(self.COUNT):
+            self.peer.sendto(str(i), self.address)
+        @coroutine
+        def server():
+            received = []
+            while len(received) < self.COUNT:
+                batch = yield self.sock.recvmany(64)
+                self.results.append(len(batch))
+                received.extend(batch)
+            self.assertEqual(received, [(str(i), self.peer.getsockname())
+                                        for i in range(self.COUNT)])
+        self.m.add(server)
+        self.m.run()
+        # all the datagrams were waiting so the batches are full
+        self.assertEqual(self.results, [64, 64, 64, 8])
+    def test_sendmany(self):
+        peer = self.peer.getsockname()
+        @coroutine
+        def client():
+            self.results.append((yield self.sock.sendmany(
+                (str(i), peer) for i in range(self.COUNT))))
+        self.m.add(client)
+        self.m.run()
+        self.assertEqual(self.results, [self.COUNT])
+        self.assertEqual([self.peer.recvfrom(100) for i in range(self.COUNT)],
+                         [(str(i), self.address) for i in range(self.COUNT)])
+    def test_fallback(self):
+        available = mmsg.available
+        mmsg.available = False
+        try:
+            self.test_sendmany()
+            del self.results[:]
+            self.test_recvmany()
+        finally:
+            mmsg.available = available
+
+for poller_cls in proactors_available:
+    for prio_mixin in priorities:
+        name = 'UDPTest_%s_%s' % (prio_mixin.__name__, poller_cls.__name__)
+        globals()[name] = type(
+            name, (UDP_MixIn, prio_mixin, unittest.TestCase),
+            {'poller':poller_cls}
+        )
+
+if __name__ == "__main__":
+    sys.argv.insert(1, '-v')
+    unittest.main()
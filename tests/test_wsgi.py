@@ -12,6 +12,8 @@ import httplib
 import os
 import tempfile
 import socket
+import errno
+import gc
 from cStringIO import StringIO
 
 from cogen.common import *
@@ -79,7 +81,15 @@ class InputTest_MixIn:
             recvdata = resp.read()
             self.assertEqual(recvdata, data)
             
-        
+class SpoolInputTest_MixIn(InputTest_MixIn):
+    middleware = [wsgiref.validate.validator,
+                  lambda app: async.sync_input(app, spool_size=1000)]
+
+    def test_spooled(self):
+        # bigger than the spool_size, goes in a temporary file
+        data = self.make_str(4, 1024*1024, chunked=False)
+        self.conn.request('GET', '/', data, {"Content-Length": str(len(data))})
+        self.assertEqual(self.conn.getresponse().read(), data)
         
 class AsyncInputTest_MixIn:
     middleware = []
@@ -121,6 +131,15 @@ class AsyncInputTest_MixIn:
                 remaining -= len(result)
         self.result = buff.getvalue()
         yield 'readline'
+    def file_app(self, environ, start_response):
+        tfile = tempfile.TemporaryFile()
+        content_length = environ['cogen.wsgi'].content_length
+        # the headers were read in a buffer with some of the body
+        yield environ['cogen.input'].recv_to_file(tfile, content_length)
+        self.written = environ['cogen.wsgi'].result
+        tfile.seek(0)
+        self.result = tfile.read()
+        yield 'file'
         
     def app(self, environ, start_response):
         start_response('200 OK', [('Content-type','text/html')])
@@ -129,6 +148,8 @@ class AsyncInputTest_MixIn:
             return self.read_app(environ, start_response)
         elif environ["PATH_INFO"] == '/readline':
             return self.readline_app(environ, start_response)
+        elif environ["PATH_INFO"] == '/file':
+            return self.file_app(environ, start_response)
         else:
             raise Exception('Unknown path_info')
     def make_str(self, pieces, psize=1024*1024, psep='', chunked=True):
@@ -163,6 +184,12 @@ class AsyncInputTest_MixIn:
         self.assertEqual(self.overflow, None)
         self.assertEqual(self.result, data)
         self.assertEqual(recvdata, 'readline')
+    def test_recv_to_file(self):
+        data = self.make_str(3, 1024*1024, chunked=False)
+        self.conn.request('GET', '/file', data, {"Content-Length": str(len(data))})
+        self.assertEqual(self.conn.getresponse().read(), 'file')
+        self.assertEqual(self.written, len(data))
+        self.assert_(self.result == data)
 
 class FileWrapperTest_MixIn:
     CKSIZE = 300
@@ -249,6 +276,156 @@ class FileWrapperTest_MixIn:
             else:
                 self.failIf("Connection not closed!")
         
+class AdmissionTest_MixIn:
+    middleware = []
+    server_options = {'max_connections': 2, 'max_requests': 1,
+                      'max_lag': 0.2, 'lag_interval': 0.05}
+    def app(self, environ, start_response):
+        start_response('200 OK', [('Content-type','text/plain')])
+        if environ['PATH_INFO'] == '/slow':
+            yield environ['cogen.core'].events.Sleep(0.5)
+        elif environ['PATH_INFO'] == '/block':
+            time.sleep(0.5)
+        yield 'done'
+
+    def test_max_requests(self):
+        self.conn.request('GET', '/slow')
+        time.sleep(0.1)
+        conn = httplib.HTTPConnection(*self.local_addr)
+        conn.request('GET', '/')
+        resp = conn.getresponse()
+        self.assertEqual(resp.status, 503)
+        resp.read()
+        conn.close()
+        resp = self.conn.getresponse()
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(resp.read(), 'done')
+        time.sleep(0.1)
+        self.assertEqual(self.wsgi_server.stats['shed_requests'], 1)
+        self.assertEqual(self.wsgi_server.requests, 0)
+
+    def test_max_lag(self):
+        self.conn.request('GET', '/block')
+        self.assertEqual(self.conn.getresponse().read(), 'done')
+        self.conn.close()
+        self.conn = httplib.HTTPConnection(*self.local_addr)
+        self.conn.request('GET', '/')
+        self.assertEqual(self.conn.getresponse().status, 503)
+        self.assert_(self.wsgi_server.lag > 0.2, self.wsgi_server.lag)
+        time.sleep(0.5)
+        self.conn = httplib.HTTPConnection(*self.local_addr)
+        self.conn.request('GET', '/')
+        self.assertEqual(self.conn.getresponse().read(), 'done')
+
+    def test_max_connections(self):
+        conn = httplib.HTTPConnection(*self.local_addr)
+        conn.connect()
+        time.sleep(0.1)
+        extra = socket.create_connection(self.local_addr)
+        extra.settimeout(0.5)
+        extra.sendall('GET / HTTP/1.0\r\n\r\n')
+        self.assertRaises(socket.timeout, extra.recv, 100)
+        self.assert_(self.wsgi_server.stats['accept_pauses'] > 0)
+        conn.close()
+        extra.settimeout(5)
+        self.assert_(extra.recv(100).startswith('HTTP/1.1 200'))
+        extra.close()
+
+    def test_max_connections_error(self):
+        server = self.wsgi_server
+        class FailingConnection(wsgi.WSGIConnection):
+            __slots__ = ()
+            @coroutine
+            def run(self, wakeup=None):
+                del server.ConnectionClass
+                raise socket.error(errno.ECONNRESET, "reset")
+        time.sleep(0.1)
+        self.assertEqual(server.connections, 1)
+        server.ConnectionClass = FailingConnection
+        failing = socket.create_connection(self.local_addr)
+        time.sleep(0.1)
+        self.assertEqual(server.connections, 1)
+        # the acceptor was resumed while `self.conn` is still open
+        extra = socket.create_connection(self.local_addr)
+        extra.settimeout(2)
+        extra.sendall('GET / HTTP/1.0\r\n\r\n')
+        self.assert_(extra.recv(100).startswith('HTTP/1.1 200'))
+        extra.close()
+        failing.close()
+
+class ParkTest_MixIn:
+    middleware = []
+    server_options = {'max_connections': 10}
+    def app(self, environ, start_response):
+        start_response('200 OK', [('Content-type','text/plain'),
+                                  ('Content-Length', '4')])
+        return ['done']
+
+    def parked(self):
+        return [act for act in self.sched.proactor.tokens
+                    if isinstance(act, sockets.Park)]
+
+    def test_park_idle(self):
+        for i in range(3):
+            time.sleep(0.1)
+            self.assertEqual(len(self.parked()), 1)
+            self.assertEqual(self.wsgi_server.connections, 1)
+            self.conn.request('GET', '/')
+            self.assertEqual(self.conn.getresponse().read(), 'done')
+        self.conn.close()
+        time.sleep(0.1)
+        self.assertEqual(self.parked(), [])
+        self.assertEqual(self.wsgi_server.connections, 0)
+
+    def test_park_many(self):
+        # the parked connections wake up in the same proactor run
+        for i in range(3):
+            socks = [socket.create_connection(self.local_addr)
+                     for j in range(8)]
+            time.sleep(0.1)
+            self.assertEqual(len(self.parked()), 9)
+            for sock in socks:
+                sock.sendall('GET / HTTP/1.0\r\n\r\n')
+            for sock in socks:
+                sock.settimeout(5)
+                self.assert_(sock.recv(100).startswith('HTTP/1.1 200'))
+                sock.close()
+            time.sleep(0.1)
+
+class LeakTest_MixIn:
+    middleware = []
+    def app(self, environ, start_response):
+        start_response('200 OK', [('Content-type','text/plain')])
+        if environ['PATH_INFO'] == '/timeout':
+            yield environ['cogen.core'].events.WaitForSignal('x', timeout=0.01)
+            yield environ['cogen.wsgi'].exception[0].__name__
+        else:
+            yield 'done'
+
+    def setUp(self):
+        gc.disable()
+        gc.collect()
+        WebTest_Base.setUp(self)
+
+    def tearDown(self):
+        WebTest_Base.tearDown(self)
+        gc.set_debug(0)
+        del gc.garbage[:]
+        gc.enable()
+
+    def test_refcount_freeing(self):
+        for path, body in [('/', 'done'), ('/timeout', 'OperationTimeout')]:
+            conn = httplib.HTTPConnection(*self.local_addr)
+            conn.request('GET', path, headers={'Connection': 'close'})
+            self.assertEqual(conn.getresponse().read(), body)
+            conn.close()
+        time.sleep(0.2)
+        gc.set_debug(gc.DEBUG_SAVEALL)
+        gc.collect()
+        leaked = [obj for obj in gc.garbage
+                    if type(obj).__module__.startswith('cogen')]
+        self.assertEqual(leaked, [])
+
 import cogen
 #~ for poller_cls in [cogen.core.proactors.has_select()]:#proactors_available:
 for poller_cls in proactors_available:
@@ -280,6 +457,13 @@ for poller_cls in proactors_available:
             {'poller':poller_cls}
         )
         
+        name = 'SpoolInputTest_%s_%s' % (prio_mixin.__name__, poller_cls.__name__)
+        globals()[name] = type(
+            name, 
+            (SpoolInputTest_MixIn, WebTest_Base, prio_mixin, unittest.TestCase),
+            {'poller':poller_cls}
+        )
+        
         name = 'AsyncInputTest_%s_%s' % (prio_mixin.__name__, poller_cls.__name__)
         globals()[name] = type(
             name, 
@@ -287,6 +471,27 @@ for poller_cls in proactors_available:
             {'poller':poller_cls}
         )
 
+        name = 'AdmissionTest_%s_%s' % (prio_mixin.__name__, poller_cls.__name__)
+        globals()[name] = type(
+            name,
+            (AdmissionTest_MixIn, WebTest_Base, prio_mixin, unittest.TestCase),
+            {'poller':poller_cls}
+        )
+
+        name = 'ParkTest_%s_%s' % (prio_mixin.__name__, poller_cls.__name__)
+        globals()[name] = type(
+            name,
+            (ParkTest_MixIn, WebTest_Base, prio_mixin, unittest.TestCase),
+            {'poller':poller_cls}
+        )
+
+        name = 'LeakTest_%s_%s' % (prio_mixin.__name__, poller_cls.__name__)
+        globals()[name] = type(
+            name,
+            (LeakTest_MixIn, WebTest_Base, prio_mixin, unittest.TestCase),
+            {'poller':poller_cls}
+        )
+
 if __name__ == "__main__":
     sys.argv.insert(1, '-v')
     unittest.main()